@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Median time and number of model evaluations per event of fitting gNDF and Adept to synthetic events.
+
+Compares the closed-form models with an analytic Jacobian against the same fit with a
+finite difference Jacobian, and against the scipy.stats.gennorm / np.heaviside models.
+
+    python benchmarks/fitting_functions.py
+"""
+import os
+import sys
+import time
+import warnings
+import numpy as np
+from scipy.optimize import curve_fit
+from scipy.stats import gennorm
+
+# holeypy from this checkout, whatever the working directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from holeypy.analysis.fitting_functions import gNDF, Adept
+
+
+def gennorm_model(x, a, x0, sigma, b, c):
+    pdf = np.array(gennorm.pdf(x, b, loc=x0, scale=sigma))
+    max_pdf = gennorm.pdf(x0, b, loc=x0, scale=sigma)
+    return a * (pdf / max_pdf) + c
+
+
+def heaviside_model(t, I0, a, mu_1, mu_2, tau):
+    rise_capacitance = (np.exp(-(t - mu_2) / tau) - 1)
+    fall_capacitance = (1 - np.exp(-(t - mu_1) / tau))
+    rise_capacitance[abs(rise_capacitance) == np.inf] = 0
+    fall_capacitance[abs(fall_capacitance) == np.inf] = 0
+    rise = rise_capacitance * np.heaviside(t - mu_2, 1)
+    fall = fall_capacitance * np.heaviside(t - mu_1, 1)
+    return I0 + a * (rise + fall)
+
+
+def make_events(n_events=200, sampling_period=1e-5, seed=0):
+    """Events of 30 to 200 data points with 2 pA noise, in windows of three times their length"""
+    rng = np.random.default_rng(seed)
+    events = []
+    for length in rng.integers(30, 200, n_events):
+        y = 100 + 2 * rng.standard_normal(3 * length)
+        y[length:2 * length] -= 60
+        x = np.arange(3 * length) * sampling_period
+        guess = dict(I0=100, I1=40, start=length * sampling_period, end=2 * length * sampling_period)
+        events.append((x, y, guess))
+    return events
+
+
+def time_fits(model, jac, events, initial_guess):
+    """Time and number of model (and jacobian) evaluations per fit, and the number of failed fits"""
+    times, evaluations, failed = [], [], 0
+    for x, y, guess in events:
+        start = time.perf_counter()
+        try:
+            _, _, info, _, _ = curve_fit(model, x, -1 * abs(y), p0=initial_guess(x, y, **guess), jac=jac,
+                                         maxfev=1000, full_output=True)
+            evaluations.append(info['nfev'] + info.get('njev', 0))
+        except RuntimeError:
+            failed += 1
+        times.append(time.perf_counter() - start)
+    return np.median(times), np.median(evaluations), failed
+
+
+def main() -> None:
+    events = make_events()
+    for func, reference in ((gNDF(), gennorm_model), (Adept(), heaviside_model)):
+        model = func.gNDF if isinstance(func, gNDF) else func.adept2state
+        runs = (('reference model, numerical jacobian', reference, None),
+                ('closed form, numerical jacobian', model, None),
+                ('closed form, analytic jacobian', model, func.jacobian))
+        for name, f, jac in runs:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                per_event, evaluations, failed = time_fits(f, jac, events, func.initial_guess)
+            print('%-6s %-38s %8.3f ms/event %6d evaluations (%d failed)'
+                  % (func.name, name, per_event * 1e3, evaluations, failed))
+
+
+if __name__ == '__main__':
+    main()
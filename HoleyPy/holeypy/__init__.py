@@ -1,2 +1,5 @@
 # -*- coding: utf-8 -*-
 from .trace import Trace
+from .timeaxis import TimeAxis
+
+__all__ = ['Trace', 'TimeAxis']
@@ -1,4 +1,6 @@
 from .events import Events
 from .levels import Levels
 from .features import Features
-from .fitting_functions import gNDF
\ No newline at end of file
+from .multilevel import MultiLevel
+from .fitting_functions import gNDF
+__all__ = ['Events', 'Levels', 'Features', 'MultiLevel', 'gNDF']
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Rolling robust baseline and noise of a drifting signal, for adaptive threshold detection
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def _rolling_median(values, window) -> np.ndarray:
+    """Centred running median over window elements, ignoring NaN (as np.nanmedian)"""
+    half = window // 2
+    padded = np.concatenate((np.full(half, np.nan), values, np.full(half, np.nan)))
+    # NaN is sorted last, so the median of the n valid values of a row is at (n - 1) // 2 and n // 2
+    rows = np.sort(sliding_window_view(padded, 2 * half + 1), axis=1)
+    n = np.sum(~np.isnan(rows), axis=1)
+    index = np.arange(len(rows))
+    with np.errstate(invalid='ignore'):
+        median = (rows[index, np.maximum(n - 1, 0) // 2] + rows[index, n // 2]) / 2
+    median[n == 0] = np.nan
+    return median
+
+
+class RollingBaseline:
+    """
+    Baseline (open pore current) and noise of a signal that may drift, as running median and
+    median absolute deviation (MAD).
+
+    The signal is divided in blocks of block_size data points, of which the median and MAD are
+    determined. The baseline and noise of a block are the running medians of those of the
+    window blocks around it, so events (or a short drop of the baseline) shorter than half
+    the window are ignored. This is O(n), and only the statistics of the blocks are kept, so
+    the signal can be added in chunks (e.g. from a memmap)::
+
+        baseline = RollingBaseline(block_size=1000, window=25, sigma=3)
+        for chunk in iter_chunks(signal, t0=t0, t1=t1):
+            baseline.add(chunk)
+        center, threshold = baseline.levels(0, 1000)
+
+    Parameters
+    ----------
+    block_size : int
+        Number of data points per block
+    window : int
+        Number of blocks in the running median, the baseline follows drift slower than
+        window * block_size data points
+    sigma : float
+        The number of sigma (multiplier), that the threshold is set from the baseline
+    """
+    def __init__(self, block_size=1000, window=25, sigma=3):
+        self.block_size = max(1, int(block_size))
+        self.window = max(1, int(window))
+        self.sigma = sigma
+        self._median, self._mad = [], []
+        self._tail = np.zeros(0)
+        self._baseline = None
+        self._noise = None
+
+    def __len__(self):
+        """Number of data points added"""
+        return sum(len(m) for m in self._median) * self.block_size + len(self._tail)
+
+    def add(self, chunk) -> None:
+        """Add the next chunk of the signal"""
+        values = np.concatenate((self._tail, np.asarray(chunk, dtype=np.float64)))
+        n = len(values) // self.block_size * self.block_size
+        if n:
+            self._add_blocks(values[:n].reshape(-1, self.block_size))
+        self._tail = values[n:]
+        self._baseline = None
+
+    def _add_blocks(self, blocks) -> None:
+        median = np.median(blocks, axis=1)
+        self._median.append(median)
+        self._mad.append(np.median(np.abs(blocks - median[:, None]), axis=1) * 1.4826)
+
+    def _update(self) -> None:
+        median, mad = self._median, self._mad
+        if len(self._tail):
+            # The last (incomplete) block
+            self._add_blocks(self._tail[None, :])
+            median, mad = self._median, self._mad
+            self._median, self._mad = median[:-1], mad[:-1]
+        median = np.concatenate(median) if median else np.zeros(0)
+        mad = np.concatenate(mad) if mad else np.zeros(0)
+        self._baseline = _rolling_median(median, self.window)
+        self._noise = _rolling_median(mad, self.window)
+
+        # Blocks without any valid data in their window get the overall values
+        self._center = np.nanmedian(self._baseline) if np.any(np.isfinite(self._baseline)) else 0.0
+        self._baseline[np.isnan(self._baseline)] = self._center
+        self._noise[np.isnan(self._noise)] = np.nanmedian(self._noise) if np.any(np.isfinite(self._noise)) else 0.0
+
+    @property
+    def center(self) -> float:
+        """Median baseline of the whole signal"""
+        if self._baseline is None:
+            self._update()
+        return self._center
+
+    def levels(self, start, stop) -> tuple:
+        """Baseline and threshold of the data points start to stop of the signal.
+
+        Returns
+        -------
+        tuple
+            (center, threshold) arrays, a data point is part of an event when
+            abs(signal) < threshold, like abs(l0) - abs(l1) of fixed levels
+        """
+        if self._baseline is None:
+            self._update()
+        if len(self._baseline) == 0:
+            return np.zeros(stop - start), np.zeros(stop - start)
+        block = np.minimum(np.arange(start, stop) // self.block_size, len(self._baseline) - 1)
+        center = self._baseline[block]
+        return center, np.abs(center) - self.sigma * self._noise[block]
@@ -1,22 +1,30 @@
 # -*- coding: utf-8 -*-
 import multiprocessing
-from itertools import repeat
+from multiprocessing import shared_memory
 from .base import AnalysisBase
-from .levels import Levels
-from .fitting_functions import (gNDF)
+from .levels import Levels, get_levels
+from .fitting_functions import (gNDF, Adept)
+from .fitting import fit_windows, fit_batch
+from .baseline import RollingBaseline
+from .threshold import ThresholdEvents, ThresholdDetector, DetectionCache, concatenate_events, iter_chunks
 import numpy as np
-from scipy.optimize import curve_fit
 import warnings
 from .sql_database import SQL_database
+from resultsql.schema import typed_fields
+from .npz_database import NPZ_database
 import os
 import time
 
 def threshold_search(signal: np.ndarray, sampling_period: float, levels: tuple,
-                     dwell_time=0, skip=2, trace=0, t0=0, t1=-1, database=None) -> tuple:
+                     dwell_time=0, skip=2, trace=0, t0=0, t1=-1, database=None, cache=None,
+                     baseline=None) -> ThresholdEvents:
     """Event detection algorithm using threshold.
     
     This function uses a defined set of cut-off parameters (levels) to determine event locations.
     It utilizes a threshold for shot noise, to prevent preliminary decisions.
+    All statistics are computed at once for all events (see segment_statistics), the result is
+    a struct of arrays with one entry per event. See threshold_search_stream for signals that
+    do not fit in memory.
     
     Parameters
     ----------
@@ -39,181 +47,441 @@ def threshold_search(signal: np.ndarray, sampling_period: float, levels: tuple,
         The first datapoint to be analysed in the trace.
     t1 : int
         The last datapoint to be analysed in the trace
+    database : SQL_database
+        Database to store the results
+    cache : DetectionCache
+        Intermediate results of previous detections of the same trimmed trace (see Trace.cache)
+    baseline : RollingBaseline
+        Follow a drifting baseline instead of the fixed levels. An empty RollingBaseline is
+        first filled with the trimmed signal
     
     Returns
     -------
-    tuple
-        A tuple containing (in order), the baseline events, signal events, baseline events start, basline events end, signal events start and signal events end.
+    ThresholdEvents
+        Named tuple of the baseline (level_0) and event (level_1) statistics, residual current,
+        its variance, dwell time and the event windows used for fitting.
         All start and ends are returned as position of the datapoint in the trace.
         
     """
-    # Expand variables
-    l0, l1 = levels
-
     # Trim the current trace
     trace_length = len(signal[trace])
-    signal = signal[trace][t0:min(trace_length, t1)]
-
-    # All data points above the threshold
-    a = np.where(abs(np.array(signal)) < (abs(l0) - abs(l1)))[0]
-
-    # Get all event starts (e.g. where two data points are maximum 'skip' apart), relative to vector a
-    # Also, we need to append the last data point of the series
-    level_1_end_index_a = np.where(np.diff(a) > skip)[0]
-    level_1_end_index_a = np.append(level_1_end_index_a, len(a)-1)
-
-    # We know that all data in vector a is above the baseline, and we know where each block ends
-    # The start of these blocks are one index before the end (except the last index)
-    # Instead, the first index should be 0
-    level_1_start_index_a = np.delete(np.insert(level_1_end_index_a + 1, 0, 0), -1, 0)
-
-    # While the dwell time suggests that also spikes can be seen, at least 2 data points are required to be an event
-    n_filter = max(2, int(dwell_time / float(sampling_period)))
-
-    # Only keep those events that are at least 2 or n_filter data points long
-    idx = np.where(level_1_end_index_a - level_1_start_index_a > n_filter)[0]
-
-    # The vector a contains the indices of the signal that are above the threshold
-    # The level_1_end_index_a and level_1_start_index_a contain the indices in vector a
-    # Which we consider to end or start the block. We also defined idx as the indices where
-    # The difference between beginning and end are long enough to count as events.
-    # We combine these factors to get the indices (in the signal) that correspond to the beginning
-    # and end of the level 1 events.
-    level_1_start = a[level_1_start_index_a[idx]]
-    level_1_end = a[level_1_end_index_a[idx]]
-
-    # We know that whenever level 1 starts, level 0 just ended one data point ahead.
-    # We also know that whenever level 1 ends, level 0 starts one data point after.
-    level_0_start = np.delete(np.insert(level_1_end + 1, 0, 0), -1, 0)
-    level_0_end = level_1_start - 1
-
-    # Simply insert the times from level_0 and level_1 to get the trace data
-    # Also, the type must be object as we have an n-dimensional array of multiple sizes
-    level_0 = np.array([signal[i:j] for i, j in zip(level_0_start, level_0_end)], dtype=object)
-    level_1 = np.array([signal[i:j] for i, j in zip(level_1_start, level_1_end)], dtype=object)
-
-    # remove potential nans
-    nan_idx = [any([not np.isnan(np.median(i)), not np.isnan(np.median(i))]) for i, j in zip(level_0, level_1)]
-    level_1 = level_1[nan_idx]
-    level_1 = level_1[nan_idx]
-
-    # Here we add the cut-off t0
-    level_0_start = np.array([i+t0 for i in level_0_start])[nan_idx]
-    level_0_end = np.array([i + t0 for i in level_0_end])[nan_idx]
-    level_1_start = np.array([i + t0 for i in level_1_start])[nan_idx]
-    level_1_end = np.array([i + t0 for i in level_1_end])[nan_idx]
-
-    # Calculate the mean current and standard deviation of baseline events (level 0)
-    level_0_mean = np.array([np.mean(i) for i in level_0])
-    level_0_sd = np.array([np.std(i) for i in level_0])
-
-    # Calculate the mean current and standard deviation of events (level 1)
-    level_1_mean = np.array([np.mean(i) for i in level_1])
-    level_1_sd = np.array([np.std(i) for i in level_1])
-
-    # Calculate the excluded current, variance and dwell time (in seconds)
-    residual_current = level_1_mean / level_0_mean
-    excluded_current = (1 - residual_current)
-    residual_current_sd_2 = ((level_1_mean / level_0_mean) ** 2) * (
-                ((level_1_sd ** 2) / (level_1_mean ** 2)) + ((level_0_sd ** 2) / (level_0_mean ** 2)))
-    dwell_time = np.array([len(i) * sampling_period for i in level_1])
-
-    events = []
-    for start, end in zip(level_1_start, level_1_end):
-        approx_event_length = (end-start)
-        events.append([max(0, start - approx_event_length), min(len(signal), end + approx_event_length)])
+    signal = np.asarray(signal[trace][t0:min(trace_length, t1)])
+
+    if baseline is not None and len(baseline) == 0:
+        baseline.add(signal)
+
+    # The whole trace is a single chunk
+    detector = ThresholdDetector(sampling_period, levels, dwell_time=dwell_time, skip=skip, trace=trace, t0=t0,
+                                 cache=cache, baseline=baseline)
+    result = concatenate_events([detector.feed(signal), detector.close()], trace)
 
     if database:
-        table_name = 'results'
-        fields = ['Method', 'Trace', 'Level_0_median', 'Level_1_median', 'Level_0_start', 'Level_0_end', 'Level_1_start', 'Level_1_end', 'Ires', 'Ires_SD', 'Dwell_time', 'Event_index']
-        result = database.add_table(table_name=table_name, fields=' float(53),'.join(fields) + ' float(53)')
-        database.drop_trace(table_name=table_name, trace=trace)
-        query_data = []
-        for l0, l1, l0_start, l0_end, l1_start, l1_end, Ires, IresSD, dwt, event in zip(level_0, level_1, level_0_start, level_0_end, level_1_start, level_1_end, residual_current, residual_current_sd_2, dwell_time, events):
-            query_data.append(['Threshold', trace, str(np.median(l0)),
-                               str(np.median(l1)), str(l0_start*sampling_period),
-                               str(l0_end*sampling_period),
-                               str(l1_start*sampling_period),
-                               str(l1_end*sampling_period),
-                               Ires, IresSD, dwt, ';'.join(str(v) for v in event)])
-        result = database.add_samples(table_name, fields, query_data)
+        _add_threshold_table(database, trace)
+        _add_threshold_samples(database, result, sampling_period)
     print('Done')
     # Return the level information
-    return level_0, level_1, level_0_start, level_0_end, level_1_start, level_1_end
+    return result
+
+
+def threshold_search_stream(chunks, sampling_period: float, levels: tuple,
+                            dwell_time=0, skip=2, trace=0, t0=0, database=None, cache=None, baseline=None):
+    """Event detection using threshold, on a signal that is fed in chunks.
+
+    Yields the same events as threshold_search, as soon as they are complete, so recordings that
+    do not fit in memory can be analysed from a memmap or a loader generator (see iter_chunks)::
+
+        chunks = iter_chunks(signal[trace], chunk_size=2**20, t0=t0, t1=t1)
+        result = concatenate_events(threshold_search_stream(chunks, sampling_period, levels, t0=t0))
+
+    Parameters
+    ----------
+    chunks : iterable
+        Consecutive parts of the trimmed signal of a single trace
+    sampling_period : float
+        The sampling_frequency is used in combination with the dwelltime argument exclude short events.
+    levels : tuple
+        The levels determine the center of the baseline and it's minimal threshold.
+        levels = ( center, threshold ).
+    dwell_time : float
+        The minimal event length event should have to be included.
+    skip : int
+        The skip parameter will exclude a number of events between events as shotnoise, and combines them into a single event.
+    trace : int
+        The trace that is analysed, stored with the results
+    t0 : int
+        The position of the first chunk in the trace.
+    database : SQL_database
+        The events are added to the results table as they are found
+    cache : DetectionCache
+        Intermediate results of previous detections of the same trimmed trace (see Trace.cache)
+    baseline : RollingBaseline
+        Follow a drifting baseline instead of the fixed levels, it should already contain all
+        chunks (a first pass over the signal)
+
+    Yields
+    ------
+    ThresholdEvents
+        The events completed by each chunk, and finally the remaining events
+    """
+    if database:
+        _add_threshold_table(database, trace)
+    detector = ThresholdDetector(sampling_period, levels, dwell_time=dwell_time, skip=skip, trace=trace, t0=t0,
+                                 cache=cache, baseline=baseline)
+    for chunk in chunks:
+        result = detector.feed(chunk)
+        if database:
+            _add_threshold_samples(database, result, sampling_period)
+        yield result
+    result = detector.close()
+    if database:
+        _add_threshold_samples(database, result, sampling_period)
+    print('Done')
+    yield result
+
+
+_threshold_fields = ['Method', 'Trace', 'Level_0_median', 'Level_1_median', 'Level_0_start', 'Level_0_end',
+                     'Level_1_start', 'Level_1_end', 'Ires', 'Ires_SD', 'Dwell_time', 'Event_index']
+
+
+def _add_threshold_table(database, trace):
+    table_name = 'results'
+    database.add_table(table_name=table_name, fields=typed_fields(_threshold_fields))
+    database.drop_trace(table_name=table_name, trace=trace)
+
 
+def _add_threshold_samples(database, result, sampling_period):
+    if len(result.dwell_time) == 0:
+        return
+    level_0, level_1 = result.level_0, result.level_1
+    if isinstance(database, NPZ_database):
+        # A column of int64 (start, end) pairs, which is loaded as is by _get_event_windows
+        event_index = np.stack((result.event_start, result.event_end), axis=1)
+    else:
+        event_index = ['%d;%d' % window for window in zip(result.event_start.tolist(), result.event_end.tolist())]
+    database.add_columns('results', _threshold_fields,
+                         ['Threshold', result.trace, level_0.median, level_1.median,
+                          level_0.start * sampling_period, level_0.end * sampling_period,
+                          level_1.start * sampling_period, level_1.end * sampling_period,
+                          result.residual_current, result.residual_current_sd_2, result.dwell_time, event_index])
 
-def fit_events(trace, sampling_period, database, class_function=gNDF):
+
+def _fit_fields(class_function) -> list:
+    return ['Method', 'Trace', 'Function', 'Fitting_parameters'] + list(class_function().features())
+
+
+def _fit_windows(signal, trace_index, windows, guesses, sampling_period, class_function=gNDF, processes=1,
+                 batch=False) -> list:
+    """Fit class_function to the event windows (start, end) of a single trace.
+
+    With batch all windows are fitted at once by fit_batch when the fitting function allows it
+    (its batch_fit), otherwise one by one by fit_windows.
+    Returns the rows for the results table of the fitting function.
+    """
+    if batch and getattr(class_function, 'batch_fit', False):
+        fits = fit_batch(signal, windows, sampling_period, class_function=class_function, guesses=guesses)
+    else:
+        fits = (func for _, func in fit_windows(signal, windows, sampling_period, class_function=class_function,
+                                                guesses=guesses, processes=processes))
+    query_data = []
+    for func in fits:
+        if func is not None:
+            query_data.append(['Fit', trace_index, func.name, '(' + ','.join(str(v) for v in func.popt) + ')'] + list(func.features().values()))
+    return query_data
+
+
+def _get_event_windows(database, traces=None) -> dict:
+    """Event windows and initial guesses (see fit_windows) of the threshold results, per trace.
+
+    Only the given traces are loaded (by index in SQL_database, by part in NPZ_database), as whole
+    columns; the 'start;end' windows of SQL_database are split at once.
+    """
+    events = database.get_columns('results', ['Trace', 'Event_index', 'Level_0_median', 'Level_1_median',
+                                              'Level_1_start', 'Level_1_end'], traces=traces)
+    event_index = events['Event_index']
+    if event_index.ndim == 1:
+        event_index = np.array([index.split(';') for index in event_index.tolist()], dtype=np.int64).reshape(-1, 2)
+    trace = events['Trace'].astype(np.int64)
+
+    windows = {}
+    for trace_index in np.unique(trace).tolist():
+        idx = np.where(trace == trace_index)[0]
+        guesses = [dict(I0=I0, I1=I1, start=start, end=end) for I0, I1, start, end in
+                   zip(*(events[field][idx].tolist()
+                         for field in ('Level_0_median', 'Level_1_median', 'Level_1_start', 'Level_1_end')))]
+        windows[trace_index] = ([tuple(window) for window in event_index[idx].tolist()], guesses)
+    return windows
+
+
+def _add_fit_samples(database, trace, query_data, class_function):
+    table_name = 'results_%s' % class_function().name
+    fields = _fit_fields(class_function)
+    database.add_table(table_name=table_name, fields=typed_fields(fields))
+    database.drop_trace(table_name=table_name, trace=trace)
+    if query_data:
+        database.add_samples(table_name, fields, query_data)
+
+
+def fit_events(trace, sampling_period, database, class_function=gNDF, processes=1):
     signal = trace.data
     print('Fetching database: %s' % str(time.time()))
-    trace_events = database.get_samples(table_name="results", field_name='*')
-    events = {}
-    for c, field_name in enumerate(database.get_fields(table_name="results")):
-        events[field_name] = [i[c] for i in trace_events]
-
-    func = class_function()
-    table_name = 'results_%s' % func.name
-    # for i in np.unique(trace):
-    #     database.drop_trace(table_name=table_name, trace=i)
-    fields = ['Method', 'Trace', 'Function', 'Fitting_parameters'] + list(func.features())
-    result = database.add_table(table_name=table_name, fields=' float(53),'.join(fields) + ' float(53)')
-    database.drop_trace(table_name=table_name, trace=trace.active_trace)
+    windows, guesses = _get_event_windows(database, [trace.active_trace]).get(trace.active_trace, ([], []))
 
     print('Started fitting: %s' % str(time.time()))
-    for c, event_index in enumerate(events['Event_index']):
-        start, end = tuple(event_index.split(';'))
-        trace_index = int(events['Trace'][c])
-        if trace_index == trace.active_trace:
-            y = np.array(signal[trace_index][int(start):int(end)])
-            x = np.linspace(int(start)*sampling_period, int(end)*sampling_period, len(y))
-            try:
-                print('\tFit start  : %s' % str(time.time()))
-                func = class_function()
-                result = func.fit(x, y, I0=events['Level_0_median'][c])
-                if result:
-                    table_name = 'results_%s' % func.name
-                    print(func.features().keys())
-                    fields = ['Method', 'Trace', 'Function', 'Fitting_parameters'] + list(func.features().keys())
-                    query_data = [['Fit', trace_index, func.name, '(' + ','.join(str(v) for v in func.popt) + ')'] + list(func.features().values())]
-                    result = database.add_samples(table_name, fields, query_data)
-            except RuntimeError:
-                pass
+    query_data = _fit_windows(signal[trace.active_trace], trace.active_trace, windows, guesses,
+                              sampling_period, class_function, processes=processes)
+    _add_fit_samples(database, trace.active_trace, query_data, class_function)
+
+
+def _analyse_trace(signal, trace, sampling_period, levels=None, dwell_time=0, skip=2, t0=0, t1=-1,
+                   chunk_size=2**22, windows=None, guesses=None, class_function=None, adaptive=None) -> tuple:
+    """Threshold search and/or fitting of a single trace, as run by the worker processes.
+
+    Without windows the events are first detected, using levels of the trace itself when no
+    levels are given, or a RollingBaseline(**adaptive) of the trace. With a class_function the
+    events are fitted.
+    """
+    result = None
+    if windows is None:
+        baseline = None
+        if adaptive:
+            baseline = RollingBaseline(**adaptive)
+            for chunk in iter_chunks(signal, chunk_size=chunk_size, t0=t0, t1=t1):
+                baseline.add(chunk)
+        elif levels is None:
+            levels = get_levels([signal], t0=t0, t1=t1)
+        chunks = iter_chunks(signal, chunk_size=chunk_size, t0=t0, t1=t1)
+        result = concatenate_events(threshold_search_stream(chunks, sampling_period, levels,
+                                                            dwell_time=dwell_time, skip=skip,
+                                                            trace=trace, t0=t0, baseline=baseline), trace)
+        windows = zip(result.event_start.tolist(), result.event_end.tolist())
+        guesses = [dict(I0=I0, I1=I1, start=start * sampling_period, end=end * sampling_period)
+                   for I0, I1, start, end in zip(result.level_0.median.tolist(), result.level_1.median.tolist(),
+                                                 result.level_1.start.tolist(), result.level_1.end.tolist())]
+    query_data = None
+    if class_function is not None:
+        # Already in a worker process, so all fits of this trace run here at once
+        query_data = _fit_windows(signal, trace, windows, guesses, sampling_period, class_function, batch=True)
+    return trace, result, query_data
+
+
+def _trace_worker(args):
+    name, dtype, offset, length, trace, kwargs = args
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        signal = np.ndarray((length,), dtype=dtype, buffer=memory.buf, offset=offset)
+        result = _analyse_trace(signal, trace, **kwargs)
+        del signal
+        return result
+    finally:
+        memory.close()
+
+
+def _run_traces(signal, tasks, processes=None) -> list:
+    """Run _analyse_trace for every (trace, kwargs) task in a process pool.
+
+    The traces are copied once into shared memory, which the workers map without copying.
+    The results are returned in order of trace index, regardless of the order of completion.
+    """
+    if processes is None:
+        processes = min(len(tasks), os.cpu_count() or 1)
+    if processes <= 1:
+        results = [_analyse_trace(np.asarray(signal[trace]), trace, **kwargs) for trace, kwargs in tasks]
+        return sorted(results, key=lambda r: r[0])
+
+    traces = [trace for trace, _ in tasks]
+    dtype = np.result_type(*(np.asarray(signal[trace][:0]).dtype for trace in traces))
+    lengths = [len(signal[trace]) for trace in traces]
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    memory = shared_memory.SharedMemory(create=True, size=max(1, int(offsets[-1]) * dtype.itemsize))
+    try:
+        shared = np.ndarray((int(offsets[-1]),), dtype=dtype, buffer=memory.buf)
+        for trace, start, stop in zip(traces, offsets[:-1], offsets[1:]):
+            shared[start:stop] = signal[trace]
+        del shared
+        worker_args = [(memory.name, dtype, int(start) * dtype.itemsize, length, trace, kwargs)
+                       for (trace, kwargs), start, length in zip(tasks, offsets[:-1], lengths)]
+        with multiprocessing.Pool(processes) as pool:
+            results = list(pool.imap_unordered(_trace_worker, worker_args))
+    finally:
+        memory.close()
+        memory.unlink()
+    return sorted(results, key=lambda r: r[0])
+
+
+def threshold_search_traces(signal, sampling_period: float, levels=None, dwell_time=0, skip=2, traces=None,
+                            t0=0, t1=-1, database=None, class_function=None, processes=None, adaptive=None) -> list:
+    """Threshold search of many traces in parallel.
+
+    Every trace is analysed by threshold_search in a worker process, the trace data is
+    shared with the workers through shared memory. The results are merged in order of
+    trace index, so the result and the database are the same for any number of processes.
+
+    Parameters
+    ----------
+    signal : list
+        The signal as a list (or array) of traces
+    sampling_period : float
+        The time between two data points
+    levels : tuple
+        levels = ( center, threshold ) for all traces, by default the levels of each trace are
+        determined separately (see get_levels)
+    dwell_time : float
+        The minimal event length event should have to be included.
+    skip : int
+        The skip parameter will exclude a number of events between events as shotnoise, and combines them into a single event.
+    traces : list
+        The traces to be analysed, default is all traces
+    t0 : int
+        The first datapoint to be analysed in each trace.
+    t1 : int
+        The last datapoint to be analysed in each trace
+    database : SQL_database
+        Database to store the results
+    class_function : class
+        Fitting function (like gNDF) to optimise the events with, default is no fitting
+    processes : int
+        Number of worker processes, defaults to the number of cores
+    adaptive : dict
+        Follow a drifting baseline in every trace instead of fixed levels, with these arguments
+        of RollingBaseline, like dict(block_size=1000, window=25, sigma=3)
+
+    Returns
+    -------
+    list
+        ThresholdEvents of every trace, in order of trace index
+    """
+    traces = sorted(range(len(signal)) if traces is None else traces)
+    kwargs = dict(sampling_period=sampling_period, levels=levels, dwell_time=dwell_time, skip=skip,
+                  t0=t0, t1=t1, class_function=class_function, adaptive=adaptive)
+    results = _run_traces(signal, [(trace, kwargs) for trace in traces], processes)
+
+    if database:
+        for trace, result, query_data in results:
+            _add_threshold_table(database, trace)
+            _add_threshold_samples(database, result, sampling_period)
+            if class_function is not None:
+                _add_fit_samples(database, trace, query_data, class_function)
+    return [result for _, result, _ in results]
+
+
+def fit_traces(signal, sampling_period: float, database, traces=None, class_function=gNDF, processes=None) -> None:
+    """Fit the events found by threshold search of many traces in parallel (see fit_events).
+
+    Parameters
+    ----------
+    signal : list
+        The signal as a list (or array) of traces
+    sampling_period : float
+        The time between two data points
+    database : SQL_database
+        Database with the threshold results, the fits are added to it in order of trace index
+    traces : list
+        The traces to be fitted, default is all traces with events
+    class_function : class
+        Fitting function
+    processes : int
+        Number of worker processes, defaults to the number of cores
+    """
+    windows = _get_event_windows(database, traces)
+    traces = sorted(windows if traces is None else traces)
+    tasks = []
+    for trace in traces:
+        trace_windows, guesses = windows.get(trace, ([], []))
+        tasks.append((trace, dict(sampling_period=sampling_period, windows=trace_windows,
+                                  guesses=guesses, class_function=class_function)))
+    for trace, _, query_data in _run_traces(signal, tasks, processes):
+        _add_fit_samples(database, trace, query_data, class_function)
+
+
+# Fitting functions by their name in the event optimisation options
+fit_functions = {'gNDF': gNDF, 'Adept 2-State': Adept}
 
 
 class Events(AnalysisBase):
+    """
+    Threshold search of the active trace, or of all traces in parallel with all_traces=True.
+    The results are written to a database next to the trace file, of type database_class
+    (SQL_database, or NPZ_database for typed columns).
+    """
+    chunk_size = 2**22
+    database_class = SQL_database
+
+    def __init__(self, trace, all_traces=False, processes=None):
+        super().__init__(trace)
+        self.all_traces = all_traces
+        self.processes = processes
+
+    def _database(self):
+        return self.database_class(os.path.splitext(self.trace.file_name)[0] + getattr(self.database_class, 'suffix', ''))
+
     def _before(self):
         if self.trace.levels:
             self.levels = self.trace.levels
+        elif self.all_traces or self.trace.adaptive_baseline:
+            # The levels of every trace are determined separately by the workers, or
+            # follow the baseline
+            self.levels = None
         else:
             self.levels = Levels(self.trace).run()
 
     def _operation(self):
-        signal = np.array(self.trace.data)
         sampling_period = self.trace.sampling_period
         trace = self.trace.active_trace
         dwell_time = self.trace.minimal_dwell_time
         skip = self.trace.event_skip
-        database = SQL_database(os.path.splitext(self.trace.file_name)[0])
-        result = threshold_search(signal, sampling_period,
-                                  levels=self.levels,
-                                  dwell_time=dwell_time,
-                                  skip=skip,
-                                  trace=trace,
-                                  t0=self.trace.t0,
-                                  t1=self.trace.t1,
-                                  database=database,
-                                  )
+        database = self._database()
+        if self.all_traces:
+            self.result = threshold_search_traces(self.trace.data, sampling_period,
+                                                  levels=self.levels,
+                                                  dwell_time=dwell_time,
+                                                  skip=skip,
+                                                  t0=self.trace.t0,
+                                                  t1=self.trace.t1,
+                                                  database=database,
+                                                  class_function=gNDF if self.trace.optimize_events else None,
+                                                  processes=self.processes,
+                                                  adaptive=self.trace.adaptive_baseline,
+                                                  )
+            return
+        # Only one chunk of the active trace is converted at a time. A repeated search of the
+        # same trimmed trace, with other levels, skip or dwell time, re-uses the previous one
+        cache = self.trace.cache.setdefault(('threshold',) + self.trace.cache_key(), DetectionCache())
+        baseline = None
+        if self.trace.adaptive_baseline:
+            baseline = RollingBaseline(**self.trace.adaptive_baseline)
+            for chunk in iter_chunks(self.trace.data[trace], chunk_size=self.chunk_size,
+                                     t0=self.trace.t0, t1=self.trace.t1):
+                baseline.add(chunk)
+        chunks = iter_chunks(self.trace.data[trace], chunk_size=self.chunk_size, t0=self.trace.t0, t1=self.trace.t1)
+        result = concatenate_events(threshold_search_stream(chunks, sampling_period,
+                                                            levels=self.levels,
+                                                            dwell_time=dwell_time,
+                                                            skip=skip,
+                                                            trace=trace,
+                                                            t0=self.trace.t0,
+                                                            database=database,
+                                                            cache=cache,
+                                                            baseline=baseline,
+                                                            ), trace)
         if self.trace.optimize_events:
             fit_events(self.trace, sampling_period, database)
         self.result = result
 
     def optimise_events(self, function='gNDF'):
-        database = SQL_database(os.path.splitext(self.trace.file_name)[0])
-        fit_events(self.trace, self.trace.sampling_period, database)
+        database = self._database()
+        class_function = fit_functions.get(function, gNDF)
+        if self.all_traces:
+            fit_traces(self.trace.data, self.trace.sampling_period, database, class_function=class_function,
+                       processes=self.processes)
+        else:
+            # Fitting the windows of one trace in a pool is opt-in (processes set explicitly)
+            fit_events(self.trace, self.trace.sampling_period, database, class_function=class_function,
+                       processes=self.processes or 1)
 
     def _after(self):
-        for array in self.result:
-            if len(array) == 0:
-                warnings.warn("Found no events")
+        results = self.result if self.all_traces else [self.result]
+        if all(len(result.dwell_time) == 0 for result in results):
+            warnings.warn("Found no events")
 
 
 
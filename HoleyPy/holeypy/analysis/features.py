@@ -1,10 +1,9 @@
 # -*- coding: utf-8 -*-
 from .base import AnalysisBase
 from . import Events
-import numpy as np
 
 
-def get_features_threshold_search(event_data: tuple, sampling_period: float) -> tuple:
+def get_features_threshold_search(event_data, sampling_period: float) -> tuple:
     """Feature extraction algorithm.
 
     This function calculated the excluded current, the excluded current variance and dwell time of events found
@@ -12,7 +11,7 @@ def get_features_threshold_search(event_data: tuple, sampling_period: float) ->
 
     Parameters
     ----------
-    event_data : tuple
+    event_data : ThresholdEvents
         Result from threshold search (Events)
     sampling_period : float
         The time between two data points
@@ -23,22 +22,11 @@ def get_features_threshold_search(event_data: tuple, sampling_period: float) ->
         A tuple containing (in order), excluded current, excluded current variance and dwell time of all events
 
     """
-    # Expand variables
-    level_0, level_1, _, _, _, _ = event_data
-
-    # Calculate the mean current and standard deviation of baseline events (level 0)
-    level_0_mean = np.array([np.mean(i) for i in level_0])
-    level_0_sd = np.array([np.std(i) for i in level_0])
-
-    # Calculate the mean current and standard deviation of events (level 1)
-    level_1_mean = np.array([np.mean(i) for i in level_1])
-    level_1_sd = np.array([np.std(i) for i in level_1])
-
-    # Calculate the excluded current, variance and dwell time (in seconds)
-    residual_current = level_1_mean / level_0_mean
+    # The statistics of all events are already computed by threshold search
+    residual_current = event_data.residual_current
     excluded_current = (1-residual_current)
-    residual_current_sd_2 = ((level_1_mean / level_0_mean)**2) * (((level_1_sd**2) / (level_1_mean**2)) + ((level_0_sd**2) / (level_0_mean**2)))
-    dwell_time = np.array([len(i) * sampling_period for i in level_1])
+    residual_current_sd_2 = event_data.residual_current_sd_2
+    dwell_time = event_data.level_1.length * sampling_period
 
     # Return the excluded current, variance and dwell time (in seconds)
     return excluded_current, residual_current_sd_2, dwell_time
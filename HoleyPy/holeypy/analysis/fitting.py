@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Fit many event windows in a process pool
+"""
+import multiprocessing
+import os
+import numpy as np
+from ..timeaxis import TimeAxis
+from .fitting_functions import gNDF
+
+
+def _fit_worker(task):
+    class_function, t0, sampling_period, y, guess, timeout = task
+    x = np.asarray(TimeAxis(t0, sampling_period, len(y)))
+    func = class_function()
+    try:
+        if func.fit(x, y, timeout=timeout, **guess):
+            return func.popt
+    except RuntimeError:
+        pass
+    return None
+
+
+def fit_windows(signal, windows, sampling_period, class_function=gNDF, guesses=None, timeout=0.2,
+                processes=1, chunksize=8):
+    """Fit class_function to the event windows of a single trace in a process pool.
+
+    Every fit is stopped at the first evaluation of the model or its jacobian after timeout
+    seconds (see fitting_functions.deadline), so a single event can not stall the others. Fits start from the threshold search results when
+    guesses are given.
+
+    Parameters
+    ----------
+    signal : array_like
+        The signal of a single trace
+    windows : list
+        (start, end) of every event window, in data points
+    sampling_period : float
+        The time between two data points
+    class_function : class
+        Fitting function, like gNDF or Adept
+    guesses : list
+        Keyword arguments for the initial guess of every window, like
+        dict(I0=level_0_median, I1=level_1_median, start=level_1_start, end=level_1_end)
+        with start and end in seconds
+    timeout : float
+        Approximate maximum time per fit in seconds, None for no limit
+    processes : int
+        Number of worker processes, None for the number of cores, defaults to 1 which fits
+        in this process
+    chunksize : int
+        Number of fits sent to a worker at once
+
+    Yields
+    ------
+    tuple
+        (index, func) in order of the windows, as soon as the fit is done. func is a fitted
+        class_function or None when the fit failed or timed out
+    """
+    windows = list(windows)
+    if guesses is None:
+        guesses = [{}] * len(windows)
+    tasks = ((class_function, int(start) * sampling_period, sampling_period,
+              np.array(signal[int(start):int(end)]), guess, timeout)
+             for (start, end), guess in zip(windows, guesses))
+
+    if processes is None:
+        processes = min(len(windows), os.cpu_count() or 1)
+    if processes <= 1:
+        for index, popt in enumerate(map(_fit_worker, tasks)):
+            yield index, None if popt is None else class_function(popt)
+        return
+
+    with multiprocessing.Pool(processes) as pool:
+        for index, popt in enumerate(pool.imap(_fit_worker, tasks, chunksize=chunksize)):
+            yield index, None if popt is None else class_function(popt)
+
+
+def _levenberg_marquardt(model, jacobian, x, y, mask, p, max_iter=200, ftol=1.49012e-08, xtol=1.49012e-08):
+    """Levenberg-Marquardt iterations for many padded events at once.
+
+    x, y and mask have one event per row, p one row of parameters per event. Every event
+    has its own damping and convergence test (ftol and xtol as in MINPACK, which curve_fit
+    uses), only the events that did not converge yet are evaluated in the next iteration.
+    Returns the parameters, the final cost and the convergence mask.
+    """
+    n, k = p.shape
+    diagonal = np.arange(k)
+    damping = np.full(n, 1e-3)
+    factor = np.full(n, 2.0)
+    converged = np.zeros(n, dtype=bool)
+
+    def residual(index, parameters):
+        r = model(x[index], *parameters.T[:, :, None]) - y[index]
+        return np.where(mask[index], r, 0)
+
+    with np.errstate(all='ignore'):
+        r = residual(np.arange(n), p)
+        cost = np.einsum('nl,nl->n', r, r)
+        active = np.where(np.isfinite(cost))[0]
+        for _ in range(max_iter):
+            if len(active) == 0:
+                break
+            pa = p[active]
+            J = jacobian(x[active], *pa.T[:, :, None]) * mask[active, :, None]
+            JTJ = np.einsum('nlk,nlm->nkm', J, J)
+            g = np.einsum('nlk,nl->nk', J, r[active])
+
+            # Solve (JTJ + damping * I) h = -g, in parameters scaled by the norm of their column
+            scale = np.sqrt(JTJ[:, diagonal, diagonal])
+            scale[~(scale > 0)] = 1
+            g = g / scale
+            A = JTJ / (scale[:, :, None] * scale[:, None, :])
+            A[:, diagonal, diagonal] += damping[active, None]
+            A[~np.isfinite(A)] = 0
+            try:
+                h = np.linalg.solve(A, -g[:, :, None])[:, :, 0]
+            except np.linalg.LinAlgError:
+                h = (np.linalg.pinv(A) @ -g[:, :, None])[:, :, 0]
+
+            trial = pa + h / scale
+            r_trial = residual(active, trial)
+            cost_trial = np.einsum('nl,nl->n', r_trial, r_trial)
+
+            # Gain ratio of the actual and predicted reduction of the cost
+            actual = cost[active] - cost_trial
+            predicted = np.einsum('nk,nk->n', h, damping[active, None] * h - g)
+            gain = actual / predicted
+            better = np.isfinite(cost_trial) & (actual >= 0) & (gain > 0)
+
+            # Accept the improved events and relax their damping, increase it for the others
+            improved = active[better]
+            p[improved] = trial[better]
+            r[improved] = r_trial[better]
+            cost[improved] = cost_trial[better]
+            damping[improved] *= np.maximum(1 / 3, 1 - (2 * gain[better] - 1) ** 3)
+            factor[improved] = 2
+            damping[active[~better]] *= factor[active[~better]]
+            factor[active[~better]] *= 2
+
+            small = (np.abs(actual) <= ftol * cost[active]) & (predicted <= ftol * cost[active])
+            small |= np.sqrt(np.einsum('nk,nk->n', h, h)) <= xtol * np.linalg.norm(pa * scale, axis=1)
+            small |= damping[active] > 1e16
+            converged[active[small]] = True
+            active = active[~small]
+    return p, cost, converged
+
+
+def fit_batch(signal, windows, sampling_period, class_function=gNDF, guesses=None, max_iter=200,
+              batch_size=2**20) -> list:
+    """Fit class_function to many event windows at once.
+
+    The events are padded into 2-D arrays (one event per row, with a mask) and fitted by a
+    vectorised Levenberg-Marquardt iteration using the analytic jacobian of the fitting
+    function, so thousands of short events are fitted without a curve_fit call per event.
+    Events of similar length are grouped to limit the padding. Only fitting functions with
+    batch_fit (like gNDF) are accepted, the others can end in worse minima than fit_windows.
+
+    Parameters
+    ----------
+    signal : array_like
+        The signal of a single trace
+    windows : list
+        (start, end) of every event window, in data points
+    sampling_period : float
+        The time between two data points
+    class_function : class
+        Fitting function with batch_fit and model and jacobian methods, like gNDF
+    guesses : list
+        Keyword arguments for the initial guess of every window (see fit_windows)
+    max_iter : int
+        Maximum number of iterations
+    batch_size : int
+        Maximum number of (padded) data points fitted at once
+
+    Returns
+    -------
+    list
+        A fitted class_function for every window, or None when the fit did not converge
+
+    Raises
+    ------
+    ValueError
+        If class_function is not fitted in batches (its batch_fit is False)
+    """
+    if not getattr(class_function, 'batch_fit', False):
+        raise ValueError('%s is not fitted in batches, use fit_windows' % class_function.__name__)
+    windows = [(int(start), int(end)) for start, end in windows]
+    if guesses is None:
+        guesses = [{}] * len(windows)
+    func = class_function()
+    n_parameters = len(func.initial_guess(np.zeros(1), np.zeros(1)))
+    events = [np.array(signal[start:end]) for start, end in windows]
+    lengths = np.array([len(y) for y in events], dtype=np.int64)
+    order = np.argsort(lengths, kind='stable')
+    result = [None] * len(windows)
+
+    first = 0
+    while first < len(order):
+        # Events sorted by length, as many as fit in batch_size padded data points
+        last = first + 1
+        while last < len(order) and (last - first + 1) * lengths[order[last]] <= batch_size:
+            last += 1
+        batch = order[first:last]
+        first = last
+        width = max(1, int(lengths[batch[-1]]))
+
+        mask = np.arange(width) < lengths[batch, None]
+        x = np.empty((len(batch), width))
+        y = np.zeros((len(batch), width))
+        p = np.empty((len(batch), n_parameters))
+        for row, i in enumerate(batch):
+            n = lengths[i]
+            x[row] = np.asarray(TimeAxis(windows[i][0] * sampling_period, sampling_period, width))
+            y[row, :n] = -1 * abs(events[i])
+            p[row] = func.initial_guess(x[row, :n], events[i], **guesses[i]) if n else np.nan
+
+        p, _, converged = _levenberg_marquardt(func.model, func.jacobian, x, y, mask, p, max_iter=max_iter)
+        for row, i in enumerate(batch):
+            if converged[row] and np.all(np.isfinite(p[row])):
+                result[i] = class_function(p[row])
+    return result
@@ -19,43 +19,71 @@ def gNDF(x, A, x0, sigma, B, C):
     return (A*exp(E)) + C
 '''
 
-from contextlib import contextmanager
-import threading
-import _thread
+import time
+
 
 class TimeoutException(Exception):
     def __init__(self, msg=''):
         self.msg = msg
 
-@contextmanager
-def time_limit(seconds, msg=''):
-    timer = threading.Timer(seconds, lambda: _thread.interrupt_main())
-    timer.start()
-    try:
-        yield
-    except KeyboardInterrupt:
-        raise TimeoutException("Timed out for operation {}".format(msg))
-    finally:
-        # if the action ends in specified time, timer is canceled
-        timer.cancel()
 
-import time
+def deadline(functions, seconds, msg=''):
+    """Wrap the model function and its jacobian, such that they raise TimeoutException once
+    seconds have passed.
+
+    The optimiser evaluates both many times, so a fit is stopped at the first evaluation after
+    the deadline. Unlike a timer interrupting the main thread, this works in any thread or
+    worker process. The limit is approximate: an evaluation or solver step that is already
+    running is finished first.
+    """
+    if seconds is None:
+        return functions
+    end = time.perf_counter() + seconds
+
+    def wrap(function):
+        def timed(*args, **kwargs):
+            if time.perf_counter() > end:
+                raise TimeoutException("Timed out for operation {}".format(msg))
+            return function(*args, **kwargs)
+        return timed
+    return tuple(wrap(function) for function in functions)
+
 
 class Adept:
+    # The batched fit (see fitting.fit_batch) ends in a worse local minimum than curve_fit
+    # for a sixth of the short events, so Adept is fitted event by event
+    batch_fit = False
+
     def __init__(self, popt=None):
         self.popt = popt
+        self.name = "Adept"
+
+    def features(self):
+        features = ['Open_current', 'Amplitude_block', 'Event_start', 'Event_end', 'Tau', 'Dwell_time']
+        if self.popt is not None:
+            features_dict = dict(zip(features[0:len(features)-1], self.popt))
+            features_dict['Dwell_time'] = self.dwell_time()
+            return features_dict
+        else:
+            return features
 
     def get_fit(self, x):
-        return self.gNDF(np.array(x), *self.popt)
+        return self.adept2state(np.array(x), *self.popt)
 
-    def fit(self, x, y, I0=-100):
-        try:
+    def initial_guess(self, x, y, I0=-100, I1=None, start=None, end=None) -> tuple:
+        """Starting parameters, from the threshold search levels and event start and end (in seconds) if known"""
+        if I1 is None or start is None or end is None:
             a = np.max(y)
             x0 = np.mean(x)
             sigma = float(max(x)-min(x)) / 3
-            c = sigma / 5
-            with time_limit(0.2, 'sleep'):
-                self.popt, _ = curve_fit(self.adept2state, x, -1 * abs(y), p0=(I0, a, x0-sigma, x0+sigma, c), maxfev=1000)
+            return I0, a, x0-sigma, x0+sigma, sigma / 5
+        return -abs(I0), abs(I0) - abs(I1), start, end, (end - start) / 10
+
+    def fit(self, x, y, I0=-100, I1=None, start=None, end=None, timeout=0.2):
+        try:
+            p0 = self.initial_guess(x, y, I0, I1, start, end)
+            model, jacobian = deadline((self.adept2state, self.jacobian), timeout, 'Adept')
+            self.popt, _ = curve_fit(model, x, -1 * abs(y), p0=p0, jac=jacobian, maxfev=1000)
         except:
             pass
         finally:
@@ -65,19 +93,42 @@ class Adept:
                 return False
 
     def adept2state(self, t, I0, a, mu_1, mu_2, tau):
-        rise_capacitance = (np.exp(-(t - mu_2) / tau) - 1)
-        fall_capacitance = (1 - np.exp(-(t - mu_1) / tau))
-        rise_capacitance[abs(rise_capacitance) == np.inf] = 0
-        fall_capacitance[abs(fall_capacitance) == np.inf] = 0
-        rise = rise_capacitance * np.heaviside(t - mu_2, 1)
-        fall = fall_capacitance * np.heaviside(t - mu_1, 1)
+        # The exponentials only start at mu_1 and mu_2, before that they are 1 (no change)
+        fall = 1 - np.exp(-np.maximum(t - mu_1, 0) / tau)
+        rise = np.exp(-np.maximum(t - mu_2, 0) / tau) - 1
         return I0 + a * (rise + fall)
 
+    def jacobian(self, t, I0, a, mu_1, mu_2, tau):
+        """Analytic derivatives of adept2state to (I0, a, mu_1, mu_2, tau), in the last axis.
+
+        Like the model, this also works for a 2-D t with one event per row and parameters
+        of shape (n_events, 1).
+        """
+        d_1 = np.maximum(t - mu_1, 0)
+        d_2 = np.maximum(t - mu_2, 0)
+        e_1 = np.exp(-d_1 / tau)
+        e_2 = np.exp(-d_2 / tau)
+        # Columns are contiguous (Fortran order), as the optimiser expects
+        jac = np.empty((5,) + np.shape(e_1 * e_2))
+        jac[0] = 1
+        np.subtract(e_2, e_1, out=jac[1])
+        np.multiply(e_1, (t > mu_1) * (-a / tau), out=jac[2])
+        np.multiply(e_2, (t > mu_2) * (a / tau), out=jac[3])
+        np.multiply(e_2, d_2, out=jac[4])
+        jac[4] -= e_1 * d_1
+        jac[4] *= a / tau ** 2
+        return np.moveaxis(jac, 0, -1)
+
+    model = adept2state
+
     def dwell_time(self):
         return abs(self.popt[3] - self.popt[2])
 
 
 class gNDF:
+    # The batched fit (see fitting.fit_batch) matches curve_fit
+    batch_fit = True
+
     def __init__(self, popt=None):
         self.popt = popt
         self.name = "gNDF"
@@ -94,15 +145,21 @@ class gNDF:
     def get_fit(self, x):
         return self.gNDF(np.array(x), *self.popt)
 
-    def fit(self, x, y, I0=-100):
-        try:
+    def initial_guess(self, x, y, I0=-100, I1=None, start=None, end=None) -> tuple:
+        """Starting parameters, from the threshold search levels and event start and end (in seconds) if known"""
+        b = 2.72
+        if I1 is None or start is None or end is None:
             a = np.max(y)
             x0 = np.mean(x)
             sigma = float(max(x)-min(x)) / 3
-            b = 2.72
-            c = I0
-            with time_limit(0.2, 'sleep'):
-                self.popt, _ = curve_fit(self.gNDF, x, -1 * abs(y), p0=(a, x0, sigma, b, c), maxfev=1000)
+            return a, x0, sigma, b, I0
+        return abs(I0) - abs(I1), (start + end) / 2, (end - start) / 2, b, -abs(I0)
+
+    def fit(self, x, y, I0=-100, I1=None, start=None, end=None, timeout=0.2):
+        try:
+            p0 = self.initial_guess(x, y, I0, I1, start, end)
+            model, jacobian = deadline((self.gNDF, self.jacobian), timeout, 'gNDF')
+            self.popt, _ = curve_fit(model, x, -1 * abs(y), p0=p0, jac=jacobian, maxfev=1000)
         except:
             pass
         finally:
@@ -112,12 +169,38 @@ class gNDF:
                 return False
 
     def gNDF(self, x, a, x0, sigma, b, c, cutoff=0.001, tau=0.0001):
-        reg = 1 / (2 * sigma * gamma(1 / b))
-        # gNDF_fit = a * (gennorm.pdf(x, b, loc=x0, scale=sigma) / reg) + c
-        pdf = np.array(gennorm.pdf(x, b, loc=x0, scale=sigma))
-        max_pdf = gennorm.pdf(x0, b, loc=x0, scale=sigma)
-        gNDF_fit = a * (pdf / max_pdf) + c
-        return gNDF_fit
+        # gennorm.pdf(x, b, loc=x0, scale=sigma) divided by its maximum, at x0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where((sigma > 0) & (b > 0), a * np.exp(-np.abs((x - x0) / sigma) ** b) + c, np.nan)
+
+    def jacobian(self, x, a, x0, sigma, b, c, cutoff=0.001, tau=0.0001):
+        """Analytic derivatives of gNDF to (a, x0, sigma, b, c), in the last axis.
+
+        Like the model, this also works for a 2-D x with one event per row and parameters
+        of shape (n_events, 1).
+        """
+        z = (x - x0) / sigma
+        u = np.abs(z)
+        # Columns are contiguous (Fortran order), as the optimiser expects
+        jac = np.empty((5,) + np.shape(z))
+        with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+            u_b = u ** b
+            np.exp(-u_b, out=jac[0])
+            w = jac[0] * u_b
+            # e * u ** b vanishes far from the centre (where u ** b overflows),
+            # the terms with u ** (b - 1) and log(u) vanish at the centre
+            w[np.isnan(w)] = 0
+            np.divide(w, z, out=jac[1])
+            np.multiply(w, np.log(u), out=jac[3])
+        jac[1][u == 0] = 0
+        jac[3][u == 0] = 0
+        jac[1] *= a * b / sigma
+        np.multiply(w, a * b / sigma, out=jac[2])
+        jac[3] *= -a
+        jac[4] = 1
+        return np.moveaxis(jac, 0, -1)
+
+    model = gNDF
 
     def dwell_time(self, cutoff=0.001):
         start = self.event_start(cutoff=cutoff)
@@ -2,13 +2,14 @@ from .base import AnalysisBase
 import warnings
 
 import numpy as np
-from scipy.optimize import curve_fit
 
 
-def get_levels(signal: np.array, sigma=3, trace=0, t0=0, t1=-1) -> tuple:
+def get_levels(signal: np.array, sigma=3, trace=0, t0=0, t1=-1, chunk_size=2**22) -> tuple:
     """Level detection algorithm.
     
     This function uses a gaussian fit around the main signal to determine the open pore current and threshold cut-off.
+    The histogram of the signal is built in a single pass over chunks of the trace (see LevelHistogram),
+    so also a memmap is never read into memory at once.
         
     Parameters
     ----------
@@ -23,6 +24,8 @@ def get_levels(signal: np.array, sigma=3, trace=0, t0=0, t1=-1) -> tuple:
         The first datapoint to be analysed in the trace.
     t1 : int
         The last datapoint to be analysed in the trace
+    chunk_size : int
+        Number of data points added to the histogram at once
     
     Returns
     -------
@@ -31,69 +34,153 @@ def get_levels(signal: np.array, sigma=3, trace=0, t0=0, t1=-1) -> tuple:
         
     """
     # Fetch and trim signal
-    signal = signal[trace][t0:t1]
+    signal = signal[trace]
+    start, stop, _ = slice(t0, t1).indices(len(signal))
 
-    # Determine the orientation of the signal
-    signal_orientation = np.sign(sum(signal))*-1
-
-    # Ensure the signal is always negative, such that the baseline is always the lowest possible level
-    signal = abs(np.array(signal))*-1
+    histogram = LevelHistogram()
+    for i in range(start, stop, chunk_size):
+        histogram.add(signal[i:min(i + chunk_size, stop)])
 
     # Fetch the lowest central normal distribution
-    centre, variance, residual = _ndf_deconvolution(signal)
-    l0 = centre * signal_orientation
-    l1 = variance * sigma * signal_orientation
+    centre, variance = histogram.baseline()
+    l0 = centre * histogram.orientation
+    l1 = variance * sigma * histogram.orientation
     return l0, l1
 
 
-def _ndf(x, *p) -> np.array:
-    a, mu, sigma = p
-    return a*np.exp(-(x - mu)**2 / float(2 * sigma**2))
-
+class LevelHistogram:
+    """
+    Histogram of -abs(signal), built chunk by chunk, with a closed-form estimate of the baseline.
 
-def _ndf_deconvolution(signal, n_peaks=2) -> tuple:
-    # Initialise variables
-    centres, variance = ([], [])
-
-    # Create a histogram of the data
-    n_bins = 2000
-    x_bins = np.linspace(min(signal), max(signal), n_bins+1)
-    x_edges = np.linspace(min(signal), max(signal), n_bins)
-    residual, _ = np.histogram(signal, bins=x_bins)
-
-    # Try to fit a NDF around the user defined number of peaks (default=2)
-    for i in range(n_peaks):
-        # Estimate starting parameters
-        amplitude_0 = max(residual)
-        centre_0 = np.median(signal)
-        variance_0 = 1
-        p0 = [amplitude_0, centre_0, variance_0]
-
-        # Fit a normal distribution function around the (residual) data
-        try:
-            p, var_matrix = curve_fit(_ndf,
-                                      x_edges,
-                                      residual,
-                                      p0=p0)
-        except RuntimeError:
-            p = (0, 0, 0)
+    The bins are multiples of the bin width, starting from the range of the first chunk split in
+    n_bins. Data outside the current bins extends the histogram, and whenever it grows beyond
+    2 * n_bins the width is doubled by joining neighbouring bins. Any chunk is thus added in a
+    single pass (np.bincount) and the histogram does not depend on the chunk size, unless the
+    range grows.
+    """
+    def __init__(self, n_bins=2000):
+        self.n_bins = n_bins
+        self.width = None
+        self.first_bin = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.total = 0.0
+
+    @property
+    def orientation(self) -> float:
+        """-1 for a positive signal, 1 for a negative one (the sign of the baseline)"""
+        return np.sign(self.total) * -1
+
+    @property
+    def centres(self) -> np.ndarray:
+        return (self.first_bin + np.arange(len(self.counts)) + 0.5) * self.width
+
+    def add(self, chunk) -> None:
+        chunk = np.asarray(chunk, dtype=np.float64)
+        self.total += np.nansum(chunk)
+        # Ensure the signal is always negative, such that the baseline is always the lowest possible level
+        values = -np.abs(chunk[np.isfinite(chunk)])
+        if len(values) == 0:
+            return
+        low, high = values.min(), values.max()
+        if self.width is None:
+            self.width = (high - low) / self.n_bins or abs(low) * 1e-6 or 1.0
+            self.first_bin = int(np.floor(low / self.width))
+
+        index = np.floor(values / self.width).astype(np.int64)
+        first = min(self.first_bin, int(np.floor(low / self.width)))
+        last = max(self.first_bin + len(self.counts) - 1, int(np.floor(high / self.width)))
+        while last - first + 1 > 2 * self.n_bins:
+            self._double_width()
+            index //= 2
+            first, last = first // 2, last // 2
+
+        # Extend the bins to [first, last], and count the new values
+        counts = np.zeros(last - first + 1, dtype=np.int64)
+        counts[self.first_bin - first:self.first_bin - first + len(self.counts)] = self.counts
+        counts += np.bincount(index - first, minlength=len(counts))
+        self.counts, self.first_bin = counts, first
+
+    def _double_width(self) -> None:
+        # Join the bins 2k and 2k+1, so that the edges remain multiples of the (new) width
+        counts = self.counts
+        if self.first_bin % 2:
+            counts = np.concatenate(([0], counts))
+        if len(counts) % 2:
+            counts = np.append(counts, 0)
+        self.counts = counts.reshape(-1, 2).sum(axis=1)
+        self.first_bin = self.first_bin // 2
+        self.width *= 2
+
+    def baseline(self, n_peaks=2, min_height=0.05) -> tuple:
+        """Centre and standard deviation of the baseline (the peak with the largest current).
+
+        Up to n_peaks normal distributions are fitted one after the other, each to the residual
+        of the previous. A peak lower than min_height times the first is not considered.
+        """
+        x = self.centres
+        residual = self.counts.astype(np.float64)
+        centres, variance = [], []
+        for i in range(n_peaks):
+            if len(residual) == 0 or residual.max() <= 0:
+                break
+            if centres and residual.max() < min_height * self.counts.max():
+                break
+            amplitude, centre, vrs = _ndf_peak(x, residual, self.width)
+            residual = np.maximum(residual - _ndf(x, amplitude, centre, vrs), 0)
+            # The flanks of the fitted peak are not a new peak
+            residual[np.abs(x - centre) < 3 * vrs] = 0
+            centres.append(centre)
+            variance.append(vrs)
+        if not centres:
             warnings.warn("Could not fit normal distribution around data", UserWarning)
+            return 0, 0
+        # Return the peak centre and variance of the normal distribution with the lowest peak centre
+        return centres[np.argmax(np.abs(centres))], abs(variance[np.argmax(np.abs(centres))])
 
-        # Subtract the fitted normal distribution from the data
-        # As the normal distribution returns floats and the histogram consists of integers
-        # Typecast the resulting distribution to integers prior to subtraction
-        residual -= _ndf(x_edges, *p).astype('int32')
 
-        # Extract the peak centre and variance, add them to the list of fitted centres and variance
-        _, centre, vrs = p
-        centres.append(centre)
-        variance.append(vrs)
-    # Return the peak centre and variance of the normal distribution with the lowest peak centre
-    return centres[np.argmax(np.abs(centres))], abs(variance[np.argmax(np.abs(centres))]), residual
+def _ndf_peak(x, counts, width) -> tuple:
+    """Closed-form normal distribution fit to the highest peak of a histogram.
+
+    The logarithm of a normal distribution is a parabola, which is fitted to the bins around the
+    peak above half its maximum, weighted by their counts. When the peak is too narrow for that,
+    the mean and variance of the bins around it are used.
+    """
+    peak = int(np.argmax(counts))
+    amplitude = counts[peak]
+    # The contiguous bins above half maximum around the peak
+    below = np.where(counts <= amplitude / 2)[0]
+    left = below[below < peak][-1] + 1 if np.any(below < peak) else 0
+    right = below[below > peak][0] - 1 if np.any(below > peak) else len(counts) - 1
+    region = slice(left, right + 1)
+    if right - left >= 2:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            c, b, a = np.polyfit(x[region], np.log(counts[region]), 2, w=counts[region])
+        if c < 0:
+            centre = -b / (2 * c)
+            vrs = np.sqrt(-1 / (2 * c))
+            return np.exp(a - b ** 2 / (4 * c)), centre, vrs
+
+    # Moments of the bins around the peak, corrected for the bin width
+    region = slice(max(0, peak - 3), peak + 4)
+    weights = counts[region]
+    centre = np.average(x[region], weights=weights)
+    vrs = np.sqrt(max(np.average((x[region] - centre) ** 2, weights=weights) - width ** 2 / 12, width ** 2 / 12))
+    return amplitude, centre, vrs
+
+
+def _ndf(x, *p) -> np.array:
+    a, mu, sigma = p
+    return a*np.exp(-(x - mu)**2 / float(2 * sigma**2))
 
 
 class Levels(AnalysisBase):
     def _operation(self):
+        # The levels of a trimmed trace are only determined once
+        key = ('levels',) + self.trace.cache_key()
+        if key in self.trace.cache:
+            self.result = self.trace.cache[key]
+            return
         signal = self.trace.data
         trace = self.trace.active_trace
         self.result = get_levels(signal,
@@ -101,6 +188,7 @@ class Levels(AnalysisBase):
                                  t0=self.trace.t0,
                                  t1=self.trace.t1
                                  )
+        self.trace.cache[key] = self.result
 
     def _after(self):
         if self.result[0] is False:
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Event detection with multiple current levels (multi-state events)
+"""
+from collections import namedtuple
+import warnings
+import numpy as np
+from .base import AnalysisBase
+from .segments import segment_statistics
+from .threshold import ThresholdEvents, merge_runs
+
+
+MultiLevelEvents = namedtuple('MultiLevelEvents', ThresholdEvents._fields + ('level',))
+MultiLevelEvents.__doc__ = """ThresholdEvents with the index of the level of every event (in the given levels)."""
+
+
+def label_levels(signal, levels, margin=0) -> np.ndarray:
+    """Level of every data point, in a single np.digitize pass.
+
+    A data point is at level c when abs(signal) > abs(levels[c]) + abs(margin), and not above
+    a higher level. Data points below all levels (or NaN) are labelled -1.
+    """
+    edges = np.abs(np.asarray(levels, dtype=np.float64)) + abs(margin)
+    order = np.argsort(edges, kind='stable')
+    # digitize counts the edges below each value, np.nextafter makes 'above the edge' strict
+    amplitude = np.abs(signal)
+    label = np.digitize(amplitude, np.nextafter(edges[order], np.inf)) - 1
+    return np.where((label >= 0) & ~np.isnan(amplitude), order[np.maximum(label, 0)], -1)
+
+
+def run_length_encode(label) -> tuple:
+    """First and last index and the value of every run of equal values"""
+    label = np.asarray(label)
+    if len(label) == 0:
+        index = np.zeros(0, dtype=np.int64)
+        return index, index, label
+    last = np.append(np.where(label[1:] != label[:-1])[0], len(label) - 1)
+    first = np.concatenate(([0], last[:-1] + 1))
+    return first, last, label[first]
+
+
+def merge_level_runs(first, last, label, skip) -> tuple:
+    """Join runs of the same level that are at most skip data points apart into blocks.
+
+    Like merge_runs, but only consecutive runs are joined, so a block never spans a run of
+    another level and the blocks of all levels do not overlap.
+    Returns the first and last data point, the number of data points and the level of every block.
+    """
+    count = last - first + 1
+    if skip < 1:
+        block_first, block_last, block_count = merge_runs(first, last, skip)
+        return block_first, block_last, block_count, np.repeat(label, count)
+    if len(first) == 0:
+        return first, last, count, label
+    split = (first[1:] - last[:-1] > skip) | (label[1:] != label[:-1])
+    end = np.append(np.where(split)[0], len(first) - 1)
+    start = np.concatenate(([0], end[:-1] + 1))
+    return first[start], last[end], np.add.reduceat(count, start), label[start]
+
+
+def multilevel_search(signal, sampling_period: float, levels, margin=0, dwell_time=0, skip=2, trace=0,
+                      t0=0, t1=-1) -> MultiLevelEvents:
+    """Event detection algorithm for multiple levels.
+
+    Every data point is labelled with its level (see label_levels), the labels are run-length
+    encoded, and consecutive runs of the same level at most 'skip' data points apart are joined
+    into events (as in threshold_search, see merge_level_runs). Events that are not longer than 2
+    or the dwell time are removed.
+    This replaces thresholdsearch_mmult, in linear time.
+
+    Parameters
+    ----------
+    signal : numpy array
+        The signal should be fed as a array of arrays.
+        Each top-level array is threated as a trace of a signal allowing easy cross-trace analysis (for e.g. current dependent analysis).
+    sampling_period : float
+        The sampling_frequency is used in combination with the dwelltime argument exclude short events.
+    levels : list
+        The current of every level
+    margin : float
+        Distance from the level that a data point should exceed to be at that level
+    dwell_time : float
+        The minimal event length event should have to be included.
+    skip : int
+        The skip parameter will exclude a number of events between events as shotnoise, and combines them into a single event.
+    trace : int
+        The trace to be analysed (n-th number array)
+    t0 : int
+        The first datapoint to be analysed in the trace.
+    t1 : int
+        The last datapoint to be analysed in the trace
+
+    Returns
+    -------
+    MultiLevelEvents
+        Like ThresholdEvents (in order of event start), with the level of every event.
+        The baseline (level_0) of an event is the signal since the previous event of any level,
+        it is empty (NaN) when an event directly follows another.
+    """
+    # Trim the current trace
+    trace_length = len(signal[trace])
+    signal = np.asarray(signal[trace][t0:min(trace_length, t1)])
+
+    # While the dwell time suggests that also spikes can be seen, at least 2 data points are required to be an event
+    n_filter = max(2, int(dwell_time / float(sampling_period)))
+
+    first, last, label = run_length_encode(label_levels(signal, levels, margin))
+    runs = label >= 0
+    block_first, block_last, count, level = merge_level_runs(first[runs], last[runs], label[runs], skip)
+    idx = np.where(count - 1 > n_filter)[0]
+    level_1_start = block_first[idx].astype(np.int64)
+    level_1_end = block_last[idx].astype(np.int64)
+    level = level[idx].astype(np.int64)
+
+    # Whenever level 1 starts, level 0 just ended one data point ahead
+    level_0_start = np.concatenate(([0], level_1_end + 1))[:-1]
+    level_0_end = np.maximum(level_1_start - 1, level_0_start)
+
+    shift = np.nanmedian(signal) if len(signal) else 0
+    level_0 = segment_statistics(signal, level_0_start, level_0_end, shift=shift)
+    level_1 = segment_statistics(signal, level_1_start, level_1_end, shift=shift)
+    level_0 = level_0._replace(start=level_0.start + t0, end=level_0.end + t0)
+    level_1 = level_1._replace(start=level_1.start + t0, end=level_1.end + t0)
+
+    # Calculate the excluded current, variance and dwell time (in seconds)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        residual_current = level_1.mean / level_0.mean
+        residual_current_sd_2 = (residual_current ** 2) * (
+                ((level_1.std ** 2) / (level_1.mean ** 2)) + ((level_0.std ** 2) / (level_0.mean ** 2)))
+    dwell_time = level_1.length * sampling_period
+
+    # Window around each event, extended by the event length on both sides
+    approx_event_length = level_1.end - level_1.start
+    event_start = np.maximum(0, level_1.start - approx_event_length)
+    event_end = np.minimum(t0 + len(signal), level_1.end + approx_event_length)
+    return MultiLevelEvents(trace, level_0, level_1, residual_current, residual_current_sd_2,
+                            dwell_time, event_start, event_end, level)
+
+
+class MultiLevel(AnalysisBase):
+    """
+    Multi-level event detection of the active trace, with the trim, dwell time
+    and skip of the trace
+    """
+    def __init__(self, trace, levels, margin=0):
+        super().__init__(trace)
+        self.levels = levels
+        self.margin = margin
+
+    def _operation(self):
+        self.result = multilevel_search(self.trace.data,
+                                        self.trace.sampling_period,
+                                        self.levels,
+                                        margin=self.margin,
+                                        dwell_time=self.trace.minimal_dwell_time,
+                                        skip=self.trace.event_skip,
+                                        trace=self.trace.active_trace,
+                                        t0=self.trace.t0,
+                                        t1=self.trace.t1,
+                                        )
+
+    def _after(self):
+        if len(self.result.dwell_time) == 0:
+            warnings.warn("Found no events")
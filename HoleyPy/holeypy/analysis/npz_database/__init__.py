@@ -0,0 +1,7 @@
+'''
+    Columnar event store, with the same interface as SQL_database. It is part of resultsql,
+    which PySential's npz_database uses as well.
+'''
+from resultsql.npz import NPZ_database
+
+__all__ = ['NPZ_database']
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorised statistics of many segments of a single signal
+"""
+from collections import namedtuple
+import numpy as np
+
+
+SegmentStatistics = namedtuple('SegmentStatistics', ['start', 'end', 'length', 'mean', 'std', 'median'])
+SegmentStatistics.__doc__ = """Columnar statistics of segments signal[start:end], one array per column."""
+
+
+def _segment_sums(values, edges, lengths):
+    """Sum every other reduceat block, i.e. values[start:end] for each segment.
+
+    values must have one padding element at the end, so that edges may include
+    len(signal); empty segments (where reduceat returns a single element) sum to 0.
+    """
+    sums = np.add.reduceat(values, edges)[0::2]
+    sums[lengths == 0] = 0
+    return sums
+
+
+def _segment_median(signal, starts, lengths, batch_size):
+    """Median of every segment.
+
+    Segments of similar length (within a factor two) are gathered into the rows of one
+    padded array, which is sorted along its rows at once.
+    """
+    median = np.full(len(starts), np.nan)
+    bucket = np.ceil(np.log2(np.maximum(lengths, 1))).astype(np.int64)
+    for b in np.unique(bucket[lengths > 0]):
+        index = np.where((bucket == b) & (lengths > 0))[0]
+        width = int(lengths[index].max())
+        rows = max(1, batch_size // width)
+        for first in range(0, len(index), rows):
+            i = index[first:first + rows]
+            n = lengths[i]
+            position = np.arange(width)
+            values = signal[np.minimum(starts[i, None] + position, len(signal) - 1)]
+            values = np.where(position < n[:, None], values, np.inf)
+            values.sort(axis=1)
+            row = np.arange(len(i))
+            median[i] = (values[row, (n - 1) // 2] + values[row, n // 2]) / 2
+    return median
+
+
+def segment_statistics(signal, starts, ends, median=True, shift=None, batch_size=2**22) -> SegmentStatistics:
+    """Length, mean, standard deviation and median of many segments of a signal.
+
+    All segments are reduced at once with np.add.reduceat over the start and end
+    indices, so there is no Python loop over segments. Results equal those of
+    np.mean, np.std and np.median of every slice signal[start:end] (up to rounding),
+    including NaN for empty segments and segments that contain NaN.
+
+    Parameters
+    ----------
+    signal : numpy array
+        The (trimmed) signal of a single trace
+    starts : array_like
+        First index of every segment, in increasing order
+    ends : array_like
+        Index after the last sample of every segment, segments may not overlap
+    median : bool
+        Also compute the median (requires sorting the samples of every segment)
+    shift : float
+        Value subtracted before summing squares, close to the segment means.
+        Default is the median of the first sample of every segment
+    batch_size : int
+        Maximum number of samples sorted at once for the median
+
+    Returns
+    -------
+    SegmentStatistics
+        Named tuple of arrays (start, end, length, mean, std, median)
+    """
+    signal = np.asarray(signal)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    lengths = ends - starts
+    n = len(starts)
+    if n == 0:
+        empty = np.zeros(0)
+        return SegmentStatistics(starts, ends, lengths, empty, empty, empty)
+
+    edges = np.empty(2 * n, dtype=np.int64)
+    edges[0::2] = starts
+    edges[1::2] = ends
+
+    # Shift the signal before summing squares to limit cancellation in the variance,
+    # the extra element allows segments to end at len(signal)
+    if shift is None:
+        shift = np.nanmedian(signal[starts[lengths > 0]]) if np.any(lengths > 0) else 0
+    if not np.isfinite(shift):
+        shift = 0
+    values = np.empty(len(signal) + 1)
+    np.subtract(signal, shift, out=values[:-1])
+    values[-1] = 0
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = _segment_sums(values, edges, lengths) / lengths
+        np.square(values, out=values)
+        variance = _segment_sums(values, edges, lengths) / lengths - mean ** 2
+        std = np.sqrt(np.maximum(variance, 0))
+        std[np.isnan(variance)] = np.nan
+    mean += shift
+
+    if median:
+        segment_median = _segment_median(signal, starts, lengths, batch_size)
+        # Like np.median, any NaN in a segment makes its median NaN
+        values[:-1] = np.isnan(signal)
+        segment_median[_segment_sums(values, edges, lengths) > 0] = np.nan
+    else:
+        segment_median = np.full(n, np.nan)
+    return SegmentStatistics(starts, ends, lengths, mean, std, segment_median)
@@ -4,43 +4,69 @@
 '''
 
 import sqlite3
-import os.path
+import itertools
+import logging
+import time
+from contextlib import nullcontext
+import numpy as np
+from resultsql.connection import connect, transaction, close
+from resultsql import schema
+
+logger = logging.getLogger(__name__)
 
 
 class SQL_database:
+    """
+    Results database, the sqlite connection stays open per thread (see connection.connect).
+    Tables have typed columns, an integer primary key and an index on (Trace, Method), see
+    schema; get_samples, get_columns and drop_trace select a trace and method through it.
+    Use it as a context manager to close the connection afterwards::
+
+        with SQL_database(db_path) as database:
+            with database.transaction():
+                database.add_samples(...)
+    """
     def __init__(self, db_path):
         self.db_path = db_path
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        """Close the connection of this thread to the database"""
+        if self.db_path:
+            close(self.db_path)
+
+    def transaction(self):
+        """Context manager that runs all queries in its with block in a single transaction"""
+        return transaction(self._load_database())
+
     def _push_query(self, query=None, fetch=False, commit=False):
-        print(query)
         if self.db_path:
             conn = self._load_database()
             if not conn:
                 return False
             try:
-                c = conn.cursor()
-                if type(query) == str:
-                    result = c.execute(query)
-                elif type(query) == list:
-                    [c.execute(q) for q in query]
-                if commit:
-                    conn.commit()
-                if fetch:
-                    return [list(i) for i in result.fetchall()]
+                with transaction(conn) if commit else nullcontext():
+                    c = conn.cursor()
+                    if type(query) == str:
+                        result = c.execute(query)
+                    elif type(query) == list:
+                        [c.execute(q) for q in query]
+                    if fetch:
+                        return [list(i) for i in result.fetchall()]
                 return True
             except sqlite3.DatabaseError as e:
                 print(e)
                 return False
-            finally:
-                conn.close()
         return False
 
     def _load_database(self):
-        conn = sqlite3.connect(self.db_path)
         try:
-            c = conn.cursor()
-            c.execute('SELECT name from sqlite_master where type= "table"')
-            return conn
+            return connect(self.db_path, migrate_schema=True)
         except sqlite3.DatabaseError as e:
             print(e)
             return False
@@ -52,11 +78,7 @@ class SQL_database:
         -------
         bool
         """
-        conn = self._load_database()
-        if conn:
-            conn.close()
-            return True
-        return False
+        return bool(self._load_database())
 
     def get_tables(self) -> list:
         """Get all tables in db_path
@@ -76,14 +98,21 @@ class SQL_database:
         table_name : str
             Name of new table
         fields : str
-            Fields string
+            Fields string, see schema.typed_fields
 
         Returns
         -------
         bool
+            False when the table already exists
         """
-        query = "CREATE TABLE " + table_name + " (" + fields + ");"
-        return self._push_query(query=query, fetch=False)
+        conn = self._load_database()
+        if not conn:
+            return False
+        try:
+            return schema.create_table(conn, table_name, fields)
+        except sqlite3.DatabaseError as e:
+            print(e)
+            return False
 
     def get_fields(self, table_name='') -> list:
         """Gets all fields from table_name
@@ -97,13 +126,10 @@ class SQL_database:
         -------
         list
         """
-        query = 'SELECT sql FROM sqlite_master WHERE tbl_name="' + table_name + '" AND type="table";'
-        result = self._push_query(query=query, fetch=True)[0][0]
-        print(result)
-        fields = str(result[result.find("(") + 1:result.find("))")]).split(',')
-        print(fields)
-        field_list = [tuple(i.split(" "))[0] for i in fields]
-        return field_list
+        conn = self._load_database()
+        if not conn:
+            return []
+        return schema.get_fields(conn, table_name)
 
     def add_field(self, table_name='', field_info='') -> bool:
         """Add new field to table
@@ -122,32 +148,63 @@ class SQL_database:
         query = 'ALTER TABLE ' + table_name + ' ADD ' + field_info + ' VARCHAR;'
         return self._push_query(query=query)
 
-    def get_samples(self, table_name='', field_name='*', search_query='*') -> list:
+    def get_samples(self, table_name='', field_name='*', search_query='*', trace=None, method=None) -> list:
         """Get samples of specified table_name and field_name
 
         Parameters
         ----------
         table_name : str
             Table name to insert new field
-        field_name : str
-            Name of field(s) to search
+        field_name : str or list
+            Name of field(s) to search, default '*' for all
         search_query : str
-            Search query, default '*'
+            Only samples of which one of the fields contains the search query, default '*' for all
+        trace : int or list
+            Only the samples of this trace (or these traces), found by index
+        method : str
+            Only the samples of this method, found by index
 
         Returns
         -------
         list
+            All fields of the samples
         """
+        search = None
         if search_query != '*':
-            query = 'SELECT * FROM ' + table_name + ' WHERE '
-            for c, field in enumerate(field_name):
-                query = query + '(' + field + ' LIKE "%' + search_query + '%")'
-                if c != len(field_name) - 1:
-                    query = query + ' OR '
-            query = query + ';'
-        else:
-            query = 'SELECT * FROM ' + table_name + ';'
-        return self._push_query(query=query, fetch=True)
+            if field_name == '*':
+                fields = self.get_fields(table_name)
+            elif isinstance(field_name, str):
+                fields = [field.strip() for field in field_name.split(',')]
+            else:
+                fields = list(field_name)
+            search = (fields, search_query)
+        return self._select(*schema.select(table_name, self.get_fields(table_name), trace, method, search))
+
+    def _insert(self, table_name, fields, rows, batch_size=2**16) -> bool:
+        """Insert rows with bound parameters, batch_size rows per executemany and transaction"""
+        conn = self._load_database()
+        if not conn:
+            return False
+        query = 'INSERT INTO "%s" (%s) VALUES (%s);' % (table_name, ', '.join('"%s"' % f for f in fields),
+                                                       ', '.join('?' * len(fields)))
+        rows = iter(rows)
+        count = 0
+        start = time.perf_counter()
+        try:
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                with transaction(conn):
+                    conn.executemany(query, batch)
+                count += len(batch)
+        except sqlite3.DatabaseError as e:
+            print(e)
+            return False
+        elapsed = time.perf_counter() - start
+        logger.debug('Added %d samples to %s in %.3f s (%.0f samples/s)', count, table_name, elapsed,
+                     count / max(elapsed, 1e-9))
+        return True
 
     def add_sample(self, table_name='', fields=None, data=None) -> bool:
         """Add sample to specified table_name and field_name
@@ -165,20 +222,10 @@ class SQL_database:
         -------
         bool
         """
-        fields_string = ", ".join(["'" + str(i) + "'" for i in fields])
-        data_string = ""
-        for c, i in enumerate(data):
-            if c != 0:
-                data_string += ", "
-            if type(i) == str:
-                data_string += "'" + i + "'"
-            else:
-                data_string += str(i)
-        query = "INSERT INTO '" + table_name + "' (" + fields_string + ") VALUES (" + data_string + ");"
-        return self._push_query(query=query, commit=True)
+        return self._insert(table_name, fields, [_python(data)])
 
     def add_samples(self, table_name='', fields=None, data_list=None) -> bool:
-        """Add sample to specified table_name and field_name
+        """Add samples to specified table_name and field_name
 
         Parameters
         ----------
@@ -186,34 +233,138 @@ class SQL_database:
             Table name to insert new field
         fields : list
             Name of field(s)
-        data : list
-            List of data to add
+        data_list : list
+            List of samples, each a list of data to add
+
+        Returns
+        -------
+        bool
+        """
+        return self._insert(table_name, fields, (_python(data) for data in data_list))
+
+    def add_columns(self, table_name='', fields=None, columns=None, batch_size=2**16) -> bool:
+        """Add samples to specified table_name, given per field as a column
+
+        The values are bound as typed parameters (numpy arrays are converted with tolist), and
+        written with executemany in transactions of batch_size samples.
+
+        Parameters
+        ----------
+        table_name : str
+            Table name to insert the samples
+        fields : list
+            Name of field(s)
+        columns : list
+            For every field an array or list with the values of all samples,
+            or a single value for all samples
+        batch_size : int
+            Number of samples per transaction
 
         Returns
         -------
         bool
         """
-        fields_string = ", ".join(["'" + str(i) + "'" for i in fields])
-        query_data = ""
-        for n, data in enumerate(data_list):
-            data_string = ""
-            for c, i in enumerate(data):
-                if c != 0:
-                    data_string += ", "
-                if type(i) == str:
-                    data_string += "'" + i + "'"
-                else:
-                    data_string += str(i)
-            query_data += '(' + data_string + ')'
-            if n != len(data_list) - 1:
-                query_data += ','
-        query = "INSERT INTO '" + table_name + "' (" + fields_string + ") VALUES " + query_data + ";"
-        return self._push_query(query=query, commit=True)
-
-    def drop_trace(self, table_name='', trace=None) -> bool:
-        if trace:
-            query = "DELETE FROM " + table_name + " WHERE Trace=" + str(trace) + ";"
-            print(query)
-            return self._push_query(query=query, commit=True)
-        else:
-            return False
\ No newline at end of file
+        n = max((len(column) for column in columns if np.ndim(column)), default=1)
+        columns = [np.asarray(column).tolist() if np.ndim(column) else itertools.repeat(column, n)
+                   for column in columns]
+        return self._insert(table_name, fields, zip(*columns), batch_size=batch_size)
+
+    def iter_samples(self, table_name='', field_name='*', trace=None, method=None, page_size=2**14):
+        """Iterate over the samples of table_name in pages, see get_samples
+
+        Every page is a separate (keyset) query of at most page_size samples after the last one, so
+        only one page is in memory and no read is kept open between pages.
+
+        Parameters
+        ----------
+        table_name : str
+            Table name
+        field_name : str or list
+            Name of field(s), default '*' for all
+        trace : int or list
+            Only the samples of this trace (or these traces)
+        method : str
+            Only the samples of this method
+        page_size : int
+            Maximum number of samples per page
+
+        Yields
+        ------
+        list
+            Samples of a page
+        """
+        if field_name == '*':
+            field_name = self.get_fields(table_name)
+        after = 0
+        while True:
+            rows = self._select(*schema.page(table_name, field_name, trace, method, after, page_size))
+            if not rows:
+                return
+            after = rows[-1][0]
+            yield [row[1:] for row in rows]
+            if len(rows) < page_size:
+                return
+
+    def _select(self, query, parameters) -> list:
+        conn = self._load_database()
+        if not conn:
+            return []
+        try:
+            return [list(row) for row in conn.execute(query, parameters)]
+        except sqlite3.DatabaseError as e:
+            print(e)
+            return []
+
+    def get_columns(self, table_name='', fields=None, traces=None, method=None) -> dict:
+        """Load whole columns of table_name as arrays, as NPZ_database.get_columns
+
+        Parameters
+        ----------
+        table_name : str
+            Table name
+        fields : list
+            Fields to load, default all
+        traces : list
+            Traces to load, default all
+        method : str
+            Method to load, default all
+
+        Returns
+        -------
+        dict
+        """
+        fields = self.get_fields(table_name) if fields is None else list(fields)
+        rows = self._select(*schema.select(table_name, fields, traces, method))
+        columns = list(zip(*rows)) if rows else [()] * len(fields)
+        return {field: _array(column) for field, column in zip(fields, columns)}
+
+    def drop_trace(self, table_name='', trace=None, method=None) -> bool:
+        """Delete the samples of a trace (and method) from table_name, found by index"""
+        if trace is None:
+            return False
+        conn = self._load_database()
+        if not conn:
+            return False
+        try:
+            with transaction(conn):
+                conn.execute(*schema.delete(table_name, trace, method))
+            return True
+        except sqlite3.DatabaseError as e:
+            print(e)
+            return False
+
+
+def _python(data) -> list:
+    # Numpy scalars are bound as their Python equivalents (np.float64 already is a float)
+    return [value.item() if isinstance(value, np.generic) else value for value in data]
+
+
+def _array(values) -> np.ndarray:
+    column = np.array(values)
+    if column.dtype == object:
+        # NULL in a REAL column
+        try:
+            column = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+        except (TypeError, ValueError):
+            pass
+    return column
\ No newline at end of file
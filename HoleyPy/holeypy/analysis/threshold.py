@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+Chunked threshold event detection, the engine behind threshold_search
+"""
+from collections import namedtuple
+import numpy as np
+from .segments import SegmentStatistics, segment_statistics
+
+
+ThresholdEvents = namedtuple('ThresholdEvents', ['trace', 'level_0', 'level_1', 'residual_current',
+                                                 'residual_current_sd_2', 'dwell_time', 'event_start', 'event_end'])
+ThresholdEvents.__doc__ = """Columnar result of threshold_search, level_0 and level_1 are SegmentStatistics."""
+
+
+def _empty_statistics() -> SegmentStatistics:
+    index = np.zeros(0, dtype=np.int64)
+    return SegmentStatistics(index, index, index, np.zeros(0), np.zeros(0), np.zeros(0))
+
+
+def empty_events(trace=0) -> ThresholdEvents:
+    """ThresholdEvents without any events"""
+    index = np.zeros(0, dtype=np.int64)
+    return ThresholdEvents(trace, _empty_statistics(), _empty_statistics(), np.zeros(0), np.zeros(0),
+                           np.zeros(0), index, index)
+
+
+def concatenate_events(events, trace=None) -> ThresholdEvents:
+    """Join the columns of several ThresholdEvents, in the given order.
+
+    Parameters
+    ----------
+    events : list
+        ThresholdEvents to join
+    trace : int
+        Trace of the result, default is the trace of the first element
+
+    Returns
+    -------
+    ThresholdEvents
+    """
+    events = list(events)
+    if trace is None:
+        trace = events[0].trace if events else 0
+    if not events:
+        return empty_events(trace)
+    level_0 = SegmentStatistics(*(np.concatenate(c) for c in zip(*(e.level_0 for e in events))))
+    level_1 = SegmentStatistics(*(np.concatenate(c) for c in zip(*(e.level_1 for e in events))))
+    columns = (np.concatenate(c) for c in list(zip(*events))[3:])
+    return ThresholdEvents(trace, level_0, level_1, *columns)
+
+
+def _select(events, index) -> ThresholdEvents:
+    return ThresholdEvents(events.trace,
+                           SegmentStatistics(*(c[index] for c in events.level_0)),
+                           SegmentStatistics(*(c[index] for c in events.level_1)),
+                           *(c[index] for c in events[3:]))
+
+
+def run_lengths(a) -> tuple:
+    """First and last element of every run of consecutive integers in the sorted array a"""
+    a = np.asarray(a, dtype=np.int64)
+    if len(a) == 0:
+        return a, a
+    breaks = np.where(np.diff(a) != 1)[0]
+    return a[np.concatenate(([0], breaks + 1))], a[np.append(breaks, len(a) - 1)]
+
+
+def merge_runs(first, last, skip) -> tuple:
+    """Join runs (first, last) that are at most skip data points apart into blocks.
+
+    Returns the first and last data point of every block, and its number of data points.
+    """
+    count = last - first + 1
+    if skip < 1:
+        # Not even consecutive data points are joined, every data point is a block of its own
+        offsets = np.cumsum(count) - count
+        a = np.arange(int(count.sum()), dtype=np.int64) + np.repeat(first - offsets, count)
+        return a, a.copy(), np.ones(len(a), dtype=np.int64)
+    if len(first) == 0:
+        return first, last, count
+    end = np.append(np.where(first[1:] - last[:-1] > skip)[0], len(first) - 1)
+    start = np.concatenate(([0], end[:-1] + 1))
+    return first[start], last[end], np.add.reduceat(count, start)
+
+
+class DetectionCache:
+    """
+    Intermediate results of threshold detection of one trimmed trace, to repeat the detection
+    with other levels, skip or dwell time without scanning the signal again.
+
+    The first detection stores all data points below a limit somewhat above the threshold
+    (band times the distance between threshold and center), as runs of consecutive data
+    points. Later detections with a threshold up to that limit take their runs from the cache,
+    only a higher threshold scans the signal again. The statistics of every baseline and event
+    segment are kept as well, so that changing skip or dwell time only computes those of the
+    segments that changed. The results are identical to a detection without cache.
+
+    A cache is only valid for a single signal, see Trace.cache_key.
+    """
+    max_segments = 2**20
+
+    def __init__(self, band=0.5):
+        self.band = band
+        self.limit = None
+        self.complete = False
+        self._index, self._amplitude = [], []
+        self._position = 0
+        self._runs = None
+        self._shift = None
+        self._keys = None
+        self._statistics = None
+
+    def runs(self, chunk, start, center, threshold) -> tuple:
+        """Runs (first, last) of the data points of chunk below threshold, chunk starts at start"""
+        stop = start + len(chunk)
+        if self.complete and threshold <= self.limit:
+            if self._runs is None or self._runs[0] != threshold:
+                self._runs = (threshold,) + run_lengths(self._index[self._amplitude < threshold])
+            _, first, last = self._runs
+            # Clip the runs to the chunk, as if they were found in this chunk
+            i0, i1 = np.searchsorted(last, start), np.searchsorted(first, stop)
+            return np.maximum(first[i0:i1], start), np.minimum(last[i0:i1], stop - 1)
+
+        amplitude = abs(chunk)
+        if start == 0:
+            # (Re)start storing the data points below the limit
+            self.limit = threshold + self.band * max(0, abs(center) - threshold)
+            self.complete = False
+            self._index, self._amplitude, self._position, self._runs = [], [], 0, None
+        if start == self._position and isinstance(self._index, list):
+            candidates = np.where(amplitude < self.limit)[0]
+            self._index.append(candidates + start)
+            self._amplitude.append(amplitude[candidates])
+            self._position = stop
+        return run_lengths(np.where(amplitude < threshold)[0] + start)
+
+    def close(self, position) -> None:
+        """The detection reached the end of the signal at position"""
+        if isinstance(self._index, list) and self._position == position:
+            self._index = np.concatenate(self._index) if self._index else np.zeros(0, dtype=np.int64)
+            self._amplitude = np.concatenate(self._amplitude) if self._amplitude else np.zeros(0)
+            self.complete = True
+
+    def statistics(self, signal, starts, ends, offset, shift) -> SegmentStatistics:
+        """segment_statistics of signal[start - offset:end - offset], re-using known segments"""
+        if shift != self._shift or (self._keys is not None and len(self._keys) > self.max_segments):
+            self._shift, self._keys, self._statistics = shift, None, None
+        keys = (starts.astype(np.uint64) << np.uint64(32)) | ends.astype(np.uint64)
+        if self._keys is None or len(self._keys) == 0 or len(keys) == 0:
+            result = segment_statistics(signal, starts - offset, ends - offset, shift=shift)
+            found = np.zeros(len(keys), dtype=bool)
+        else:
+            index = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+            found = self._keys[index] == keys
+            new = segment_statistics(*_gather(signal, starts[~found] - offset, ends[~found] - offset),
+                                     shift=shift)
+            result = SegmentStatistics(*(np.empty(len(keys), dtype=c.dtype) for c in new))
+            for column, known, computed in zip(result, self._statistics, new):
+                column[found] = known[index[found]]
+                column[~found] = computed
+            result = result._replace(start=starts - offset, end=ends - offset)
+
+        # Remember the new segments, sorted by key
+        if not found.all():
+            columns = [c[~found] for c in result]
+            if self._keys is not None:
+                keys = np.concatenate((self._keys, keys[~found]))
+                columns = [np.concatenate(c) for c in zip(self._statistics, columns)]
+            else:
+                keys = keys[~found]
+            order = np.argsort(keys, kind='stable')
+            self._keys = keys[order]
+            self._statistics = SegmentStatistics(*(c[order] for c in columns))
+        return result
+
+
+def _gather(signal, starts, ends) -> tuple:
+    """The samples of the segments signal[start:end] joined, with the segment starts and ends in it"""
+    lengths = np.maximum(ends - starts, 0)
+    new_ends = np.cumsum(lengths)
+    new_starts = new_ends - lengths
+    index = np.arange(int(new_ends[-1]) if len(lengths) else 0, dtype=np.int64)
+    index += np.repeat(starts - new_starts, lengths)
+    return np.asarray(signal)[index], new_starts, new_ends
+
+
+def iter_chunks(signal, chunk_size=2**20, t0=0, t1=-1):
+    """Yield consecutive chunks of signal[t0:t1] as arrays.
+
+    Works for anything that can be sliced, like a numpy memmap or a TraceView,
+    so only one chunk is read into memory at a time.
+
+    Parameters
+    ----------
+    signal : array_like
+        The signal of a single trace
+    chunk_size : int
+        Number of data points per chunk
+    t0 : int
+        The first datapoint to be analysed in the trace.
+    t1 : int
+        The last datapoint to be analysed in the trace (as in threshold_search)
+    """
+    trace_length = len(signal)
+    start, stop, _ = slice(t0, min(trace_length, t1)).indices(trace_length)
+    for i in range(start, stop, chunk_size):
+        yield np.asarray(signal[i:min(i + chunk_size, stop)])
+
+
+class ThresholdDetector:
+    """
+    Threshold event detection on a signal that is fed in chunks.
+
+    Data points below abs(center) - abs(threshold) are grouped into events when they are at
+    most 'skip' apart. An event that is still open at the end of a chunk, and the baseline
+    before it, are carried over to the next chunk. The results are identical to analysing the
+    whole signal at once, memory is bounded by the chunk size plus the longest baseline
+    and event that are still open::
+
+        detector = ThresholdDetector(sampling_period, levels, skip=2)
+        for chunk in iter_chunks(signal):
+            events = detector.feed(chunk)
+        events = detector.close()
+
+    With a DetectionCache, a repeated detection of the same signal re-uses the threshold
+    crossings and segment statistics of the previous one. With a RollingBaseline of the same
+    signal, the threshold follows the baseline instead of the fixed levels.
+    """
+    def __init__(self, sampling_period, levels, dwell_time=0, skip=2, trace=0, t0=0, cache=None, baseline=None):
+        if baseline is not None:
+            self.center = baseline.center
+            self.threshold = None
+            cache = None
+        else:
+            l0, l1 = levels
+            self.center = l0
+            self.threshold = abs(l0) - abs(l1)
+        self.baseline = baseline
+        self.sampling_period = sampling_period
+        self.skip = skip
+        self.trace = trace
+        self.t0 = t0
+        self.cache = cache
+
+        # While the dwell time suggests that also spikes can be seen, at least 2 data points are required to be an event
+        self.n_filter = max(2, int(dwell_time / float(sampling_period)))
+
+        # Number of data points fed so far, and the data points from buffer_start onwards
+        self.position = 0
+        self.buffer = np.zeros(0)
+        self.buffer_start = 0
+
+        # Start of the next baseline (level 0) and the still open block (first, last, count)
+        self.baseline_start = 0
+        self.block = None
+
+        # Events of which the window may still reach beyond the data fed so far
+        self.pending = empty_events(trace)
+
+    def feed(self, chunk) -> ThresholdEvents:
+        """Analyse the next chunk of the signal.
+
+        Returns
+        -------
+        ThresholdEvents
+            All events that were completed by this chunk
+        """
+        chunk = np.asarray(chunk)
+        self.buffer = np.concatenate((self.buffer, chunk)) if len(self.buffer) else chunk
+        start = self.position
+        self.position += len(chunk)
+
+        # Runs of consecutive data points above the threshold
+        if self.baseline is not None:
+            _, threshold = self.baseline.levels(start, self.position)
+            runs = run_lengths(np.where(abs(chunk) < threshold)[0] + start)
+        elif self.cache is not None:
+            runs = self.cache.runs(chunk, start, self.center, self.threshold)
+        else:
+            runs = run_lengths(np.where(abs(chunk) < self.threshold)[0] + start)
+        return self._detect(runs, final=False)
+
+    def close(self) -> ThresholdEvents:
+        """Finish the signal, returns the remaining events"""
+        if self.cache is not None:
+            self.cache.close(self.position)
+        empty = np.zeros(0, dtype=np.int64)
+        return self._detect((empty, empty), final=True)
+
+    def _statistics(self, starts, ends) -> SegmentStatistics:
+        if self.cache is not None:
+            return self.cache.statistics(self.buffer, starts, ends, self.buffer_start, self.center)
+        offset = self.buffer_start
+        return segment_statistics(self.buffer, starts - offset, ends - offset, shift=self.center)
+
+    def _detect(self, runs, final) -> ThresholdEvents:
+        # Blocks of data points that are maximum 'skip' apart
+        first, last, count = merge_runs(*runs, self.skip)
+
+        # Continue the block that was open at the end of the previous chunk
+        if self.block is not None:
+            block_first, block_last, block_count = self.block
+            if len(first) and first[0] - block_last <= self.skip:
+                first[0] = block_first
+                count[0] += block_count
+            else:
+                first = np.insert(first, 0, block_first)
+                last = np.insert(last, 0, block_last)
+                count = np.insert(count, 0, block_count)
+            self.block = None
+
+        # The last block stays open while the next chunk may still extend it
+        if not final and len(last) and self.position - last[-1] <= self.skip:
+            self.block = (first[-1], last[-1], count[-1])
+            first, last, count = first[:-1], last[:-1], count[:-1]
+
+        # Only keep those events that are at least 2 or n_filter data points long
+        idx = np.where(count - 1 > self.n_filter)[0]
+        level_1_start = first[idx].astype(np.int64)
+        level_1_end = last[idx].astype(np.int64)
+
+        # Whenever level 1 starts, level 0 just ended one data point ahead.
+        # An event at the very start of the trace has no baseline (an empty level 0)
+        level_0_start = np.concatenate(([self.baseline_start], level_1_end + 1))
+        if len(level_1_end):
+            self.baseline_start = int(level_0_start[-1])
+        level_0_start = level_0_start[:-1].astype(np.int64)
+        level_0_end = np.maximum(level_1_start - 1, level_0_start)
+
+        level_0 = self._statistics(level_0_start, level_0_end)
+        level_1 = self._statistics(level_1_start, level_1_end)
+
+        # Only the data points from the next baseline onwards are still needed
+        self.buffer = self.buffer[self.baseline_start - self.buffer_start:]
+        self.buffer_start = self.baseline_start
+
+        # Back to positions in the signal, and add the cut-off t0
+        level_0 = level_0._replace(start=level_0_start + self.t0, end=level_0_end + self.t0)
+        level_1 = level_1._replace(start=level_1_start + self.t0, end=level_1_end + self.t0)
+
+        # Calculate the excluded current, variance and dwell time (in seconds)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            residual_current = level_1.mean / level_0.mean
+            residual_current_sd_2 = (residual_current ** 2) * (
+                    ((level_1.std ** 2) / (level_1.mean ** 2)) + ((level_0.std ** 2) / (level_0.mean ** 2)))
+        dwell_time = level_1.length * self.sampling_period
+
+        # Window around each event, extended by the event length on both sides
+        approx_event_length = level_1.end - level_1.start
+        event_start = np.maximum(0, level_1.start - approx_event_length)
+        event_end = level_1.end + approx_event_length
+
+        events = ThresholdEvents(self.trace, level_0, level_1, residual_current, residual_current_sd_2,
+                                 dwell_time, event_start, event_end)
+
+        # Remove events without a (valid) baseline
+        events = concatenate_events([self.pending, _select(events, ~np.isnan(level_0.median))], self.trace)
+
+        # The window is clipped to the length of the analysed signal, which is only known at the end
+        if final:
+            ready = len(events.event_end)
+            events = events._replace(event_end=np.minimum(self.position, events.event_end))
+        else:
+            late = np.where(events.event_end > self.position)[0]
+            ready = late[0] if len(late) else len(events.event_end)
+        self.pending = _select(events, slice(ready, None))
+        return _select(events, slice(0, ready))
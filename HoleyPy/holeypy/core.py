@@ -1,6 +1,7 @@
 from abc import ABC
 
 from .traceloader import load
+from .timeaxis import TimeAxis
 import numpy as np
 
 """
@@ -15,11 +16,7 @@ class Core:
         self.data = load(self.filename)
 
     def time(self):
-        t = 0
-        dt = 1/(self.freq*1000)
-        for _ in self.data[0]:
-            yield t
-            t += dt
+        return TimeAxis(0, 1/(self.freq*1000), len(self.data[0]))
 
 
 class AnalysisBase:
@@ -45,7 +42,7 @@ class AnalysisBaseGui(AnalysisBase, ABC):
     def to_plot(self):
         try:
             y = np.array(self.result)
-            x = np.array(list(self.core.time()))
+            x = np.asarray(self.core.time())
         except ValueError:
             raise ValueError("result cannot be converted to x,y")
         return x, y
@@ -1,6 +1,41 @@
 # -*- coding: utf-8 -*-
 import numpy as np
 
+
+def stitch_traces(signal, t0=0, t1=-1, out=None):
+    """Concatenate the samples [t0:t1] of every trace in a single pass.
+
+    The length of the joined signal is computed before any data is copied, so
+    the output is allocated once and each trace is written straight into it.
+
+    Parameters
+    ----------
+    signal : array_like
+        Array of traces (e.g. a memmap or a list of arrays)
+    t0 : int
+        First sample of every trace to include
+    t1 : int
+        Sample after the last sample to include, negative values count from the end
+    out : numpy array, optional
+        Buffer to write into, must hold exactly the joined number of samples
+
+    Returns
+    -------
+    tuple
+        The joined signal and the start offset (in samples) of every trace in it
+    """
+    window = slice(t0, t1)
+    lengths = np.array([len(range(len(trace))[window]) for trace in signal], dtype=np.int64)
+    bounds = np.concatenate(([0], np.cumsum(lengths)))
+    if out is None:
+        out = np.empty(bounds[-1], dtype=np.float64)
+    elif len(out) != bounds[-1]:
+        raise ValueError('out holds %s samples, the traces hold %s' % (len(out), bounds[-1]))
+    for trace, start, stop in zip(signal, bounds[:-1], bounds[1:]):
+        out[start:stop] = trace[window]
+    return out, bounds[:-1]
+
+
 def join_traces( signal, sampling_period, t0=0, t1=-1 ):
     if (t0>=0) & (t0<=len( signal[0] )):
         t0 = int( t0 / sampling_period )
@@ -10,7 +45,5 @@ def join_traces( signal, sampling_period, t0=0, t1=-1 ):
         t1 = int( t1 / sampling_period )
     else:
         t1 = -1
-    Y = np.array([])
-    for trace in signal:
-        Y = np.concatenate( ( Y, np.array( trace[t0:t1] ) ) )
-    return [Y]
\ No newline at end of file
+    Y, _ = stitch_traces( signal, t0, t1 )
+    return [Y]
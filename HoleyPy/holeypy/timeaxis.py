@@ -0,0 +1,95 @@
+"""
+Provides a lazy time axis for uniformly sampled traces
+"""
+import numpy as np
+
+
+class TimeAxis:
+    """Uniformly sampled time axis.
+
+    Only the first time point, the sampling period and the number of samples are
+    stored. The axis indexes and slices like ``t0 + dt * np.arange(n)``, but that
+    array is only built when a consumer converts the axis with np.asarray().
+
+    Parameters
+    ----------
+    t0 : float
+        Time of the first sample
+    dt : float
+        Sampling period, must be positive
+    n : int
+        Number of samples
+    """
+    __slots__ = ('t0', 'dt', 'n')
+
+    def __init__(self, t0, dt, n):
+        self.t0 = t0
+        self.dt = dt
+        self.n = int(n)
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            samples = range(self.n)[key]
+            return TimeAxis(self.t0 + self.dt * samples.start, self.dt * samples.step, len(samples))
+        index = np.asarray(key)
+        index = np.where(index < 0, index + self.n, index)
+        if np.any((index < 0) | (index >= self.n)):
+            raise IndexError("TimeAxis index out of range")
+        if index.ndim == 0:
+            return self.t0 + self.dt * int(index)
+        return self.t0 + self.dt * index
+
+    def __add__(self, offset):
+        return TimeAxis(self.t0 + offset, self.dt, self.n)
+
+    __radd__ = __add__
+
+    def __sub__(self, offset):
+        return TimeAxis(self.t0 - offset, self.dt, self.n)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.t0 + self.dt * np.arange(self.n, dtype=dtype or np.float64)
+
+    def __repr__(self):
+        return f"TimeAxis(t0={self.t0!r}, dt={self.dt!r}, n={self.n!r})"
+
+    def min(self, *args, **kwargs) -> float:
+        return self[0]
+
+    def max(self, *args, **kwargs) -> float:
+        return self[-1]
+
+    def searchsorted(self, t, side='left'):
+        """Find the sample indices at which times t would be inserted to keep order.
+
+        Equivalent to ``np.searchsorted(np.asarray(axis), t, side)`` without
+        building the array.
+
+        Parameters
+        ----------
+        t : float or array_like
+            Time(s) to look up
+        side : str
+            'left' gives the first sample at or after t, 'right' the first sample after t
+
+        Returns
+        -------
+        int or numpy array
+            Sample index (indices) in the range [0, n]
+        """
+        position = (np.asarray(t, dtype=np.float64) - self.t0) / self.dt
+
+        # Snap times that fall on a sample to it, to absorb floating point error
+        nearest = np.round(position)
+        on_sample = np.isclose(position, nearest, rtol=0, atol=1e-9)
+        if side == 'left':
+            index = np.where(on_sample, nearest, np.ceil(position))
+        elif side == 'right':
+            index = np.where(on_sample, nearest + 1, np.ceil(position))
+        else:
+            raise ValueError(f"side must be 'left' or 'right', not {side!r}")
+        index = np.clip(index, 0, self.n).astype(np.int64)
+        return int(index) if index.ndim == 0 else index
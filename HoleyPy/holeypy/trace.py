@@ -1,4 +1,6 @@
 from . import loaders
+from .timeaxis import TimeAxis
+from .join_traces import stitch_traces
 import numpy as np
 from functools import partial
 import copy
@@ -30,6 +32,9 @@ class Trace:
         self.t1 = -1
         self.filter_stack = [_unfiltered]
         self.optimize_events = False
+        self.adaptive_baseline = None
+        # Intermediate analysis results, by analysis and cache_key
+        self.cache = {}
 
     def __iter__(self):
         for trace in self.data:
@@ -40,6 +45,7 @@ class Trace:
 
     def __setitem__(self, key, value):
         self.data[key] = value
+        self.cache.clear()
 
     def __getitem__(self, item):
         return self.data[item]
@@ -115,19 +121,23 @@ class Trace:
         return np.array(self[i])
 
     @property
-    def time(self) -> np.array:
+    def time(self) -> TimeAxis:
         """
-        Sampling period per second
-        :return: ndarray
+        Time of every sample of the active trace, in seconds
+        :return: TimeAxis, use np.asarray() for an ndarray
         """
-        dt = self.sampling_period
         i = self.active_trace
-        out = []
-        t = 0
-        for _ in range(len(self[i])):
-            out.append(t)
-            t += dt
-        return np.array(out)
+        return TimeAxis(0, self.sampling_period, len(self[i]))
+
+    def cache_key(self, trace=None) -> tuple:
+        """
+        Key of the cached analysis results of a trace, these are only valid
+        for the same trim and filter stack
+        :param trace: trace index, default is the active trace
+        :return: tuple
+        """
+        trace = self.active_trace if trace is None else trace
+        return trace, self.t0, self.t1, tuple(self.filter_stack)
 
     def set_active(self, key) -> None:
         self.active_trace = key
@@ -139,6 +149,20 @@ class Trace:
         self.t0 = int(t0 * self.sampling_frequency)
         self.t1 = int(max(-1, t1 * self.sampling_frequency))
 
+    def set_adaptive_baseline(self, window: float, sigma=3, n_blocks=25) -> None:
+        """
+        Let the event threshold follow a drifting baseline (see RollingBaseline),
+        instead of fixed levels
+        :param window: time in seconds over which the baseline is determined, 0 for fixed levels
+        :param sigma: number of standard deviations of the threshold from the baseline
+        :param n_blocks: number of blocks in a window
+        """
+        if window <= 0:
+            self.adaptive_baseline = None
+            return
+        block_size = max(1, int(window * self.sampling_frequency / n_blocks))
+        self.adaptive_baseline = dict(block_size=block_size, window=n_blocks, sigma=sigma)
+
     def set_dwell_time_cutoff(self, cutoff: float) -> None:
         self.minimal_dwell_time = float(cutoff)
 
@@ -156,7 +180,5 @@ class Trace:
             t1 = int(t1 / sampling_period)
         else:
             t1 = -1
-        Y = np.array([])
-        for trace in signal:
-            Y = np.concatenate((Y, np.array(trace[t0:t1])))
+        Y, _ = stitch_traces(signal, t0, t1)
         return [Y]
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 import os
+import struct
+import multiprocessing
+from collections import namedtuple
 
 from . import csvloader
 from . import axonabf
@@ -34,3 +37,69 @@ def load(filename):
         return eval(_ext_dict[ext]).load(filename)
     except OSError:
         return False
+
+
+TraceIndex = namedtuple('TraceIndex', ['filename', 'n_traces', 'sampling_period', 'samples'])
+TraceIndex.__doc__ = """Lightweight description of a trace file, without its samples."""
+
+
+def index(filename):
+    """Read only the header of a trace file.
+
+    Parameters
+    ----------
+    filename: str
+            File path
+
+    Returns
+    -------
+    TraceIndex
+            Number of traces, sampling period and samples per trace, or False if
+            the file could not be read
+    """
+    _, ext = os.path.splitext(filename)
+    try:
+        return TraceIndex(filename, *eval(_ext_dict[ext]).header(filename))
+    except (OSError, LookupError, ValueError, TypeError, struct.error, ImportError):
+        # Unreadable, malformed or unsupported file, or neo is missing for .abf
+        return False
+
+
+def load_batch(filenames, processes=None, lazy=True):
+    """Index or load many trace files in a process pool.
+
+    Results are yielded as soon as a file is done, in order of completion.
+
+    Parameters
+    ----------
+    filenames: list
+            File paths
+    processes: int
+            Number of worker processes, defaults to the number of cores
+    lazy: bool
+            Only read the headers (see index) instead of loading the traces
+
+    Yields
+    ------
+    tuple
+            (done, total, filename, result), result is as returned by index or load
+    """
+    filenames = list(filenames)
+    total = len(filenames)
+    function = index if lazy else load
+    if processes is None:
+        processes = min(total, os.cpu_count() or 1)
+    if processes <= 1:
+        for done, (filename, result) in enumerate(zip(filenames, map(function, filenames)), 1):
+            yield done, total, filename, result
+        return
+
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.imap_unordered(_batch_worker, [(function, f) for f in filenames])
+        for done, (filename, result) in enumerate(results, 1):
+            yield done, total, filename, result
+
+
+def _batch_worker(args):
+    function, filename = args
+    return filename, function(filename)
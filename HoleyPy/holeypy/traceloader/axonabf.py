@@ -1,5 +1,6 @@
 try:
     from neo.io import AxonIO
+    from neo.rawio import AxonRawIO
     import numpy as np
     _state = True
 except ModuleNotFoundError:
@@ -37,3 +38,32 @@ def load(filename):
         return signal, sampling_period
     except:
         print("Unable to load .abf file")
+
+
+def header(filename):
+    """Read the header of an axon binary file, leaving the samples on disk.
+
+    Parameters
+    ----------
+    filename : str
+        String with the location of the axon binary file
+
+    Returns
+    -------
+    tuple
+        The number of traces, the sampling period and a list with the number of samples per trace
+
+    Raises
+    ------
+    ImportError
+        If neo is not installed
+
+    """
+    if not _state:
+        raise ImportError("Reading .abf files requires neo")
+    reader = AxonRawIO(filename=filename)
+    reader.parse_header()
+    n_traces = reader.segment_count(0)
+    sampling_period = 1 / reader.get_signal_sampling_rate(stream_index=0)
+    samples = [reader.get_signal_size(0, seg, stream_index=0) for seg in range(n_traces)]
+    return n_traces, sampling_period, samples
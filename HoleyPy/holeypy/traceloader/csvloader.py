@@ -25,3 +25,22 @@ def load(filename, delimiter=''):
     """
 
     return [np.genfromtxt(filename, delimiter=delimiter)]
+
+
+def header(filename, delimiter=''):
+    """Function to describe .csv files.
+
+    A .csv file holds a single trace without timing information, so it is read in full.
+
+    Parameters
+    ----------
+    filename: str
+            File path
+
+    Returns
+    -------
+    tuple
+            The number of traces, the sampling period (None) and the number of samples per trace
+    """
+    signal = load(filename, delimiter)
+    return len(signal), None, [len(trace) for trace in signal]
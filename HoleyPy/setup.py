@@ -9,7 +9,8 @@ setup(
         'numpy >= 1.18.2',
         'scipy >= 1.4.1',
         'h5py >= 2.10.0',
-        'neo >= 0.8.0'
+        'neo >= 0.8.0',
+        'ResultSQL'
     ],
     extra_requires={
         "Axon": 'neo >= 0.8.0'
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+The batched fit (fit_batch) against the fit of every event by curve_fit (fit_windows)
+"""
+import warnings
+import numpy as np
+import pytest
+from holeypy.analysis.fitting import fit_batch, fit_windows
+from holeypy.analysis.fitting_functions import gNDF, Adept
+from holeypy.analysis.events import _fit_windows
+
+SAMPLING_PERIOD = 1e-5
+
+
+@pytest.fixture(scope='module')
+def events():
+    """Signal of 300 synthetic events of 10-60 data points, with their windows and guesses"""
+    rng = np.random.default_rng(5)
+    signal, windows, guesses = [], [], []
+    position = 0
+    for length in rng.integers(10, 60, 300):
+        y = 100 + 2 * rng.standard_normal(3 * length)
+        y[length:2 * length] = 40 + 2 * rng.standard_normal(length)
+        signal.append(y)
+        windows.append((position, position + 3 * length))
+        guesses.append(dict(I0=100., I1=40., start=(position + length) * SAMPLING_PERIOD,
+                            end=(position + 2 * length) * SAMPLING_PERIOD))
+        position += 3 * length
+    return np.concatenate(signal), windows, guesses
+
+
+def _cost(func, signal, window):
+    start, end = window
+    x = np.arange(start, end) * SAMPLING_PERIOD
+    return np.sum((func.model(x, *func.popt) + np.abs(signal[start:end])) ** 2)
+
+
+def _fit(signal, windows, guesses, class_function):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        reference = [func for _, func in fit_windows(signal, windows, SAMPLING_PERIOD, class_function,
+                                                     guesses=guesses, processes=1, timeout=None)]
+        batch = fit_batch(signal, windows, SAMPLING_PERIOD, class_function, guesses=guesses)
+    return reference, batch
+
+
+def test_gndf_batch_cost_per_event(events):
+    signal, windows, guesses = events
+    reference, batch = _fit(signal, windows, guesses, gNDF)
+    both = [i for i in range(len(windows)) if reference[i] is not None and batch[i] is not None]
+    # curve_fit runs out of evaluations (maxfev) on some events, the batch should not
+    assert sum(func is not None for func in batch) >= sum(func is not None for func in reference)
+    assert both
+    ratio = np.array([_cost(batch[i], signal, windows[i]) / _cost(reference[i], signal, windows[i]) for i in both])
+    assert np.all(ratio < 1.05), 'events %s' % np.where(ratio >= 1.05)[0]
+
+
+def test_adept_is_not_batched(events):
+    signal, windows, guesses = events
+    windows, guesses = windows[:20], guesses[:20]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        batch = _fit_windows(signal, 0, windows, guesses, SAMPLING_PERIOD, Adept, batch=True)
+        reference = _fit_windows(signal, 0, windows, guesses, SAMPLING_PERIOD, Adept, batch=False)
+    assert not Adept.batch_fit
+    assert len(batch) == len(reference)
+    assert np.allclose([row[4:] for row in batch], [row[4:] for row in reference], rtol=1e-9, atol=0)
+    with pytest.raises(ValueError):
+        fit_batch(signal, windows, SAMPLING_PERIOD, Adept, guesses=guesses)
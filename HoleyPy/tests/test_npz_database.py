@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+Pages of the columnar store (NPZ_database.get_page) against slices of all its samples
+"""
+import numpy as np
+import pytest
+from holeypy.analysis.npz_database import NPZ_database
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Three traces, the second written in two parts, with a column of event windows"""
+    database = NPZ_database(str(tmp_path / 'results.events'))
+    database.make_database()
+    database.add_table('results', ['Trace', 'Method', 'Ires', 'Event_index'])
+    rng = np.random.default_rng(1)
+    for trace, n in [(0, 7), (1, 5), (1, 4), (2, 9)]:
+        start = rng.integers(0, 1000, n)
+        database.add_columns('results', ['Trace', 'Method', 'Ires', 'Event_index'],
+                             [trace, 'Threshold', rng.random(n), np.stack([start, start + 10], axis=1)])
+    return database
+
+
+@pytest.mark.parametrize('offset, limit', [(0, 1), (3, 2), (6, 3), (7, 5), (11, 100), (24, 2), (25, 1)])
+def test_page_matches_samples(database, offset, limit):
+    samples = database.get_samples('results')
+    assert len(samples) == 25
+    assert database.get_page('results', offset=offset, limit=limit) == samples[offset:offset + limit]
+    assert (database.get_page('results', field_name='Ires, Trace', offset=offset, limit=limit)
+            == database.get_samples('results', field_name='Ires, Trace')[offset:offset + limit])
+
+
+def test_page_with_search(database):
+    samples = database.get_samples('results', search_query='1')
+    assert database.get_page('results', search_query='1', offset=2, limit=4) == samples[2:6]
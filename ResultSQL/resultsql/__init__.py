@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+'''
+    Storage of the results databases: the sqlite layer (connection, schema) and the columnar
+    NPZ store (npz). Used by both PySential (default_modules.sql_database, npz_database) and
+    HoleyPy (analysis.SQL_database, NPZ_database), so that neither imports the other.
+'''
+from . import connection, schema, npz
+
+__all__ = ['connection', 'schema', 'npz']
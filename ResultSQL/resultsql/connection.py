@@ -0,0 +1,128 @@
+'''
+    Persistent sqlite connections, shared by PySential's sql_database and holeypy's SQL_database.
+'''
+
+import os
+import atexit
+import sqlite3
+import threading
+from contextlib import contextmanager
+from .schema import migrate
+
+
+# Write ahead logging lets readers continue while results are written, NORMAL synchronisation
+# is safe with WAL and avoids a sync on every commit
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('temp_store', 'MEMORY'),
+    ('cache_size', -65536),
+    ('mmap_size', 2**28),
+)
+
+_local = threading.local()
+
+# All open connections (with the process that opened them), to close them at exit (see close_all)
+_open = set()
+_open_lock = threading.Lock()
+
+
+def _connections() -> dict:
+    # A (forked) worker process must not use the connections of its parent, it opens its own
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.pid = os.getpid()
+        _local.connections = {}
+        _local.migrated = set()
+    return _local.connections
+
+
+def connect(db_path, create=True, migrate_schema=False) -> sqlite3.Connection:
+    """Connection of this thread to the database in db_path.
+
+    The connection is opened and tuned (see PRAGMAS) on first use, and then kept open for the
+    next queries of this thread until close(). It runs in autocommit mode, use transaction()
+    to group statements.
+
+    Parameters
+    ----------
+    db_path : str
+        File path of the database
+    create : bool
+        Create the database if it does not exist, otherwise return None
+    migrate_schema : bool
+        Bring the results schema up to date (see schema.migrate), only for results databases
+
+    Returns
+    -------
+    sqlite3.Connection
+        Raises sqlite3.DatabaseError when the file is not a database
+    """
+    key = os.path.abspath(db_path)
+    connections = _connections()
+    conn = connections.get(key)
+    if conn is None:
+        if not create and not os.path.exists(db_path):
+            return None
+        # Only used by this thread, but close_all may close it from another one at exit
+        conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        try:
+            conn.execute('SELECT name from sqlite_master where type= "table"')
+            for name, value in PRAGMAS:
+                conn.execute('PRAGMA %s=%s' % (name, value))
+        except sqlite3.DatabaseError:
+            conn.close()
+            raise
+        connections[key] = conn
+        with _open_lock:
+            _open.add((os.getpid(), conn))
+    if migrate_schema and key not in _local.migrated:
+        migrate(conn)
+        _local.migrated.add(key)
+    return conn
+
+
+@contextmanager
+def transaction(conn):
+    """Run the statements of the with block in a single transaction.
+
+    The transaction is committed at the end of the block, or rolled back on an exception.
+    A nested block is part of the outer transaction.
+    """
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute('BEGIN')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def close(db_path=None) -> None:
+    """Close the connection of this thread to db_path, or all its connections"""
+    connections = _connections()
+    keys = list(connections) if db_path is None else [os.path.abspath(db_path)]
+    for key in keys:
+        conn = connections.pop(key, None)
+        _local.migrated.discard(key)
+        if conn is not None:
+            with _open_lock:
+                _open.discard((os.getpid(), conn))
+            conn.close()
+
+
+@atexit.register
+def close_all() -> None:
+    """Close the connections of all threads of this process, which are otherwise only closed
+    by close() in their own thread"""
+    pid = os.getpid()
+    with _open_lock:
+        connections = [conn for owner, conn in _open if owner == pid]
+        _open.clear()
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
@@ -0,0 +1,428 @@
+'''
+    Columnar event store, with the same interface as holeypy's SQL_database.
+'''
+
+import itertools
+import json
+import os
+import re
+import zipfile
+import numpy as np
+from contextlib import nullcontext
+
+
+def _trace_key(trace) -> str:
+    return 'none' if trace is None else str(int(trace))
+
+
+class NPZ_database:
+    """
+    Results database that stores every table as typed numpy columns.
+
+    A database is a directory with a directory per table. Samples are appended per trace as
+    a part file (<table>/trace_<trace>_<part>.npz) with one .npy member per column, so whole
+    columns are loaded without parsing (get_columns) and a trace is replaced by removing its
+    parts (drop_trace). Integer and text columns are compressed, float columns (noisy
+    currents, which hardly compress) are stored as is, see compress.
+    """
+    # Directory name next to the trace file (see Events), apart from its sqlite database
+    suffix = '.events'
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        """Nothing is kept open, for compatibility with SQL_database"""
+
+    def transaction(self):
+        """Every part is written at once, for compatibility with SQL_database"""
+        return nullcontext()
+
+    @staticmethod
+    def compress(field, column) -> bool:
+        """Whether a column is stored compressed"""
+        return column.dtype.kind in 'iubUS'
+
+    def _table_path(self, table_name) -> str:
+        return os.path.join(self.db_path, table_name)
+
+    def _schema(self, table_name) -> list:
+        path = os.path.join(self._table_path(table_name), 'schema.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)['fields']
+
+    def _write_schema(self, table_name, fields) -> None:
+        with open(os.path.join(self._table_path(table_name), 'schema.json'), 'w') as f:
+            json.dump({'fields': fields}, f)
+
+    def _parts(self, table_name, traces=None) -> list:
+        """Part files of the traces, in order of trace and part"""
+        parts = []
+        if not os.path.isdir(self._table_path(table_name)):
+            return parts
+        pattern = re.compile(r'trace_(none|\d+)_(\d+)\.npz$')
+        for name in os.listdir(self._table_path(table_name)):
+            match = pattern.match(name)
+            if match:
+                trace = None if match.group(1) == 'none' else int(match.group(1))
+                if traces is None or trace in traces:
+                    parts.append((-1 if trace is None else trace, int(match.group(2)), name))
+        return [os.path.join(self._table_path(table_name), name) for _, _, name in sorted(parts)]
+
+    def _fields(self, table_name, field_name) -> list:
+        if field_name == '*':
+            return self._schema(table_name) or []
+        if isinstance(field_name, str):
+            return [field.strip() for field in field_name.split(',')]
+        return list(field_name)
+
+    def make_database(self) -> bool:
+        """Makes a new database in db_path
+
+        Returns
+        -------
+        bool
+        """
+        os.makedirs(self.db_path, exist_ok=True)
+        return True
+
+    def get_tables(self) -> list:
+        """Get all tables in db_path
+
+        Returns
+        -------
+        list
+        """
+        if not os.path.isdir(self.db_path):
+            return []
+        return sorted(name for name in os.listdir(self.db_path) if self._schema(name) is not None)
+
+    def add_table(self, table_name='', fields='') -> bool:
+        """Add new table to db_path
+
+        Parameters
+        ----------
+        table_name : str
+            Name of new table
+        fields : str
+            Fields string (as for SQL_database, types are taken from the data) or list of field names
+
+        Returns
+        -------
+        bool
+            False when the table already exists
+        """
+        if self._schema(table_name) is not None:
+            return False
+        if isinstance(fields, str):
+            fields = [field.strip().split(' ')[0] for field in fields.split(',') if field.strip()]
+        os.makedirs(self._table_path(table_name), exist_ok=True)
+        self._write_schema(table_name, list(fields))
+        return True
+
+    def get_fields(self, table_name='') -> list:
+        """Gets all fields from table_name
+
+        Parameters
+        ----------
+        table_name : str
+            Table name to search for fields
+
+        Returns
+        -------
+        list
+        """
+        return list(self._schema(table_name) or [])
+
+    def add_field(self, table_name='', field_info='') -> bool:
+        """Add new field to table, it is empty for the samples already in the table
+
+        Parameters
+        ----------
+        table_name : str
+            Table name to insert new field
+        field_info : str
+            Field information
+
+        Returns
+        -------
+        bool
+        """
+        fields = self._schema(table_name)
+        if fields is None:
+            return False
+        self._write_schema(table_name, fields + [field_info.strip().split(' ')[0]])
+        return True
+
+    def add_columns(self, table_name='', fields=None, columns=None, **kwargs) -> bool:
+        """Append samples to table_name, given per field as a column
+
+        The samples are stored per trace (the 'Trace' field), each call adds a part file.
+
+        Parameters
+        ----------
+        table_name : str
+            Table name to insert the samples
+        fields : list
+            Name of field(s)
+        columns : list
+            For every field an array or list with the values of all samples,
+            or a single value for all samples
+
+        Returns
+        -------
+        bool
+        """
+        schema = self._schema(table_name)
+        if schema is None:
+            print('no such table: %s' % table_name)
+            return False
+        n = max((len(column) for column in columns if np.ndim(column)), default=1)
+        columns = {field: _typed(column if np.ndim(column) else [column] * n)
+                   for field, column in zip(fields, columns)}
+        missing = [field for field in fields if field not in schema]
+        if missing:
+            print('table %s has no column named %s' % (table_name, missing[0]))
+            return False
+
+        trace = columns.get('Trace')
+        traces = [None] if trace is None else np.unique(trace)
+        for value in traces:
+            index = slice(None) if value is None else trace == value
+            self._write_part(table_name, None if value is None else value, {f: c[index] for f, c in columns.items()})
+        return True
+
+    def _write_part(self, table_name, trace, columns) -> None:
+        key = _trace_key(trace)
+        numbers = [int(re.search(r'_(\d+)\.npz$', path).group(1)) for path in self._parts(table_name)
+                   if os.path.basename(path).startswith('trace_%s_' % key)]
+        path = os.path.join(self._table_path(table_name), 'trace_%s_%d.npz' % (key, max(numbers, default=-1) + 1))
+
+        # Written to a temporary file first, so that a part is either complete or absent
+        with zipfile.ZipFile(path + '.tmp', 'w', allowZip64=True) as archive:
+            for field, column in columns.items():
+                info = zipfile.ZipInfo(field + '.npy')
+                info.compress_type = zipfile.ZIP_DEFLATED if self.compress(field, column) else zipfile.ZIP_STORED
+                with archive.open(info, 'w', force_zip64=True) as f:
+                    np.lib.format.write_array(f, column, allow_pickle=False)
+        os.replace(path + '.tmp', path)
+
+    def add_sample(self, table_name='', fields=None, data=None) -> bool:
+        """Add sample to specified table_name and field_name, see add_columns"""
+        return self.add_samples(table_name, fields, [data])
+
+    def add_samples(self, table_name='', fields=None, data_list=None) -> bool:
+        """Add samples to specified table_name and field_name, see add_columns
+
+        Parameters
+        ----------
+        table_name : str
+            Table name to insert new field
+        fields : list
+            Name of field(s)
+        data_list : list
+            List of samples, each a list of data to add
+
+        Returns
+        -------
+        bool
+        """
+        if not data_list:
+            return True
+        return self.add_columns(table_name, fields, [list(column) for column in zip(*data_list)])
+
+    def get_columns(self, table_name='', fields=None, traces=None) -> dict:
+        """Load whole columns of table_name, in order of trace
+
+        Parameters
+        ----------
+        table_name : str
+            Table name
+        fields : list
+            Fields to load, default all
+        traces : list
+            Traces to load, default all
+
+        Returns
+        -------
+        dict
+            An array per field, NaN where a part has no data for the field
+        """
+        schema = self._schema(table_name) or []
+        fields = schema if fields is None else list(fields)
+        parts = {field: [] for field in fields}
+        for path in self._parts(table_name, traces):
+            for field, column in _read(path, fields).items():
+                parts[field].append(column)
+        return {field: _concatenate(columns) for field, columns in parts.items()}
+
+    def get_samples(self, table_name='', field_name='*', search_query='*') -> list:
+        """Get samples of specified table_name and field_name
+
+        Parameters
+        ----------
+        table_name : str
+            Table name
+        field_name : str
+            Name of field(s), '*' for all
+        search_query : str
+            Only samples of which a field contains the search query, default '*' for all
+
+        Returns
+        -------
+        list
+        """
+        return [row for page in self.iter_samples(table_name, field_name, search_query, page_size=None)
+                for row in page]
+
+    def iter_samples(self, table_name='', field_name='*', search_query='*', page_size=2**14):
+        """Iterate over the samples of table_name in pages, see get_samples
+
+        The parts are loaded one by one, so at most one part is in memory.
+
+        Parameters
+        ----------
+        table_name : str
+            Table name
+        field_name : str
+            Name of field(s), '*' for all
+        search_query : str
+            Only samples of which a field contains the search query, default '*' for all
+        page_size : int
+            Maximum number of samples per page, None for a page per part
+
+        Yields
+        ------
+        list
+            Samples of a page
+        """
+        fields = self._fields(table_name, field_name)
+        for path in self._parts(table_name):
+            columns = _shown(_read(path, fields))
+            if not columns:
+                return
+            if search_query != '*':
+                query = search_query.lower()
+                match = np.zeros(len(columns[0]), dtype=bool)
+                for column in columns:
+                    match |= np.char.find(np.char.lower(column.astype(str)), query) >= 0
+                columns = [column[match] for column in columns]
+            n = len(columns[0])
+            for start in range(0, n, page_size or max(n, 1)):
+                yield [list(row) for row in zip(*(column[start:start + (page_size or n)].tolist()
+                                                  for column in columns))]
+
+    def get_page(self, table_name='', field_name='*', search_query='*', offset=0, limit=1000) -> list:
+        """Get a page of samples of table_name, for random access, see get_samples
+
+        Without a search query, the parts before the page are skipped by their length and only
+        the parts of the page are loaded.
+
+        Parameters
+        ----------
+        table_name : str
+            Table name
+        field_name : str
+            Name of field(s), '*' for all
+        search_query : str
+            Only samples of which a field contains the search query, default '*' for all
+        offset : int
+            Number of samples before the page
+        limit : int
+            Maximum number of samples in the page
+
+        Returns
+        -------
+        list
+        """
+        if search_query != '*':
+            samples = (row for page in self.iter_samples(table_name, field_name, search_query, page_size=None)
+                       for row in page)
+            return list(itertools.islice(samples, offset, offset + limit))
+        fields = self._fields(table_name, field_name)
+        page = []
+        for path in self._parts(table_name):
+            if len(page) >= limit:
+                break
+            with np.load(path, allow_pickle=False) as data:
+                n = _length(data)
+            if offset >= n:
+                offset -= n
+                continue
+            columns = [column[offset:offset + limit - len(page)] for column in _shown(_read(path, fields))]
+            page.extend(list(row) for row in zip(*(column.tolist() for column in columns)))
+            offset = 0
+        return page
+
+    def drop_trace(self, table_name='', trace=None) -> bool:
+        if trace is None or self._schema(table_name) is None:
+            return False
+        for path in self._parts(table_name, [int(trace)]):
+            os.remove(path)
+        return True
+
+
+def _typed(column) -> np.ndarray:
+    """Column as an int64, float64 or text array"""
+    column = np.asarray(column)
+    if column.dtype.kind in 'iub':
+        return column.astype(np.int64)
+    if column.dtype.kind == 'f':
+        return column.astype(np.float64)
+    if column.dtype.kind in 'US':
+        return column
+    # Mixed values, like None in a float column
+    try:
+        return np.array([np.nan if value is None else value for value in column], dtype=np.float64)
+    except (TypeError, ValueError):
+        return column.astype(str)
+
+
+def _read(path, fields) -> dict:
+    """Columns of a part file, NaN for the fields that it has no data for"""
+    with np.load(path, allow_pickle=False) as data:
+        # Only the requested members are read
+        n = _length(data)
+        return {field: data[field] if field in data.files else np.full(n, np.nan) for field in fields}
+
+
+def _length(data) -> int:
+    """Number of samples in a part, from the .npy header of its first member"""
+    if not data.files:
+        return 0
+    with data.zip.open(data.files[0] + '.npy') as f:
+        if np.lib.format.read_magic(f) == (1, 0):
+            return np.lib.format.read_array_header_1_0(f)[0][0]
+        return np.lib.format.read_array_header_2_0(f)[0][0]
+
+
+def _shown(part) -> list:
+    """Columns of a part as shown in a table: columns of pairs, like the event windows, as
+    'start;end' as in SQL_database"""
+    return [_joined(column) if column.ndim > 1 else column for column in part.values()]
+
+
+def _joined(column) -> np.ndarray:
+    return np.array([';'.join(str(value) for value in row) for row in column.tolist()], dtype=str)
+
+
+def _concatenate(columns) -> np.ndarray:
+    if not columns:
+        return np.zeros(0)
+    # Parts without data for a column of pairs are filled with (NaN, NaN)
+    trailing = max((column.shape[1:] for column in columns), key=len)
+    columns = [column if column.shape[1:] == trailing else
+               np.broadcast_to(column.reshape((-1,) + (1,) * len(trailing)), (len(column),) + trailing)
+               for column in columns]
+    kinds = {column.dtype.kind for column in columns}
+    if len(kinds) > 1 and kinds & {'U', 'S'}:
+        columns = [column.astype(str) for column in columns]
+    return np.concatenate(columns)
@@ -0,0 +1,179 @@
+'''
+    Schema of the results database: column types, primary key, indexes and versions.
+'''
+
+import sqlite3
+
+# Stored in PRAGMA user_version, 0 is a database of before the schema (untyped float(53) columns)
+SCHEMA_VERSION = 1
+
+# Columns that are not REAL
+COLUMN_TYPES = {
+    'Method': 'TEXT',
+    'Trace': 'INTEGER',
+    'Function': 'TEXT',
+    'Fitting_parameters': 'TEXT',
+    'Event_index': 'TEXT',
+}
+
+# Every table has an integer primary key, the results of one trace (and method) are found by index
+PRIMARY_KEY = 'Id'
+INDEX = ('Trace', 'Method')
+
+
+def column_type(field) -> str:
+    return COLUMN_TYPES.get(field, 'REAL')
+
+
+def typed_fields(fields) -> str:
+    """Fields string for add_table, with the type of every field"""
+    return ', '.join('%s %s' % (field, column_type(field)) for field in fields)
+
+
+def table_info(conn, table_name) -> list:
+    """Names of all columns of table_name, in order, including the primary key"""
+    return [row[1] for row in conn.execute('PRAGMA table_info("%s");' % table_name)]
+
+
+def is_results_table(table_name) -> bool:
+    """Whether table_name is one of the tables of HoleyPy results (results, results_<function>)"""
+    return table_name == 'results' or table_name.startswith('results_')
+
+
+def get_fields(conn, table_name) -> list:
+    """Names of the columns of table_name, in order. The integer primary key (Id) of a results
+    table only numbers the samples and is left out"""
+    fields = conn.execute('PRAGMA table_info("%s");' % table_name).fetchall()
+    hidden = is_results_table(table_name)
+    return [name for _, name, column_type, _, _, key in fields
+            if not (hidden and key and name == PRIMARY_KEY and column_type.upper() == 'INTEGER')]
+
+
+def create_index(conn, table_name) -> None:
+    """Index of table_name on (Trace, Method), on the part of them that it has"""
+    fields = get_fields(conn, table_name)
+    columns = [field for field in INDEX if field in fields]
+    if columns:
+        conn.execute('CREATE INDEX IF NOT EXISTS "%s_%s" ON "%s" (%s);' % (
+            table_name, '_'.join(columns), table_name, ', '.join('"%s"' % c for c in columns)))
+
+
+def create_table(conn, table_name, fields) -> bool:
+    """Create table_name with a primary key and the index, see add_table of SQL_database
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Connection to the database
+    table_name : str
+        Name of the table
+    fields : str
+        Fields string, like typed_fields
+
+    Returns
+    -------
+    bool
+        False when the table already exists
+    """
+    if table_info(conn, table_name):
+        return False
+    if not fields.split(' ')[0].strip() == PRIMARY_KEY:
+        fields = '%s INTEGER PRIMARY KEY, %s' % (PRIMARY_KEY, fields)
+    conn.execute('CREATE TABLE "%s" (%s);' % (table_name, fields))
+    create_index(conn, table_name)
+    return True
+
+
+def where(trace=None, method=None, search=None) -> tuple:
+    """WHERE clause and parameters that select a trace (or list of traces) and method,
+    and with search=(fields, query) the samples of which a field contains the query"""
+    conditions, parameters = [], []
+    if trace is not None:
+        traces = [trace] if isinstance(trace, (int, float)) or not hasattr(trace, '__len__') else list(trace)
+        conditions.append('Trace IN (%s)' % ', '.join('?' * len(traces)))
+        parameters.extend(int(t) for t in traces)
+    if method is not None:
+        conditions.append('Method = ?')
+        parameters.append(method)
+    if search is not None:
+        fields, query = search
+        conditions.append('(%s)' % ' OR '.join('"%s" LIKE ?' % field for field in fields))
+        parameters.extend(['%' + query + '%'] * len(fields))
+    return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), parameters
+
+
+def select(table_name, fields='*', trace=None, method=None, search=None, limit=None, offset=0) -> tuple:
+    """Query and parameters to select fields of a trace and method (see where), in order of
+    insertion, with limit at most limit samples after the first offset (LIMIT/OFFSET paging)"""
+    if not isinstance(fields, str):
+        fields = ', '.join('"%s"' % field for field in fields)
+    clause, parameters = where(trace, method, search)
+    if limit is not None:
+        clause += ' ORDER BY rowid LIMIT ? OFFSET ?'
+        parameters += [limit, offset]
+    else:
+        clause += ' ORDER BY rowid'
+    return 'SELECT %s FROM "%s"%s;' % (fields, table_name, clause), parameters
+
+
+def page(table_name, fields='*', trace=None, method=None, after=0, limit=2**14, search=None) -> tuple:
+    """Query and parameters of the next page (keyset paging): the rowid and fields of at most
+    limit samples after rowid 'after', in order of insertion"""
+    if not isinstance(fields, str):
+        fields = ', '.join('"%s"' % field for field in fields)
+    clause, parameters = where(trace, method, search)
+    clause = (clause + ' AND ' if clause else ' WHERE ') + 'rowid > ?'
+    return 'SELECT rowid, %s FROM "%s"%s ORDER BY rowid LIMIT ?;' % (fields, table_name, clause), \
+        parameters + [after, limit]
+
+
+def delete(table_name, trace=None, method=None) -> tuple:
+    """Query and parameters to delete the samples of a trace and method"""
+    clause, parameters = where(trace, method)
+    return 'DELETE FROM "%s"%s;' % (table_name, clause), parameters
+
+
+def _migrate_0(conn) -> None:
+    # Tables of results had untyped columns and no key, they are copied into typed tables.
+    # Other tables in the database are left as they are
+    tables = [row[0] for row in conn.execute('SELECT name FROM sqlite_master WHERE type="table";')]
+    for table_name in tables:
+        fields = table_info(conn, table_name)
+        if not is_results_table(table_name) or not {'Method', 'Trace'} <= set(fields) or PRIMARY_KEY in fields:
+            continue
+        columns = ', '.join('"%s"' % field for field in fields)
+        conn.execute('CREATE TABLE "%s_v1" (%s INTEGER PRIMARY KEY, %s);' % (table_name, PRIMARY_KEY,
+                                                                            typed_fields(fields)))
+        conn.execute('INSERT INTO "%s_v1" (%s) SELECT %s FROM "%s" ORDER BY rowid;' % (
+            table_name, columns, columns, table_name))
+        conn.execute('DROP TABLE "%s";' % table_name)
+        conn.execute('ALTER TABLE "%s_v1" RENAME TO "%s";' % (table_name, table_name))
+        create_index(conn, table_name)
+
+
+# Migration from every version to the next
+MIGRATIONS = {0: _migrate_0}
+
+
+def migrate(conn) -> int:
+    """Bring the results database up to SCHEMA_VERSION, every migration in a transaction.
+    Only for results databases, see connection.connect
+
+    Returns
+    -------
+    int
+        The version of the database, which is newer than SCHEMA_VERSION when it was
+        written by a later release (it is then left as it is)
+    """
+    version = conn.execute('PRAGMA user_version;').fetchone()[0]
+    while version < SCHEMA_VERSION:
+        conn.execute('BEGIN')
+        try:
+            MIGRATIONS[version](conn)
+            version += 1
+            conn.execute('PRAGMA user_version=%d;' % version)
+        except sqlite3.DatabaseError:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+    return version
@@ -0,0 +1,9 @@
+from setuptools import setup
+
+setup(
+    name="ResultSQL",
+    version="v0.0.1",
+    author=["Florian L.R. Lucas"],
+    packages=["resultsql"],
+    python_requires='>=3.7',
+)
@@ -33,12 +33,31 @@ class DatabaseManager:
         text
     add_sample(self, table_name='', fields=None, data=None) -> bool
         text
+    iter_sample(table_name='', field_name='*', page_size=1000)
+        Iterates over the samples in pages, with the search_query filter
+    get_page(table_name='', field_name='*', offset=0, limit=1000) -> list
+        A page of samples, with the search_query filter
+    get_columns(table_name='', fields=None, traces=None) -> dict
+        Loads whole columns as arrays, if the module stores columns
+    close -> None
+        Closes the connection to db_path, if the module keeps one open
     """
     def __init__(self, db_module=None, db_path=None):
         self.db_path = db_path
         self.module = db_module
         self.search_query = '*'
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        """Closes the connection to db_path, if the module keeps one open"""
+        if hasattr(self.module, 'close_database'):
+            self.module.close_database(db_path=self.db_path)
+
     def set_query(self, search_query: str) -> None:
         """Sets the active search query
 
@@ -181,6 +200,54 @@ class DatabaseManager:
                 )
         return samples
 
+    def iter_sample(self, table_name='', field_name='*', page_size=1000):
+        """Iterates over the samples of table_name in pages, with the search_query filter, see get_sample
+
+        Modules without paged reads give all samples as a single page
+
+        Parameters
+        ----------
+        table_name : str
+            Name of table to search
+        field_name : str
+            Field query, default is '*'
+        page_size : int
+            Maximum number of samples per page
+
+        Yields
+        ------
+        list
+            Samples of a page
+        """
+        if hasattr(self.module, 'iter_samples'):
+            yield from self.module.iter_samples(db_path=self.db_path, table_name=table_name, field_name=field_name,
+                                                search_query=self.search_query, page_size=page_size)
+        else:
+            yield self.get_sample(table_name=table_name, field_name=field_name)
+
+    def get_page(self, table_name='', field_name='*', offset=0, limit=1000) -> list:
+        """Retrieves a page of samples from table_name, with the search_query filter, see get_sample
+
+        Parameters
+        ----------
+        table_name : str
+            Name of table to search
+        field_name : str
+            Field query, default is '*'
+        offset : int
+            Number of samples before the page
+        limit : int
+            Maximum number of samples in the page
+
+        Returns
+        -------
+        list
+        """
+        if hasattr(self.module, 'get_page'):
+            return self.module.get_page(db_path=self.db_path, table_name=table_name, field_name=field_name,
+                                        search_query=self.search_query, offset=offset, limit=limit)
+        return self.get_sample(table_name=table_name, field_name=field_name)[offset:offset + limit]
+
     def add_sample(self, table_name='', fields=None, data=None) -> bool:
         """Add new sample to database
 
@@ -198,3 +265,24 @@ class DatabaseManager:
         bool
         """
         return self.module.add_sample(table_name=table_name, fields=fields, data=data, db_path=self.db_path)
+
+    def get_columns(self, table_name='', fields=None, traces=None) -> dict:
+        """Loads whole columns of table_name as arrays, if the module stores columns (see npz_database)
+
+        Parameters
+        ----------
+        table_name : str
+            Name of table to load
+        fields : list
+            List of field names, default all
+        traces : list
+            List of traces, default all
+
+        Returns
+        -------
+        dict
+            An array per field, or None when the module does not store columns
+        """
+        if not hasattr(self.module, 'get_columns'):
+            return None
+        return self.module.get_columns(db_path=self.db_path, table_name=table_name, fields=fields, traces=traces)
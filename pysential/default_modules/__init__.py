@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from .sql_database import *
+from .npz_database import *
 from .excel_database import *
 
 import logging
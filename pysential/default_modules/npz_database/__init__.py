@@ -0,0 +1,229 @@
+
+from resultsql.npz import NPZ_database
+
+import logging
+logger = logging.getLogger(__name__)
+
+__all__ = ['make_database', 'close_database', 'get_tables', 'add_table', 'get_fields', 'add_field', 'get_samples',
+           'iter_samples', 'get_page', 'add_sample', 'get_columns']
+
+
+def _database(db_path):
+    return NPZ_database(db_path)
+
+
+def make_database(db_path=None) -> bool:
+    """Makes a new columnar database (a directory) in db_path
+
+    Parameters
+    ----------
+    db_path : str
+        Directory path of called database
+
+    Returns
+    -------
+    bool
+    """
+    try:
+        return _database(db_path).make_database()
+    except OSError as e:
+        logger.error(e, exc_info=True)
+        return False
+
+
+def close_database(db_path=None) -> None:
+    """Closes the database in db_path, for compatibility with sql_database (nothing is kept open)
+
+    Parameters
+    ----------
+    db_path : str
+        Directory path of called database
+    """
+    _database(db_path).close()
+
+
+def get_tables(db_path=None) -> list:
+    """Get all tables in db_path
+
+    Parameters
+    ----------
+    db_path : str
+        Directory path of called database
+
+    Returns
+    -------
+    list
+    """
+    return _database(db_path).get_tables()
+
+
+def add_table(db_path=None, table_name='', fields='') -> bool:
+    """Add new table to db_path
+
+    Parameters
+    ----------
+    db_path : str
+        Directory path of called database
+    table_name : str
+        Name of new table
+    fields : str
+        Fields string
+
+    Returns
+    -------
+    bool
+    """
+    return _database(db_path).add_table(table_name=table_name, fields=fields)
+
+
+def get_fields(db_path=None, table_name='') -> list:
+    """Gets all fields from table_name
+
+    Parameters
+    ----------
+    db_path : str
+        Directory path of called database
+    table_name : str
+        Table name to search for fields
+
+    Returns
+    -------
+    list
+    """
+    return _database(db_path).get_fields(table_name=table_name)
+
+
+def add_field(db_path=None, table_name='', field_info='') -> bool:
+    """Add new field to table
+
+    Parameters
+    ----------
+    db_path : str
+        Directory path of called database
+    table_name : str
+        Table name to insert new field
+    field_info : str
+        Field information
+
+    Returns
+    -------
+    bool
+    """
+    return _database(db_path).add_field(table_name=table_name, field_info=field_info)
+
+
+def get_samples(db_path=None, table_name='', field_name='*', search_query='*') -> list:
+    """Get samples of specified table_name and field_name
+
+    Parameters
+    ----------
+    db_path : str
+        Directory path of called database
+    table_name : str
+        Table name
+    field_name : str
+        Name of field(s) to search
+    search_query : str
+        Search query, default '*'
+
+    Returns
+    -------
+    list
+    """
+    return _database(db_path).get_samples(table_name=table_name, field_name=field_name,
+                                          search_query=search_query)
+
+
+def iter_samples(db_path=None, table_name='', field_name='*', search_query='*', page_size=1000):
+    """Iterate over the samples of table_name in pages, see get_samples
+
+    Parameters
+    ----------
+    db_path : str
+        Directory path of called database
+    table_name : str
+        Table name
+    field_name : str
+        Name of field(s) to load, default '*' for all
+    search_query : str
+        Search query, default '*'
+    page_size : int
+        Maximum number of samples per page
+
+    Yields
+    ------
+    list
+        Samples of a page
+    """
+    yield from _database(db_path).iter_samples(table_name=table_name, field_name=field_name,
+                                               search_query=search_query, page_size=page_size)
+
+
+def get_page(db_path=None, table_name='', field_name='*', search_query='*', offset=0, limit=1000) -> list:
+    """Get a page of samples of table_name, for random access, see iter_samples
+
+    Only the part files of the page are loaded
+
+    Parameters
+    ----------
+    db_path : str
+        Directory path of called database
+    table_name : str
+        Table name
+    field_name : str or list
+        Name of field(s) to load, default '*' for all
+    search_query : str
+        Only samples of which a field contains the search query, default '*' for all
+    offset : int
+        Number of samples before the page
+    limit : int
+        Maximum number of samples in the page
+
+    Returns
+    -------
+    list
+    """
+    return _database(db_path).get_page(table_name=table_name, field_name=field_name, search_query=search_query,
+                                        offset=offset, limit=limit)
+
+
+def add_sample(db_path=None, table_name='', fields=None, data=None) -> bool:
+    """Add sample to specified table_name and field_name
+
+    Parameters
+    ----------
+    db_path : str
+        Directory path of called database
+    table_name : str
+        Table name to insert new field
+    fields : list
+        Name of field(s)
+    data : list
+        List of data to add
+
+    Returns
+    -------
+    bool
+    """
+    return _database(db_path).add_sample(table_name=table_name, fields=fields, data=data)
+
+
+def get_columns(db_path=None, table_name='', fields=None, traces=None) -> dict:
+    """Load whole columns of table_name as numpy arrays
+
+    Parameters
+    ----------
+    db_path : str
+        Directory path of called database
+    table_name : str
+        Table name
+    fields : list
+        Fields to load, default all
+    traces : list
+        Traces to load, default all
+
+    Returns
+    -------
+    dict
+    """
+    return _database(db_path).get_columns(table_name=table_name, fields=fields, traces=traces)
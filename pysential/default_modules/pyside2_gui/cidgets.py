@@ -177,12 +177,17 @@ class DatabaseView(QtWidgets.QTabWidget):
         for table, field, sample in zip(tables, fields, samples):
             views.append(QtWidgets.QTableView())
             views[-1].doubleClicked.connect(self._click_sample)
-            model = TableModel(sample, [i.replace("_", " ") for i in field])
+            header = [i.replace("_", " ") for i in field]
+            if isinstance(sample, list):
+                model = TableModel(sample, header)
+            else:
+                # Pages of samples, loaded when the view scrolls to the end
+                model = PagedTableModel(sample, header)
             views[-1].setModel(model)
-            for c, _ in enumerate(sample):
-                views[-1].setRowHeight(c, 2)
+            views[-1].verticalHeader().setDefaultSectionSize(2)
             self.addTab(views[-1], table)
-            views[-1].setSortingEnabled(True)
+            # Sorting would only order the pages loaded so far
+            views[-1].setSortingEnabled(not isinstance(model, PagedTableModel))
         self.setCurrentIndex(index)
 
     def _click_sample(self, e):
@@ -276,6 +281,44 @@ class TableModel(QtCore.QAbstractTableModel):
         return None
 
 
+class PagedTableModel(TableModel):
+    """Table model that loads its samples page by page, see TableModel
+
+    Attributes
+    ----------
+    pages : iterator
+        Iterator over the pages (lists) of samples, see DatabaseManager.iter_sample
+
+    Methods
+    ----------
+    canFetchMore(index)
+    fetchMore(index)
+    """
+    def __init__(self, pages, header):
+        super(PagedTableModel, self).__init__([], header)
+        self.pages = iter(pages)
+        self._done = False
+        self.fetchMore(QtCore.QModelIndex())
+
+    def canFetchMore(self, index):
+        """Whether there are more pages, don't change this function"""
+        return not self._done
+
+    def fetchMore(self, index):
+        """Load the next page, don't change this function"""
+        page = next(self.pages, None)
+        if not page:
+            self._done = True
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), len(self._data), len(self._data) + len(page) - 1)
+        self._data.extend(page)
+        self.endInsertRows()
+
+    def columnCount(self, index):
+        """Get number of columns in header, don't change this function"""
+        return len(self.header)
+
+
 class ChartView(QtWidgets.QWidget):
     """Media feed for continuous frame update
 
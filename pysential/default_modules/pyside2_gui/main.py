@@ -53,6 +53,8 @@ class Main(QMainWindow):
         Triggered when items are moved over main
     dropEvent(e)
         Triggered when items are dropped into main
+    open_files(file_paths, modules=None)
+        Open files in the first module that can read them
     """
     def __init__(self, obj: object) -> None:
         super(Main, self).__init__()
@@ -219,19 +221,62 @@ class Main(QMainWindow):
         if e.mimeData().hasUrls:
             e.setDropAction(QtCore.Qt.CopyAction)
             e.accept()
-            for url in e.mimeData().urls():
-                file_path = str(url.toLocalFile())
-                for module in self.obj.modules:
-                    try:
-                        response = module(self.obj).handle_file(file_path)
-                        if response:
-                            self.init_workspace(response)
-                            break
-                    except AttributeError:
-                        pass
+            self.open_files([str(url.toLocalFile()) for url in e.mimeData().urls()])
         else:
             e.ignore()
 
+    def open_files(self, file_paths, modules=None) -> None:
+        """Open files in the first module that can read them
+
+        A module with handle_files opens all files at once in a worker thread, with the progress
+        in the status bar, and the files that it could not read go on to the next modules.
+        The other modules open the files one by one with handle_file.
+
+        Parameters
+        ----------
+        file_paths : list
+            Paths of the files to open
+        modules : list
+            Module classes to try, default all modules
+        """
+        modules = list(self.obj.modules if modules is None else modules)
+        for i, module in enumerate(modules):
+            if not file_paths:
+                return
+            handler = module(self.obj)
+            if hasattr(handler, 'handle_files'):
+                def _open(progress_callback=None, result_callback=None, finished_callback=None):
+                    opened = handler.handle_files(file_paths, progress_callback=progress_callback)
+                    result_callback.emit((opened, file_paths, modules[i + 1:]))
+                worker = Worker(_open)
+                worker.signals.progress.connect(self._open_progress)
+                worker.signals.result.connect(self._files_opened)
+                self.threadpool.start(worker)
+                return
+            remaining = []
+            for file_path in file_paths:
+                try:
+                    response = module(self.obj).handle_file(file_path)
+                except AttributeError:
+                    response = None
+                if response:
+                    self.init_workspace(response)
+                else:
+                    remaining.append(file_path)
+            file_paths = remaining
+
+    def _open_progress(self, progress) -> None:
+        done, total, file_path = progress
+        self.statusBar().showMessage('Opening files: %d of %d (%s)' % (done, total, os.path.basename(file_path)))
+
+    def _files_opened(self, result) -> None:
+        opened, file_paths, modules = result
+        for module in opened:
+            self.init_workspace(module)
+        self.statusBar().showMessage('Opened %d of %d files' % (len(opened), len(file_paths)), 5000)
+        read = {module.file_path for module in opened}
+        self.open_files([file_path for file_path in file_paths if file_path not in read], modules)
+
 
 class Worker(QtCore.QRunnable):
     def __init__(self, fn, *args, **kwargs):
@@ -103,6 +103,7 @@ class GraphView(QtWidgets.QWidget):
 
         self.x_data = []
         self.y_data = []
+        self.curve = None
         self.holding = False
         self.source_path = None
 
@@ -182,11 +183,14 @@ class GraphView(QtWidgets.QWidget):
         if reset:
             self.x_data = []
             self.y_data = []
+            self.curve = None
             self.plot.clear()
         if data:
             d = data.data
             x_data = d[1]
             y_data = d[0]
+        # Lazy axes (e.g. TimeAxis) are only materialised here, for plotting
+        x_data = np.asarray(x_data)
 
         self.x_data.append(x_data)
         self.y_data.append(y_data)
@@ -206,9 +210,9 @@ class GraphView(QtWidgets.QWidget):
                 symbolPen = None
                 pen = pg.mkPen(color=QtGui.QColor(hex_color), width=1)
             if len(x_data) == len(y_data):
-                self.plot.plot(self.x_data[-1], self.y_data[-1], pen=pen, symbol=symbol, symbolPen=symbolPen, symbolSize=5)
+                self.curve = self.plot.plot(self.x_data[-1], self.y_data[-1], pen=pen, symbol=symbol, symbolPen=symbolPen, symbolSize=5)
             elif len(x_data) == len(y_data) + 1:
-                self.plot.plot(self.x_data[-1], self.y_data[-1], pen=pen, symbol=symbol, stepMode=True)
+                self.curve = self.plot.plot(self.x_data[-1], self.y_data[-1], pen=pen, symbol=symbol, stepMode=True)
 
             self.plot.sigRangeChanged.connect(self._zoom_event)
             self.plot.showGrid(x=True, y=True)
@@ -231,7 +235,18 @@ class GraphView(QtWidgets.QWidget):
             self.plot.setTitle(title=series_name, size="8pt")
             self.plot.setXRange(self.x_min, self.x_max, padding=0)
             self.plot.setYRange(self.y_min, self.y_max, padding=0)
+        return self.curve
 
+    def update_chart_data(self, curve, x_data, y_data):
+        """Replace the data of a curve returned by add_chart_data, keeping ranges and limits
+        """
+        if curve is not None:
+            curve.setData(np.asarray(x_data), np.asarray(y_data))
+
+    def connect_view_range(self, function):
+        """Call function(x_min, x_max) whenever the visible x range changes
+        """
+        self.plot.sigXRangeChanged.connect(lambda view_box, x_range: function(*x_range))
 
     def _update_source_path(self):
         self.win.removeItem(self.source_path)
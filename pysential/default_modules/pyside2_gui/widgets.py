@@ -365,7 +365,8 @@ def make_database_view(parent, database=None, function_connect=None, index=0, x=
         print(tables)
         fields = database.get_fields(tables)
         print(fields)
-        samples = database.get_samples(table_names=tables)
+        # The samples are loaded page by page when the tables are scrolled, see PagedTableModel
+        samples = [database.iter_sample(table_name=table) for table in tables]
         return DatabaseView(tables, fields, samples, function_connect=function_connect, index=index, parent=parent)
     except AttributeError as e:
         logger.error(e, exc_info=True)
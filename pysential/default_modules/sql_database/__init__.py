@@ -1,41 +1,37 @@
 
 import sqlite3
-import os.path
+import numpy as np
+from contextlib import nullcontext
+from resultsql import connection, schema
 
 import logging
 logger = logging.getLogger(__name__)
 
 
 def _push_query(db_path=None, query=None, fetch=False, commit=False):
-    if os.path.exists(db_path):
-        conn = _load_database(db_path=db_path)
-        if not conn:
-            return False
-        try:
+    conn = _load_database(db_path=db_path, create=False)
+    if not conn:
+        return False
+    try:
+        with connection.transaction(conn) if commit else nullcontext():
             c = conn.cursor()
             if type(query) == str:
                 result = c.execute(query)
             elif type(query) == list:
                 [c.execute(q) for q in query]
-            if commit:
-                conn.commit()
             if fetch:
                 return [list(i) for i in result.fetchall()]
-            return True
-        except sqlite3.DatabaseError as e:
-            logger.error(e, exc_info=True)
-            return False
-        finally:
-            conn.close()
-    return False
+        return True
+    except sqlite3.DatabaseError as e:
+        logger.error(e, exc_info=True)
+        return False
 
 
-def _load_database(db_path=None):
-    conn = sqlite3.connect(db_path)
+def _load_database(db_path=None, create=True):
+    # The connection of this thread stays open until close_database, see connection.connect.
+    # The schema of the database is left as it is
     try:
-        c = conn.cursor()
-        c.execute('SELECT name from sqlite_master where type= "table"')
-        return conn
+        return connection.connect(db_path, create=create)
     except sqlite3.DatabaseError as e:
         logger.error(e, exc_info=True)
         return False
@@ -53,11 +49,18 @@ def make_database(db_path=None) -> bool:
     -------
     bool
     """
-    conn = _load_database(db_path=db_path)
-    if conn:
-        conn.close()
-        return True
-    return False
+    return bool(_load_database(db_path=db_path))
+
+
+def close_database(db_path=None) -> None:
+    """Closes the connection of this thread to db_path
+
+    Parameters
+    ----------
+    db_path : str
+        File path of called database
+    """
+    connection.close(db_path)
 
 
 def get_tables(db_path=None) -> list:
@@ -110,11 +113,10 @@ def get_fields(db_path=None, table_name='') -> list:
     -------
     list
     """
-    query = 'SELECT sql FROM sqlite_master WHERE tbl_name="'+table_name+'" AND type="table";'
-    result = _push_query(db_path=db_path, query=query, fetch=True)[0][0]
-    fields = str(result[result.find("(") + 1:result.find("))")]).split(',')
-    field_list = [i.split(" ")[0] for i in fields]
-    return field_list
+    conn = _load_database(db_path=db_path, create=False)
+    if not conn:
+        return []
+    return schema.get_fields(conn, table_name)
 
 
 def add_field(db_path=None, table_name='', field_info='') -> bool:
@@ -155,16 +157,128 @@ def get_samples(db_path=None, table_name='', field_name='*', search_query='*') -
     -------
     list
     """
-    if search_query != '*':
-        query = 'SELECT FROM ' + table_name + ' WHERE '
-        for c, field in enumerate(field_name):
-            query = query + '(' + field + ' LIKE "%' + search_query + '%")'
-            if c != len(field_name)-1:
-                query = query + ' OR '
-        query = query + ';'
-    else:
-        query = 'SELECT ' + field_name + ' FROM ' + table_name + ';'
-    return _push_query(db_path=db_path, query=query, fetch=True)
+    fields = _fields(db_path, table_name, field_name)
+    search = None if search_query == '*' else (fields, search_query)
+    return [list(row) for row in _select(db_path, *schema.select(table_name, fields, search=search))]
+
+
+def _fields(db_path, table_name, field_name) -> list:
+    if field_name == '*':
+        return get_fields(db_path=db_path, table_name=table_name)
+    if isinstance(field_name, str):
+        return [field.strip() for field in field_name.split(',')]
+    return list(field_name)
+
+
+def _select(db_path, query, parameters) -> list:
+    conn = _load_database(db_path=db_path, create=False)
+    if not conn:
+        return []
+    try:
+        return conn.execute(query, parameters).fetchall()
+    except sqlite3.DatabaseError as e:
+        logger.error(e, exc_info=True)
+        return []
+
+
+def iter_samples(db_path=None, table_name='', field_name='*', search_query='*', page_size=1000):
+    """Iterate over the samples of table_name in pages, see get_samples
+
+    Every page is a separate query of the samples after the last one (keyset paging on rowid),
+    so only one page is in memory and no read is kept open between pages.
+
+    Parameters
+    ----------
+    db_path : str
+        File path of called database
+    table_name : str
+        Table name
+    field_name : str or list
+        Name of field(s) to load, default '*' for all
+    search_query : str
+        Only samples of which a field contains the search query, default '*' for all
+    page_size : int
+        Maximum number of samples per page
+
+    Yields
+    ------
+    list
+        Samples of a page
+    """
+    fields = _fields(db_path, table_name, field_name)
+    search = None if search_query == '*' else (fields, search_query)
+    after = 0
+    while True:
+        rows = _select(db_path, *schema.page(table_name, fields, after=after, limit=page_size, search=search))
+        if not rows:
+            return
+        after = rows[-1][0]
+        yield [list(row[1:]) for row in rows]
+        if len(rows) < page_size:
+            return
+
+
+def get_page(db_path=None, table_name='', field_name='*', search_query='*', offset=0, limit=1000) -> list:
+    """Get a page of samples of table_name, for random access (LIMIT/OFFSET), see iter_samples
+
+    Parameters
+    ----------
+    db_path : str
+        File path of called database
+    table_name : str
+        Table name
+    field_name : str or list
+        Name of field(s) to load, default '*' for all
+    search_query : str
+        Only samples of which a field contains the search query, default '*' for all
+    offset : int
+        Number of samples before the page
+    limit : int
+        Maximum number of samples in the page
+
+    Returns
+    -------
+    list
+    """
+    fields = _fields(db_path, table_name, field_name)
+    search = None if search_query == '*' else (fields, search_query)
+    return [list(row) for row in _select(db_path, *schema.select(table_name, fields, search=search,
+                                                                 limit=limit, offset=offset))]
+
+
+def get_columns(db_path=None, table_name='', fields=None, traces=None) -> dict:
+    """Load whole columns of table_name as numpy arrays
+
+    Parameters
+    ----------
+    db_path : str
+        File path of called database
+    table_name : str
+        Table name
+    fields : list
+        Fields to load, default all
+    traces : list
+        Traces to load (found by index), default all
+
+    Returns
+    -------
+    dict
+    """
+    fields = get_fields(db_path=db_path, table_name=table_name) if fields is None else list(fields)
+    rows = _select(db_path, *schema.select(table_name, fields, trace=traces))
+    columns = list(zip(*rows)) if rows else [()] * len(fields)
+    return {field: _array(column) for field, column in zip(fields, columns)}
+
+
+def _array(values) -> np.ndarray:
+    column = np.array(values)
+    if column.dtype == object:
+        # NULL in a REAL column
+        try:
+            column = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+        except (TypeError, ValueError):
+            pass
+    return column
 
 
 def add_sample(db_path=None, table_name='', fields=None, data=None) -> bool:
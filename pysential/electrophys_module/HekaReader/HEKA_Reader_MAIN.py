@@ -8,252 +8,12 @@ data = tree.data[group_id, series_id, sweep_ind, trace_ind] # Load data for this
 stim = tree.StimWave[group_id, series_id, sweep_ind]
 """
 import numpy as np
-import re, struct, collections
-import os
 import datetime
 import pdb
-#import dateutil.tz as timeZone
-
-class Struct(object):
-    """High-level wrapper around struct.Struct that makes it a bit easier to 
-    unpack large, nested structures.   
-    """
-    field_info = None
-    size_check = None
-    _fields_parsed = None
-   
-    def __init__(self, data, endian='<'):
-        """Read the structure from *data* and return an ordered dictionary of 
-        fields.
-        
-        *data* may be a string or file.
-        *endian* may be '<' or '>'
-        """
-        field_info = self._field_info()
-        if not isinstance(data, (str, bytes)):
-            data = data.read(self._le_struct.size)
-        if endian == '<':
-            items = self._le_struct.unpack(data)
-        elif endian == '>':
-            items = self._be_struct.unpack(data)
-        else:
-            raise ValueError('Invalid endian: %s' % endian)
-        
-        fields = collections.OrderedDict()
-        
-        i = 0
-        for name, fmt, func in field_info:
-            # pull item(s) out of the list based on format string
-            if len(fmt) == 1 or fmt[-1] == 's':
-                item = items[i]
-                i += 1
-            else:
-                n = int(fmt[:-1])
-                item = items[i:i+n]
-                i += n
-            
-            # try unpacking sub-structure
-            if isinstance(func, tuple):
-                substr, func = func
-                item = substr(item, endian)
-            
-            # None here means the field should be omitted
-            if func is None:
-                continue
-            # handle custom massaging function
-            if func is not True:
-                item = func(item)
-            fields[name] = item
-            setattr(self, name, item)
-            
-        self.fields = fields
-        
-    @classmethod
-    def _field_info(cls):
-        if cls._fields_parsed is not None:
-            return cls._fields_parsed
-        
-        fmt = ''
-        fields = []
-        for items in cls.field_info:
-            if len(items) == 3:
-                name, ifmt, func = items
-            else:
-                name, ifmt = items
-                func = True
-                
-            if isinstance(ifmt, type) and issubclass(ifmt, Struct):
-                func = (ifmt, func) # instructs to unpack with sub-struct before calling function
-                ifmt = '%ds' % ifmt.size()
-            elif len(ifmt) > 1 and re.match(r'\d*[xcbB?hHiIlLqQfdspP]', ifmt) is None:
-                raise TypeError('Unsupported format string "%s"' % ifmt)
-            
-            fields.append((name, ifmt, func))
-            fmt += ifmt
-        cls._le_struct = struct.Struct('<' + fmt)
-        cls._be_struct = struct.Struct('>' + fmt)
-        cls._fields_parsed = fields
-        if cls.size_check is not None:
-#            print(cls._le_struct.size, cls.size_check)
-            assert cls._le_struct.size == cls.size_check
-        return fields
-
-    @classmethod
-    def size(cls):
-        cls._field_info()
-        return cls._le_struct.size
-    
-    @classmethod
-    def array(cls, x):
-        """Return a new StructArray class of length *x* and using this struct 
-        as the array item type.
-        """
-        return type(cls.__name__+'[%d]'%x, (StructArray,), 
-                    {'item_struct': cls, 'array_size': x})
-        
-    def __repr__(self, indent=0):
-        indent_str = '    '*indent
-        r = indent_str + '%s(\n'%self.__class__.__name__
-        if not hasattr(self, 'fields'):
-            r = r[:-1] + '<initializing>)'
-            return r
-        for k,v in self.fields.items():
-            if isinstance(v, Struct):
-                r += indent_str + '    %s = %s\n' % (k, v.__repr__(indent=indent+1).lstrip())
-            else:
-                r += indent_str + '    %s = %r\n' % (k, v)
-        r += indent_str + ')'
-        return r
-
-    def get_fields(self):
-        """Recursively convert struct fields+values to nested dictionaries.
-        """
-        fields = self.fields.copy()
-        for k,v in fields.items():
-            if isinstance(v, StructArray):
-                fields[k] = [x.get_fields() for x in v.array]
-            elif isinstance(v, Struct):
-                fields[k] = v.get_fields()
-        return fields
-
-    
-class StructArray(Struct):
-    item_struct = None
-    array_size = None
-    
-    def __init__(self, data, endian='<'):
-        if not isinstance(data, (str, bytes)):
-            data = data.read(self.size())
-        items = []
-        isize = self.item_struct.size()
-        for i in range(self.array_size):
-            d = data[:isize]
-            data = data[isize:]
-            items.append(self.item_struct(d, endian))
-        self.array = items
-
-    def __getitem__(self, i):
-        return self.array[i]
-        
-    @classmethod
-    def size(self):
-        return self.item_struct.size() * self.array_size
 
-    def __repr__(self, indent=0):
-        r = '    '*indent + '%s(\n' % self.__class__.__name__
-        for item in self.array:
-            r += item.__repr__(indent=indent+1) + ',\n'
-        r += '    '*indent + ')'
-        return r
-
-
-def cstr(byt):
-    """Convert C string bytes to python string.
-    """
-    try:
-        ind = byt.index(b'\0')
-    except ValueError:
-        return byt
-    return byt[:ind].decode('utf-8', errors='ignore')
-
-class BundleItem(Struct):
-    field_info = [
-        ('Start', 'i'),
-        ('Length', 'i'),
-        ('Extension', '8s', cstr),
-    ]
-    size_check = 16
-
-
-class BundleHeader(Struct):
-    ## DAT2 version file
-    field_info = [
-        ('Signature', '8s', cstr),
-        ('Version', '32s', cstr),
-        ('Time', 'd'),
-        ('Items', 'i'),
-        ('IsLittleEndian', '12s'),
-        ('BundleItems', BundleItem.array(12)),
-    ]
-    size_check = 256
-
-class TreeNode(Struct):
-    """Struct that also represents a node in a Pulse file tree.
-    """
-    def __init__(self, fh, pul, level=0):
-        self.level = level
-        self.children = []
-        endian = pul.endian
-        
-        # The record structure in the file may differ from our expected structure
-        # due to version differences, so we read the required number of bytes, and
-        # then pad or truncate before unpacking the record. This will probably
-        # result in corrupt data in some situations..
-        realsize = pul.level_sizes[level]
-        data = fh.read(realsize)       
-        structsize = self.size()
-
-        diff = structsize - realsize
-        if diff !=0:
-#            print("TreeNode realsize: %g, struct size: %g, size diff: %g" % (realsize, structsize, diff))
-            if diff > 0:
-                data = data + b'\0'*diff
-            else:
-                data = data[:structsize]
-        
-        # initialize struct data
-        Struct.__init__(self, data, endian)
-        
-        # Next read the number of children
-        nchild = struct.unpack(endian + 'i', fh.read(4))[0]
-            
-        level += 1
-        if level >= len(pul.rectypes):
-            return
-        child_rectype = pul.rectypes[level]
-        for i in range(nchild):
-            self.children.append(child_rectype(fh, pul, level))
+from ..heka_struct import (Struct, cstr, BundleHeader, TreeNode, TreeFile)
+#import dateutil.tz as timeZone
 
-    def __getitem__(self, i):
-        return self.children[i]
-    
-    def __len__(self):
-        return len(self.children)
-    
-    def __iter__(self):
-        return self.children.__iter__()
-    
-    def __repr__(self, indent=0):
-        # Return a string describing this structure
-        ind = '    '*indent
-        srep = Struct.__repr__(self, indent)[:-1]  # exclude final parenthese
-        srep += ind + '    children = %d,\n' % len(self)
-        #srep += ind + 'children = [\n'
-        #for ch in self:
-            #srep += ch.__repr__(indent=indent+1) + ',\n'
-        srep += ind + ')'
-        return srep
-    
 class TraceRecord(TreeNode):
     """
 
@@ -596,7 +356,7 @@ class GroupRecord(TreeNode):
     ]
     size_check = 144
 
-class Pulsed(TreeNode):
+class Pulsed(TreeFile):
     field_info = [
         ('Version', 'i'),
         ('Mark', 'i'),
@@ -621,33 +381,9 @@ class Pulsed(TreeNode):
         SweepRecord,
         TraceRecord
     ]
-    
-    def __init__(self, bundle, offset=0, size=None):
-        fh = open(bundle.file_name, 'rb')
-        #pdb.set_trace()
-        fh.seek(offset)
-        
-        # read .pul header
-        magic = fh.read(4) 
-        if magic == b'eerT':
-            self.endian = '<'
-        elif magic == b'Tree':
-            self.endian = '>'
-        elif magic ==b'DAT1':
-            self.endian = '>'
-        else:
-            raise RuntimeError('Bad file magic: %s' % magic)
-        
-        levels = struct.unpack(self.endian + 'i', fh.read(4))[0]
-        # read size of each level (one int per level)
-        self.level_sizes = []
-        for i in range(levels):
-            size = struct.unpack(self.endian + 'i', fh.read(4))[0]
-            self.level_sizes.append(size)
-            
-        TreeNode.__init__(self, fh, self)
+    magic = {b'eerT': '<', b'Tree': '>', b'DAT1': '>'}
 
-class Pulsed9(TreeNode):
+class Pulsed9(TreeFile):
     field_info = [
         ('Version', 'i'),
         ('Mark', 'i'),
@@ -670,72 +406,80 @@ class Pulsed9(TreeNode):
         V9_SweepRecord,
         TraceRecord   ## no changes in tracerecord between version 9 and version 1000
     ]
-    
-    def __init__(self, bundle, offset=0, size=None):
-        fh = open(bundle.file_name, 'rb')
-        fh.seek(offset)
-        
-        # read .pul header
-        magic = fh.read(4) 
-        if magic == b'eerT':
-            self.endian = '<'
-        elif magic == b'Tree':
-            self.endian = '>'
-        else:
-            raise RuntimeError('Bad file magic: %s' % magic)
-        
-        levels = struct.unpack(self.endian + 'i', fh.read(4))[0]
-
-        # read size of each level (one int per level)
-        self.level_sizes = []
-        for i in range(levels):
-            size = struct.unpack(self.endian + 'i', fh.read(4))[0]
-            self.level_sizes.append(size)
-            
-        TreeNode.__init__(self, fh, self)
         
 class Data(object):
     def __init__(self, bundle, offset=0, size=None):
         self.bundle = bundle
         self.offset = offset
-        
+        self._memmap = None
+
+    @property
+    def memmap(self):
+        """The .dat file mapped read-only as bytes, created once on first use.
+        """
+        if self._memmap is None:
+            self._memmap = np.memmap(self.bundle.file_name, dtype=np.uint8, mode='r')
+        return self._memmap
+
     def __getitem__(self, *args):
         index = args[0]
         assert len(index) == 4
+        return self.read(index)
+
+    def read(self, index, start=0, stop=None):
+        """Read samples *start*:*stop* of the trace at *index*, scaled to float64.
+
+        Interleaved traces (InterleaveSizeS bytes of samples every InterleaveSkip
+        bytes) are gathered through strided views of the memory map straight into
+        one preallocated output; blocks outside the window are never read.
+        """
         pul = self.bundle.pul
         trace = pul[index[0]][index[1]][index[2]][index[3]]
-        fh = open(self.bundle.file_name, 'rb')
-        fh.seek(trace.Data)
         fmt = bytearray(trace.DataFormat)[0]
-        dtype = [np.int16, np.int32, np.float32, np.float64][fmt]
-        dByte =[2, 4, 4, 8][fmt];
-        nItemsPerBlock = np.int(trace.InterleaveSizeS/dByte)
-        TotalBytes = trace.DataPoints * dByte
-        #print('{:f}, {:f}'.format(trace.DataPoints, trace.InterleaveSizeS))
-        if trace.DataPoints >= trace.InterleaveSizeS and trace.InterleaveSizeS !=0:
-            print('long block')
-            ### there is a mixture of data points (count) and bytes!
-            data = np.fromfile(fh, count=nItemsPerBlock, dtype=dtype)
-            dataRead = trace.InterleaveSizeS
-            data2Read =  TotalBytes- dataRead  ## in bytes
-            c= 0
-            while  data2Read > 0 :
-                fh.seek(trace.InterleaveSkip - trace.InterleaveSizeS, os.SEEK_CUR)  ## skip the skip-block
-                c = c+1
-#                print(c)
-                if data2Read <  trace.InterleaveSizeS:  ## less than a block size
-                    data0 = np.fromfile(fh, count=np.int(data2Read/dByte), dtype=dtype)
-                    data = np.concatenate((data, data0))
-                    break
-                else:   ## larger than a block size
-                    data0 = np.fromfile(fh, count=nItemsPerBlock, dtype=dtype)
-                    data = np.concatenate((data, data0))
-                    dataRead = trace.InterleaveSizeS  + dataRead
-                    data2Read = TotalBytes - dataRead  
+        dtype = np.dtype([np.int16, np.int32, np.float32, np.float64][fmt]).newbyteorder(pul.endian)
+        start, stop, _ = slice(start, stop).indices(trace.DataPoints)
+        out = np.empty(max(0, stop - start), dtype=np.float64)
+        if len(out) == 0:
+            return out
+
+        # A trace without interleave, or with blocks of less than a sample, is contiguous
+        n_block = trace.InterleaveSizeS // dtype.itemsize
+        if 0 < n_block < trace.DataPoints:
+            self._gather_blocks(out, trace.Data, dtype, n_block, trace.InterleaveSkip, start, stop)
         else:
-            data = np.fromfile(fh, count=trace.DataPoints, dtype=dtype)
-        return data * trace.DataScaler + trace.ZeroData    
-  
+            out[:] = self._samples(trace.Data + start * dtype.itemsize, len(out), dtype)
+        out *= trace.DataScaler
+        out += trace.ZeroData
+        return out
+
+    def _samples(self, offset, count, dtype, rows=None, skip=None):
+        """View *count* samples at byte *offset*, or *rows* blocks of *count* samples
+        spaced *skip* bytes apart.
+        """
+        if rows is None:
+            return np.ndarray((count,), dtype=dtype, buffer=self.memmap, offset=offset)
+        return np.ndarray((rows, count), dtype=dtype, buffer=self.memmap, offset=offset,
+                          strides=(skip, dtype.itemsize))
+
+    def _gather_blocks(self, out, offset, dtype, n_block, skip, start, stop):
+        # Block and position within the block of the first and one-past-last sample
+        first_block, first_pos = divmod(start, n_block)
+        last_block, last_pos = divmod(stop, n_block)
+        if first_block == last_block:
+            out[:] = self._samples(offset + first_block * skip + first_pos * dtype.itemsize, len(out), dtype)
+            return
+
+        # Partial head block, whole blocks in the middle as one 2D view, partial tail block
+        head = n_block - first_pos
+        out[:head] = self._samples(offset + first_block * skip + first_pos * dtype.itemsize, head, dtype)
+        n_full = last_block - first_block - 1
+        if n_full > 0:
+            middle = out[head:head + n_full * n_block].reshape(n_full, n_block)
+            middle[:] = self._samples(offset + (first_block + 1) * skip, n_block, dtype, rows=n_full, skip=skip)
+        if last_pos > 0:
+            out[head + n_full * n_block:] = self._samples(offset + last_block * skip, last_pos, dtype)
+
+
 class  StimulationRecord(TreeNode):
     '''
        (* StimulationRecord = RECORD *)
@@ -885,7 +629,7 @@ class StimSegmentRecord(TreeNode):
     size_check = 80
     
 #%%    
-class StimTree(TreeNode):
+class StimTree(TreeFile):
     field_info = [
         ('Version', 'i'),
         ('Mark', 'i'),
@@ -906,30 +650,6 @@ class StimTree(TreeNode):
         ChannelRecord,   ## not used for now. ONly the second level has useful information. extract data from this level!
         StimSegmentRecord,
     ]
-   
-    def __init__(self, bundle, offset=0, size=None):
-        fh = open(bundle.file_name, 'rb')
-        fh.seek(offset)
-        
-        # read .stim header
-        stimHeaderIdx=4
-        magic = fh.read(stimHeaderIdx) 
-        if magic == b'eerT':
-            self.endian = '<'
-        elif magic == b'Tree':
-            self.endian = '>'
-        else:
-            raise RuntimeError('Bad file magic: %s' % magic)
-        
-        levels = struct.unpack(self.endian + 'i', fh.read(stimHeaderIdx))[0]
-
-        # read size of each level (one int per level)
-        self.level_sizes = []
-        for i in range(levels):
-            size = struct.unpack(self.endian + 'i', fh.read(stimHeaderIdx))[0]
-            self.level_sizes.append(size)
-            
-        TreeNode.__init__(self, fh, self)
         
 def datTime2RealTime(tc):
     """ Convert from timestamp to human-readable time"""
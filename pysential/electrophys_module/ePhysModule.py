@@ -58,7 +58,7 @@ class ePhysModule(AbstractModule):
         self.tree = None
         self.chart = None
         self.y_data = np.array([0, 0])
-        self.x_data = np.array([0, 1])
+        self.x_data = TimeAxis(0, 1, 2)
         self.v_data = np.array([0, 1])
         self.type = ""
         self.file_path = ""
@@ -69,6 +69,8 @@ class ePhysModule(AbstractModule):
         self.trace_events = dict()
         self.event_idx = list()
         self.active_item = None
+        self.active_items = list()
+        self.trace_curve = None
 
     def handle_file(self, file_path: str):
         self.file_path = file_path
@@ -81,6 +83,25 @@ class ePhysModule(AbstractModule):
         except:
             return False
 
+    def handle_files(self, file_paths, progress_callback=None):
+        """Open many .dat files at once, indexing them on all cores.
+
+        Returns one ePhysModule per file that could be read. progress_callback
+        (e.g. a WorkerSignals.progress signal) receives (done, total, file_path).
+        """
+        modules = []
+        file_paths = [f for f in file_paths if f.endswith('.dat')]
+        for done, total, file_path, index in index_bundles(file_paths):
+            if index is not None:
+                module = ePhysModule(self.obj)
+                module.file_path = file_path
+                module.data = NanoporeHEKA(file_path, index=index)
+                module.type = "HEKA"
+                modules.append(module)
+            if progress_callback is not None:
+                progress_callback.emit((done, total, file_path))
+        return modules
+
     def _open_IV(self):
         self.IV_window = CurrentVoltageResults(self.obj)
         voltage, current = self.active_item.IV
@@ -90,6 +111,7 @@ class ePhysModule(AbstractModule):
     def _update_from_tree_HEKA(self, item):
         self.active_item = item
         data = self.data.filter_items(group=item.group, series=item.series, sweep=item.sweep, trace=item.trace)
+        self.active_items = data
         self.y_data, self.x_data, self.v_data = self.data.fetch_and_concat(data)
         try:
             title = "Group %s, Series %s, %s, %s @ %s" % (int(item.group)+1, int(item.series)+1, str(item.label), int(item.sweep), os.path.basename(self.file_path))
@@ -100,13 +122,13 @@ class ePhysModule(AbstractModule):
         dv = (max(self.v_data) - min(self.v_data)) * 0.1
         self.widgets.add_chart_data(self.voltage_chart, x_data=self.x_data, y_data=self.v_data,
                                     series_name='Voltage',
-                                    x_range=(0, max(self.x_data)), y_range=(min(self.v_data)-dv, max(self.v_data)+dv),
+                                    x_range=(0, self.x_data.max()), y_range=(min(self.v_data)-dv, max(self.v_data)+dv),
                                     x_name="Time", x_unit="s", y_name="Holding potential", y_unit="V", reset=True)
         self.voltage_chart.add_cursor()
 
     def _add_vertical_cursor(self):
         self.baseline_cursor = self.chart.add_cursor(angle=90)
-        self.baseline_cursor.setValue(np.mean(self.x_data))
+        self.baseline_cursor.setValue((self.x_data.min() + self.x_data.max()) / 2)
 
     def _filter(self, result):
         self.filter_freq = int(result["Filter frequency"])
@@ -205,24 +227,47 @@ class ePhysModule(AbstractModule):
         sigma = 1 / (sampling_period * Fs * 2 * np.pi)
         return gaussian_filter(signal, sigma)
 
+    def _filter_frequency(self):
+        if self.filter_freq is not None:
+            return self.filter_freq
+        try:
+            return int(self.widgets.get_line_edit(self.filter))
+        except ValueError:
+            return None
+
+    def _read_window(self, t0=None, t1=None):
+        # Min/max envelope of the visible window, at most two points per pixel
+        t, y_min, y_max = self.data.read_window(self.active_items, t0, t1, n_pixels=max(100, self.chart.width()))
+        if y_min is y_max:
+            return t, y_min
+        return np.repeat(np.asarray(t), 2), np.column_stack((y_min, y_max)).ravel()
+
+    def _update_window(self, x_min, x_max):
+        if self.trace_curve is None or self._filter_frequency() is not None:
+            return
+        x_data, y_data = self._read_window(x_min, x_max)
+        self.chart.update_chart_data(self.trace_curve, x_data, y_data)
+
     def _plot_data(self, series_name='', x_data=None, y_data=None, reset=True, hex_color="#000000"):
-        if all((x_data is None, y_data is None)):
+        trace = all((x_data is None, y_data is None))
+        if trace:
             x_data = self.x_data
             y_data = self.y_data
-        try:
-            if self.filter_freq is None:
-                filter_freq = int(self.widgets.get_line_edit(self.filter))
-            else:
-                filter_freq = self.filter_freq
-            y_data = self.filter_gaussian(y_data, np.diff(x_data)[0], filter_freq)
-        except ValueError:
-            pass
+        filter_freq = self._filter_frequency()
+        if filter_freq is not None:
+            dt = x_data.dt if isinstance(x_data, TimeAxis) else np.diff(x_data)[0]
+            y_data = self.filter_gaussian(y_data, dt, filter_freq)
+        elif trace and self.active_items:
+            # Unfiltered traces are drawn from the file, only as detailed as the view needs
+            x_data, y_data = self._read_window()
         if len(x_data) == len(y_data):
-            self.widgets.add_chart_data(self.chart, x_data=x_data, y_data=y_data,
-                                        series_name=series_name, hex_color=hex_color,
-                                        x_range=(0, max(self.x_data)),
-                                        y_range=(-1000 * 10 ** -12, 1000 * 10 ** -12),
-                                        x_name="Time", x_unit="s", y_name="Current", y_unit="A", reset=reset)
+            curve = self.widgets.add_chart_data(self.chart, x_data=x_data, y_data=y_data,
+                                                series_name=series_name, hex_color=hex_color,
+                                                x_range=(0, self.x_data.max()),
+                                                y_range=(-1000 * 10 ** -12, 1000 * 10 ** -12),
+                                                x_name="Time", x_unit="s", y_name="Current", y_unit="A", reset=reset)
+            if trace:
+                self.trace_curve = curve if filter_freq is None else None
 
     def add_cursor(self):
         cursors = self.chart.add_cursor()
@@ -294,6 +339,7 @@ class ePhysModule(AbstractModule):
                         self.tree.add_item("Pulse %s" % item.sweep, item.label, marker=item, parent=element)
 
         self.chart = self.widgets.make_chart_view(grid=(5, 25, 1, 11))
+        self.chart.connect_view_range(self._update_window)
         self.voltage_chart = self.widgets.make_chart_view(grid=(5, 25, 11, 22))
         self.widgets.make_label(grid=(0, 2, 1, 2), text="Filter frequency")
         self.filter = self.widgets.make_line_edit(grid=(2, 5, 1, 2))
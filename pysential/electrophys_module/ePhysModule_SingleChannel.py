@@ -57,6 +57,8 @@ class ePhysModule(AbstractModule):
         self.chart = None
         self.y_data = np.array([0, 0])
         self.x_data = np.array([0, 1])
+        # End time of the plotted data, self.x_data can be a TimeAxis that is not assigned to
+        self.x_end = 1.0
         self.v_data = np.array([0, 1])
         self.type = ""
         self.file_path = ""
@@ -89,6 +91,7 @@ class ePhysModule(AbstractModule):
         self.active_item = item
         data = self.data.filter_items(group=item.group, series=item.series, sweep=item.sweep, trace=item.trace)
         self.y_data, self.x_data, self.v_data = self.data.fetch_and_concat(data)
+        self.x_end = self.x_data.max()
         try:
             title = "Group %s, Series %s, Sweep %s, Channel %s @ %s" % (int(item.group)+1, int(item.series)+1, int(item.sweep)+1, int(item.trace)+1, os.path.basename(self.file_path))
         except TypeError:
@@ -97,7 +100,7 @@ class ePhysModule(AbstractModule):
 
         self.widgets.add_chart_data(self.voltage_chart, x_data=self.x_data, y_data=self.v_data,
                                     series_name='Voltage',
-                                    x_range=(0, max(self.x_data)),
+                                    x_range=(0, self.x_end),
                                     x_name="Time", x_unit="s", y_name="Holding potential", y_unit="V", reset=True)
         self.voltage_chart.add_cursor()
 
@@ -121,8 +124,8 @@ class ePhysModule(AbstractModule):
                 print("Time load time: %s" % str(time.time()-a))
                 a = time.time()
 
-                x0 = max(x_data)
-                self.x_data[-1] = max(x_data)
+                x0 = x_data.max()
+                self.x_end = x0
                 self._plot_data(x_data=x_data, y_data=y_data, reset=reset, hex_color="#181d7a")
 
                 print("Plot time: %s" % str(time.time() - a))
@@ -131,6 +134,7 @@ class ePhysModule(AbstractModule):
             self.data.set_active(item)
             self.y_data = self.data.rawdata * 10 ** -12
             self.x_data = self.data.time
+            self.x_end = self.x_data.max()
             # title = "Trace %s" % int(self.data.active_trace)
             title = "Trace %s @ %s" % (int(self.data.active_trace), os.path.basename(self.file_path))
 
@@ -169,6 +173,8 @@ class ePhysModule(AbstractModule):
         dropdown_method = dialog.add_option(("From", "Dropdown"))
         dropdown_method.addItem("Cursors")
         dropdown_method.addItem("Values")
+        # Window in seconds of a baseline that follows drift, empty for the fixed baseline above
+        dialog.add_option(("Adaptive baseline window", "VARCHAR"))
 
         dialog.add_option(("---", "Label"))
         dropdown_method = dialog.add_option(("Event optimisation", "Dropdown"))
@@ -211,17 +217,17 @@ class ePhysModule(AbstractModule):
         print("Start cutoff: %s and end %s s" % (t0, t1))
         self.data.set_trim(t0=t0, t1=t1)
 
-        if result['Apply to'] == 'All traces':
-            trace = self.data.active_trace
-            for i in range(self.data.n_traces):
-                self.data.set_active(i)
-                Events(self.data).run()
-            self.data.set_active(trace)
-        else:
-            Events(self.data).run()
+        try:
+            window = float(result['Adaptive baseline window'])
+        except ValueError:
+            window = 0
+        self.data.set_adaptive_baseline(window)
+
+        all_traces = result['Apply to'] == 'All traces'
+        Events(self.data, all_traces=all_traces).run()
 
         if result['Event optimisation'] != 'None (long-lived events)':
-            Events(self.data).optimise_events(function=result['Event optimisation'])
+            Events(self.data, all_traces=all_traces).optimise_events(function=result['Event optimisation'])
 
         self.update_events()
         self.plot_simple_events()
@@ -291,18 +297,18 @@ class ePhysModule(AbstractModule):
 
                     self.widgets.add_chart_data(self.chart, x_data=x_data[int(max_points*block):int(max_points*(block+1))], y_data=y_data[int(max_points*block):int(max_points*(block+1))],
                                                 series_name=series_name, hex_color=hex_color,
-                                                x_range=(0, max(self.x_data)), y_range=(-1000*10**-12, 1000*10**-12),
+                                                x_range=(0, self.x_end), y_range=(-1000*10**-12, 1000*10**-12),
                                                 x_name="Time", x_unit="s", y_name="Current", y_unit="A", reset=reset)
                 self.widgets.add_chart_data(self.chart, x_data=x_data[int(-remained_after_division)::],
                                             y_data=y_data[int(-remained_after_division)::],
                                             series_name=series_name, hex_color=hex_color,
-                                            x_range=(0, max(self.x_data)),
+                                            x_range=(0, self.x_end),
                                             y_range=(-1000 * 10 ** -12, 1000 * 10 ** -12),
                                             x_name="Time", x_unit="s", y_name="Current", y_unit="A", reset=False)
             else:
                 self.widgets.add_chart_data(self.chart, x_data=x_data, y_data=y_data,
                                             series_name=series_name, hex_color=hex_color,
-                                            x_range=(0, max(self.x_data)),
+                                            x_range=(0, self.x_end),
                                             y_range=(-1000 * 10 ** -12, 1000 * 10 ** -12),
                                             x_name="Time", x_unit="s", y_name="Current", y_unit="A", reset=reset)
 
@@ -333,6 +339,7 @@ class ePhysModule(AbstractModule):
 
         self.y_data = self.data.rawdata*10**-12
         self.x_data = self.data.time
+        self.x_end = self.x_data.max()
         self.data.set_active(0)
         self.chart = self.widgets.make_chart_view(grid=(5, 25, 1, 22))
         self.widgets.make_label(grid=(0, 2, 1, 2), text="Filter frequency")
@@ -33,284 +33,33 @@ Brief example::
     # Load data for this trace
     data = bundle.data[group_id, series_id, sweep_ind, trace_ind]
 
+    # Or map it without copying, and scale only the samples you slice
+    view = bundle.data.view([group_id, series_id, sweep_ind, trace_ind])
+    data = view[0:1000]
+
+    # Index a whole folder on all cores, then open the files you need
+    for done, total, file_name, index in index_bundles(file_names):
+        print(done, total, file_name)
+    heka = NanoporeHEKA(file_name, index=index)
+
 """
 
 import numpy as np
-import re, struct, collections, os
+import os, hashlib, multiprocessing, struct, logging
 
 from copy import deepcopy
-import time
-
-
-class Struct(object):
-    """High-level wrapper around struct.Struct that makes it a bit easier to
-    unpack large, nested structures.
-
-    * Unpacks to dictionary allowing fields to be retrieved by name
-    * Optionally massages field data on read
-    * Handles arrays and nested structures
-
-    *fields* must be a list of tuples like (name, format) or (name, format, function)
-    where *format* must be a simple struct format string like 'i', 'd',
-    '32s', or '4d'; or another Struct instance.
-
-    *function* may be either a function that filters the data for that field
-    or None to exclude the field altogether.
-
-    If *size* is given, then an exception will be raised if the final struct size
-    does not match the given size.
-
-
-    Example::
-
-        class MyStruct(Struct):
-            field_info = [
-                ('char_field', 'c'),                # single char
-                ('char_array', '8c'),               # list of 8 chars
-                ('str_field',  '8s', cstr),         # C string of len 8
-                ('sub_struct', MyOtherStruct),      # dict generated by s2.unpack
-                ('filler', '32s', None),            # ignored field
-            ]
-            size_check = 300
-
-        fh = open(fname, 'rb')
-        data = MyStruct(fh)
-
-    """
-    field_info = None
-    size_check = None
-    _fields_parsed = None
-
-
-
-    def __init__(self, data, endian='<'):
-        """Read the structure from *data* and return an ordered dictionary of
-        fields.
-
-        *data* may be a string or file.
-        *endian* may be '<' or '>'
-        """
-        field_info = self._field_info()
-        if not isinstance(data, (str, bytes)):
-            data = data.read(self._le_struct.size)
-        if endian == '<':
-            items = self._le_struct.unpack(data)
-        elif endian == '>':
-            items = self._be_struct.unpack(data)
-        else:
-            raise ValueError('Invalid endian: %s' % endian)
-
-        fields = collections.OrderedDict()
-
-        i = 0
-        for name, fmt, func in field_info:
-            # pull item(s) out of the list based on format string
-            if len(fmt) == 1 or fmt[-1] == 's':
-                item = items[i]
-                i += 1
-            else:
-                n = int(fmt[:-1])
-                item = items[i:i+n]
-                i += n
-
-            # try unpacking sub-structure
-            if isinstance(func, tuple):
-                substr, func = func
-                item = substr(item, endian)
-
-            # None here means the field should be omitted
-            if func is None:
-                continue
-            # handle custom massaging function
-            if func is not True:
-                item = func(item)
-            fields[name] = item
-            setattr(self, name, item)
-
-        self.fields = fields
-
-    @classmethod
-    def _field_info(cls):
-        if cls._fields_parsed is not None:
-            return cls._fields_parsed
-
-        fmt = ''
-        fields = []
-        for items in cls.field_info:
-            if len(items) == 3:
-                name, ifmt, func = items
-            else:
-                name, ifmt = items
-                func = True
-
-            if isinstance(ifmt, type) and issubclass(ifmt, Struct):
-                func = (ifmt, func) # instructs to unpack with sub-struct before calling function
-                ifmt = '%ds' % ifmt.size()
-            elif len(ifmt) > 1 and re.match(r'\d*[xcbB?hHiIlLqQfdspP]', ifmt) is None:
-                raise TypeError('Unsupported format string "%s"' % ifmt)
-
-            fields.append((name, ifmt, func))
-            fmt += ifmt
-        cls._le_struct = struct.Struct('<' + fmt)
-        cls._be_struct = struct.Struct('>' + fmt)
-        cls._fields_parsed = fields
-        if cls.size_check is not None:
-            assert cls._le_struct.size == cls.size_check
-        return fields
-
-    @classmethod
-    def size(cls):
-        cls._field_info()
-        return cls._le_struct.size
-
-    @classmethod
-    def array(cls, x):
-        """Return a new StructArray class of length *x* and using this struct
-        as the array item type.
-        """
-        return type(cls.__name__+'[%d]'%x, (StructArray,),
-                    {'item_struct': cls, 'array_size': x})
-
-    def __repr__(self, indent=0):
-        indent_str = '    '*indent
-        r = indent_str + '%s(\n'%self.__class__.__name__
-        if not hasattr(self, 'fields'):
-            r = r[:-1] + '<initializing>)'
-            return r
-        for k,v in self.fields.items():
-            if isinstance(v, Struct):
-                r += indent_str + '    %s = %s\n' % (k, v.__repr__(indent=indent+1).lstrip())
-            else:
-                r += indent_str + '    %s = %r\n' % (k, v)
-        r += indent_str + ')'
-        return r
-
-    def get_fields(self):
-        """Recursively convert struct fields+values to nested dictionaries.
-        """
-        fields = self.fields.copy()
-        for k,v in fields.items():
-            if isinstance(v, StructArray):
-                fields[k] = [x.get_fields() for x in v.array]
-            elif isinstance(v, Struct):
-                fields[k] = v.get_fields()
-        return fields
-
-
-class StructArray(Struct):
-    item_struct = None
-    array_size = None
-
-    def __init__(self, data, endian='<'):
-        if not isinstance(data, (str, bytes)):
-            data = data.read(self.size())
-        items = []
-        isize = self.item_struct.size()
-        for i in range(self.array_size):
-            d = data[:isize]
-            data = data[isize:]
-            items.append(self.item_struct(d, endian))
-        self.array = items
-
-    def __getitem__(self, i):
-        return self.array[i]
-
-    @classmethod
-    def size(self):
-        return self.item_struct.size() * self.array_size
-
-    def __repr__(self, indent=0):
-        r = '    '*indent + '%s(\n' % self.__class__.__name__
-        for item in self.array:
-            r += item.__repr__(indent=indent+1) + ',\n'
-        r += '    '*indent + ')'
-        return r
-
-
-def cstr(byt):
-    """Convert C string bytes to python string.
-    """
-    try:
-        ind = byt.index(b'\0')
-    except ValueError:
-        return byt
-    return byt[:ind].decode('utf-8', errors='ignore')
-
-
-class BundleItem(Struct):
-    field_info = [
-        ('Start', 'i'),
-        ('Length', 'i'),
-        ('Extension', '8s', cstr),
-    ]
-    size_check = 16
-
-
-class BundleHeader(Struct):
-    field_info = [
-        ('Signature', '8s', cstr),
-        ('Version', '32s', cstr),
-        ('Time', 'd'),
-        ('Items', 'i'),
-        ('IsLittleEndian', '12s'),
-        ('BundleItems', BundleItem.array(12)),
-    ]
-    size_check = 256
-
-
-class TreeNode(Struct):
-    """Struct that also represents a node in a Pulse file tree.
-    """
-    def __init__(self, fh, pul, level=0):
-        self.level = level
-        self.children = []
-        endian = pul.endian
-
-        # The record structure in the file may differ from our expected structure
-        # due to version differences, so we read the required number of bytes, and
-        # then pad or truncate before unpacking the record. This will probably
-        # result in corrupt data in some situations..
-        realsize = pul.level_sizes[level]
-        structsize = self.size()
-        data = fh.read(realsize)
-        diff = structsize - realsize
-        if diff > 0:
-            data = data + b'\0'*diff
-        else:
-            data = data[:structsize]
-
-        # initialize struct data
-        Struct.__init__(self, data, endian)
 
-        # Next read the number of children
-        nchild = struct.unpack(endian + 'i', fh.read(4))[0]
+from .heka_struct import (Struct, cstr, BundleHeader, TreeNode, TreeFile)
 
-        level += 1
-        if level >= len(pul.rectypes):
-            return
-        child_rectype = pul.rectypes[level]
-        for i in range(nchild):
-            self.children.append(child_rectype(fh, pul, level))
-
-    def __getitem__(self, i):
-        return self.children[i]
-
-    def __len__(self):
-        return len(self.children)
-
-    def __iter__(self):
-        return self.children.__iter__()
+'''
+    A not so nice way to import HoleyPy, Fix before release
+    (ePhysModule star-imports this reader before it puts HoleyPy on sys.path itself)
+'''
+import sys
+sys.path.insert(0, os.path.abspath('../HoleyPy'))
+from holeypy import TimeAxis
 
-    def __repr__(self, indent=0):
-        # Return a string describing this structure
-        ind = '    '*indent
-        srep = Struct.__repr__(self, indent)[:-1]  # exclude final parenthese
-        srep += ind + '    children = %d,\n' % len(self)
-        #srep += ind + 'children = [\n'
-        #for ch in self:
-            #srep += ch.__repr__(indent=indent+1) + ',\n'
-        srep += ind + ')'
-        return srep
+logger = logging.getLogger(__name__)
 
 
 class TraceRecord(TreeNode):
@@ -709,7 +458,7 @@ class StimulationRecord(TreeNode):
     size_check = 248
 
 
-class Pulsed(TreeNode):
+class Pulsed(TreeFile):
     field_info = [
         ('Version', 'i'),
         ('Mark', 'i'),
@@ -733,30 +482,7 @@ class Pulsed(TreeNode):
         TraceRecord
     ]
 
-    def __init__(self, bundle, offset=0, size=None):
-        fh = open(bundle.file_name, 'rb')
-        fh.seek(offset)
-
-        # read .pul header
-        magic = fh.read(4)
-        if magic == b'eerT':
-            self.endian = '<'
-        elif magic == b'Tree':
-            self.endian = '>'
-        else:
-            raise RuntimeError('Bad file magic: %s' % magic)
-
-        levels = struct.unpack(self.endian + 'i', fh.read(4))[0]
-
-        # read size of each level (one int per level)
-        self.level_sizes = []
-        for i in range(levels):
-            size = struct.unpack(self.endian + 'i', fh.read(4))[0]
-            self.level_sizes.append(size)
-
-        TreeNode.__init__(self, fh, self)
-
-class StimFile(TreeNode):
+class StimFile(TreeFile):
     field_info = [
         ('Version', 'i'),
         ('Mark', 'i'),
@@ -778,48 +504,116 @@ class StimFile(TreeNode):
         StimSegmentRecord,
     ]
 
-    def __init__(self, bundle, offset=0, size=None):
-        fh = open(bundle.file_name, 'rb')
-        fh.seek(offset)
-
-        # read .pul header
-        magic = fh.read(4)
-        if magic == b'eerT':
-            self.endian = '<'
-        elif magic == b'Tree':
-            self.endian = '>'
-        else:
-            raise RuntimeError('Bad file magic: %s' % magic)
 
-        levels = struct.unpack(self.endian + 'i', fh.read(4))[0]
+# Sample types of TraceRecord.DataFormat, as this reader has always decoded them
+_data_formats = [np.int16, np.int32, np.float16, np.float32]
+
+
+class TraceView(object):
+    """Zero-copy view over the samples of a single trace.
+
+    *raw* holds the samples in their on-disk dtype, usually a view into the
+    memory-mapped bundle. The DataScaler/ZeroData scaling is only applied to
+    the samples that are actually requested::
+
+        view = bundle.data.view([group_ind, series_ind, sweep_ind, trace_ind])
+        y = view[1000:2000]     # reads and scales 1000 samples
+        y = np.asarray(view)    # reads and scales the full trace
+    """
+    def __init__(self, raw, scaler=1.0, zero=0.0):
+        self.raw = raw
+        self.scaler = scaler
+        self.zero = zero
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, key):
+        return self.raw[key] * self.scaler + self.zero
 
-        # read size of each level (one int per level)
-        self.level_sizes = []
-        for i in range(levels):
-            size = struct.unpack(self.endian + 'i', fh.read(4))[0]
-            self.level_sizes.append(size)
+    def __array__(self, dtype=None, copy=None):
+        data = self[:]
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+        return data
 
-        TreeNode.__init__(self, fh, self)
+    @property
+    def shape(self):
+        return self.raw.shape
+
+    def fill(self, out, start=0, stop=None):
+        """Scale samples [start:stop] straight into *out*, without temporaries.
+        """
+        np.multiply(self.raw[start:stop], self.scaler, out=out)
+        out += self.zero
+        return out
+
+    def envelope(self, edges, start=0, stop=None):
+        """Minimum and maximum of samples [start:stop] in the bins starting at *edges*.
+
+        *edges* are increasing sample offsets relative to *start*, the first must
+        be 0. The extremes are found on the raw samples and only the results are
+        scaled, so the trace is read once and never converted as a whole.
+        """
+        raw = self.raw[start:stop]
+        low = np.minimum.reduceat(raw, edges) * self.scaler + self.zero
+        high = np.maximum.reduceat(raw, edges) * self.scaler + self.zero
+        if self.scaler < 0:
+            low, high = high, low
+        return low, high
 
 
 class Data(object):
     def __init__(self, bundle, offset=0, size=None):
         self.bundle = bundle
         self.offset = offset
+        self._memmap = None
 
-    def __getitem__(self, *args):
-        index = args[0]
+    @property
+    def memmap(self):
+        """The bundle file mapped read-only as bytes, created once on first use.
+        """
+        if self._memmap is None:
+            self._memmap = np.memmap(self.bundle.file_name, dtype=np.uint8, mode='r')
+        return self._memmap
+
+    def close(self):
+        """Release the memory map; views handed out before stay valid.
+        """
+        self._memmap = None
+
+    def _trace(self, index):
         assert len(index) == 4
         pul = self.bundle.pul
-        trace = pul[index[0]][index[1]][index[2]][index[3]]
+        return pul[index[0]][index[1]][index[2]][index[3]]
 
-        # file_name = self.bundle.catalog['.dat']
-        # fh = open(file_name, 'rb')
-        fh = open(self.bundle.file_name, 'rb')
-        fh.seek(trace.Data)
+    def view(self, index):
+        """Return a lazily scaled TraceView of the trace at *index*.
+        """
+        trace = self._trace(index)
+        return self.record_view(trace.Data, trace.DataPoints, bytearray(trace.DataFormat)[0],
+                                trace.DataScaler, trace.ZeroData)
+
+    def record_view(self, offset, points, data_format, scaler=1.0, zero=0.0, endian=None):
+        """Return a TraceView of *points* samples stored at byte *offset*.
+        """
+        if endian is None:
+            endian = self.bundle.pul.endian
+        dtype = np.dtype(_data_formats[data_format]).newbyteorder(endian)
+        raw = np.ndarray(shape=(points,), dtype=dtype, buffer=self.memmap, offset=offset)
+        return TraceView(raw, scaler, zero)
+
+    def __getitem__(self, *args):
+        index = args[0]
+        if self.bundle.use_memmap:
+            return np.asarray(self.view(index))
+
+        trace = self._trace(index)
         fmt = bytearray(trace.DataFormat)[0]
-        dtype = [np.int16, np.int32, np.float16, np.float32][fmt]
-        data = np.fromfile(fh, count=trace.DataPoints, dtype=dtype)
+        dtype = np.dtype(_data_formats[fmt]).newbyteorder(self.bundle.pul.endian)
+        with open(self.bundle.file_name, 'rb') as fh:
+            fh.seek(trace.Data)
+            data = np.fromfile(fh, count=trace.DataPoints, dtype=dtype)
         return data * trace.DataScaler + trace.ZeroData
 
 
@@ -831,7 +625,8 @@ class Bundle(object):
         '.pgf': StimFile,
     }
 
-    def __init__(self, file_name):
+    def __init__(self, file_name, use_memmap=True):
+        self.use_memmap = use_memmap
         if type(file_name) is tuple:
             self.file_name = file_name[0]
         else:
@@ -875,6 +670,13 @@ class Bundle(object):
         """
         return self._get_item_instance('.pgf')
 
+    def close(self):
+        """Release the memory map of the data item, if it was opened.
+        """
+        data = self.catalog['.dat'].instance if '.dat' in self.catalog else None
+        if data is not None:
+            data.close()
+
     def _get_item_instance(self, ext):
         if ext not in self.catalog:
             return None
@@ -888,31 +690,167 @@ class Bundle(object):
         return "Bundle(%r)" % list(self.catalog.keys())
 
 
+# One row per tree node (root, groups, series, sweeps and traces), missing
+# indices are -1. Trace rows also carry everything needed to read the data.
+_index_dtype = np.dtype([
+    ('group', 'i4'), ('series', 'i4'), ('sweep', 'i4'), ('trace', 'i4'),
+    ('type', 'U32'), ('label', 'U32'),
+    ('Data', 'i8'), ('DataPoints', 'i8'), ('DataFormat', 'u1'),
+    ('DataScaler', 'f8'), ('ZeroData', 'f8'), ('XInterval', 'f8'), ('XStart', 'f8'),
+])
+
+
+class IndexCache(object):
+    """Sidecar file holding the flattened pulse tree of a .dat file.
+
+    The cache lives next to the data as ``<file_name>.idx`` and is keyed on the
+    file size, modification time and a hash of the bundle header; it is rebuilt
+    whenever any of these change.
+    """
+    version = 1
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.cache_name = file_name + '.idx'
+
+    def key(self):
+        stat = os.stat(self.file_name)
+        with open(self.file_name, 'rb') as fh:
+            digest = hashlib.sha1(fh.read(BundleHeader.size())).hexdigest()
+        return stat.st_size, stat.st_mtime_ns, digest
+
+    def load(self):
+        """Return (table, endian) from the cache, or None if it is missing or stale.
+        """
+        try:
+            with np.load(self.cache_name, allow_pickle=False) as cache:
+                size, mtime, digest = self.key()
+                if any([int(cache['version']) != self.version,
+                        int(cache['size']) != size,
+                        int(cache['mtime']) != mtime,
+                        str(cache['digest']) != digest]):
+                    return None
+                return cache['table'], str(cache['endian'])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def save(self, table, endian):
+        size, mtime, digest = self.key()
+        tmp_name = self.cache_name + '.tmp'
+        try:
+            with open(tmp_name, 'wb') as fh:
+                np.savez(fh, version=self.version, size=size, mtime=mtime, digest=digest,
+                         endian=endian, table=table)
+            os.replace(tmp_name, self.cache_name)
+        except OSError:
+            # A read-only data folder only costs us the cache
+            pass
+
+
+class HekaIndex(object):
+    """Lightweight, picklable handle on an indexed .dat file.
+
+    Holds the flattened pulse tree (see _index_dtype) and byte order, but no
+    open file or sample data; pass it to NanoporeHEKA(file_path, index=...) to
+    open the file without parsing the tree again.
+    """
+    __slots__ = ('file_path', 'table', 'endian')
+
+    def __init__(self, file_path, table, endian):
+        self.file_path = file_path
+        self.table = table
+        self.endian = endian
+
+    def __len__(self):
+        return len(self.table)
+
+    def __repr__(self):
+        return "HekaIndex(%r, %s nodes)" % (self.file_path, len(self.table))
+
+
+def index_bundle(file_path, use_cache=True, bundle=None):
+    """Read the header and pulse tree of a .dat file into a HekaIndex.
+
+    The sidecar IndexCache is used (and written) when *use_cache* is set.
+    """
+    cache = IndexCache(file_path) if use_cache else None
+    cached = cache.load() if cache else None
+    if cached is not None:
+        return HekaIndex(file_path, *cached)
+
+    if bundle is None:
+        bundle = Bundle(file_path, use_memmap=False)
+    if bundle.pul is None:
+        raise ValueError('No pulse tree in %s' % file_path)
+    table, endian = NanoporeHEKA._build_table(bundle.pul), bundle.pul.endian
+    if cache:
+        cache.save(table, endian)
+    return HekaIndex(file_path, table, endian)
+
+
+def _index_bundle_worker(args):
+    file_path, use_cache = args
+    try:
+        return file_path, index_bundle(file_path, use_cache)
+    except (OSError, ValueError, struct.error) as e:
+        # Unreadable or malformed files only, programming errors are raised
+        logger.error("Unable to index %s: %s" % (file_path, e))
+        return file_path, None
+
+
+def index_bundles(file_paths, processes=None, use_cache=True):
+    """Index many .dat files in a process pool.
+
+    Yields (done, total, file_path, index) as soon as each file is indexed, in order of
+    completion; index is None for files that could not be read. Only the
+    headers and pulse trees are parsed, the samples stay on disk until a
+    NanoporeHEKA is opened from the index.
+    """
+    file_paths = list(file_paths)
+    total = len(file_paths)
+    if processes is None:
+        processes = min(total, os.cpu_count() or 1)
+    if processes <= 1:
+        results = map(_index_bundle_worker, [(f, use_cache) for f in file_paths])
+        for done, (file_path, index) in enumerate(results, 1):
+            yield done, total, file_path, index
+        return
+
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.imap_unordered(_index_bundle_worker, [(f, use_cache) for f in file_paths])
+        for done, (file_path, index) in enumerate(results, 1):
+            yield done, total, file_path, index
+
+
 class NanoporeHEKA:
     '''
         Description
     '''
-    def __init__(self, file_path):
+    def __init__(self, file_path, use_cache=True, index=None):
         self.file_path = file_path
         self.bundle = Bundle(file_path)
-        self.root = self.bundle.pul
+        if index is None:
+            index = index_bundle(file_path, use_cache, bundle=self.bundle)
+        self.table, self.endian = index.table, index.endian
+
         self.items = list()
         self.indexes = list()
         self.index = list()
         self._fetch_items()
+        self._build_lookup()
 
-
-        print(self.indexes)
+        # Siblings are the items that only differ in their sweep
         index = deepcopy(np.array(self.indexes))
         index[:, 2] = 0
+        _, inverse, counts = np.unique(index, axis=0, return_inverse=True, return_counts=True)
+        for item, n in zip(self.items, counts[inverse.ravel()]):
+            item.siblings = int(n)
 
-        unique, counts = np.unique([str(i) for i in index], return_counts=True)
-        siblings = dict(zip(unique, counts))
-        print(siblings)
-
-        for c, idx in enumerate(index):
-            self.items[c].siblings = siblings[str(idx)]
-
+    @property
+    def root(self):
+        """The parsed pulse tree, only read from the file when it is needed.
+        """
+        return self.bundle.pul
 
     def get_sweeps(self, series=0):
         x = np.array(self.indexes)
@@ -948,118 +886,258 @@ class NanoporeHEKA:
                 group, series, sweep, trace = index + [None] * (4 - len(index))
         except ValueError:
             pass
-        filtered_items = list()
-        for item in self.items:
-            if all([group is None or str(group) == str(item.group),
-                    series is None or str(series) == str(item.series),
-                    sweep is None or str(sweep) == str(item.sweep),
-                    trace is None or str(trace) == str(item.trace)]):
-                filtered_items.append(item)
-        return filtered_items
-
-    def _fetch_items(self, index=[]):
-        item = NanoDataItem(self.file_path, self.bundle)
-        item.group, item.series, item.sweep, item.trace = index + [None] * (4 - len(index))
-        item.node = self.root
-        for i in index:
-            item.node = item.node[i]
-        item.children = list()
-        item.index = index
-        item.type = item.node.__class__.__name__
-        if item.type.endswith('Record'):
-            item.type = item.type[:-6]
-        try:
-            item.type += str(getattr(item.node, item.type + 'Count'))
-        except AttributeError:
-            pass
-        try:
-            item.label = item.node.Label
-        except AttributeError:
-            item.label = ''
-
-        self._fetch_children(item.node.children, index)
-        self.items.append(item)
-        self.indexes.append(np.array(index + [0] * (4 - len(index))))
-        self.index.append(np.array(index))
-        # self.sampling_frequency = item.sampling_frequency
-        # self.sampling_period = item.sampling_period
-
-    def _fetch_children(self, children, index):
-        print(len(children))
-        for i, child in enumerate(children):
-            self._fetch_items(index=index + [i])
+        keys = [None if k is None else int(k) for k in (group, series, sweep, trace)]
+        given = [k is not None for k in keys]
+
+        # A leading run of keys selects a whole subtree, look it up directly
+        n_given = sum(given)
+        if given[:n_given] == [True] * n_given:
+            if n_given == 0:
+                return list(self.items)
+            positions = self._lookup[n_given - 1].get(tuple(keys[:n_given]), [])
+        else:
+            mask = np.ones(len(self.records), dtype=bool)
+            for field, key in zip(self.records.dtype.names, keys):
+                if key is not None:
+                    mask &= self.records[field] == key
+            positions = np.flatnonzero(mask)
+        return [self.items[i] for i in positions]
+
+    def _build_lookup(self):
+        """Index the items on (group, series, sweep, trace) for filter_items.
+
+        *records* holds the four indices of every item (-1 where not applicable),
+        *_lookup[k]* maps each index prefix of length k + 1 to the positions of the
+        items in that subtree.
+        """
+        self.records = np.rec.fromarrays([self.table[field] for field in ('group', 'series', 'sweep', 'trace')],
+                                         names='group,series,sweep,trace')
+        self._lookup = [dict() for _ in range(4)]
+        for position, index in enumerate(self.index):
+            index = tuple(int(i) for i in index)
+            for k in range(len(index)):
+                self._lookup[k].setdefault(index[:k + 1], []).append(position)
+
+    @staticmethod
+    def _build_table(root):
+        """Flatten the pulse tree into an _index_dtype table, children before parents.
+        """
+        rows = list()
+
+        def walk(node, index):
+            for i, child in enumerate(node.children):
+                walk(child, index + [i])
+            node_type = node.__class__.__name__
+            if node_type.endswith('Record'):
+                node_type = node_type[:-6]
+            node_type += str(getattr(node, node_type + 'Count', ''))
+            row = (index + [-1] * (4 - len(index))) + [node_type, getattr(node, 'Label', '')]
+            if isinstance(node, TraceRecord):
+                row += [node.Data, node.DataPoints, bytearray(node.DataFormat)[0],
+                        node.DataScaler, node.ZeroData, node.XInterval, node.XStart]
+            else:
+                row += [0, 0, 0, 1.0, 0.0, 0.0, 0.0]
+            rows.append(tuple(row))
+
+        walk(root, [])
+        return np.array(rows, dtype=_index_dtype)
+
+    def _fetch_items(self):
+        for record in self.table:
+            item = NanoDataItem(self.file_path, self.bundle, record, self.endian)
+            self.items.append(item)
+            self.indexes.append(np.array(item.index + [0] * (4 - len(item.index))))
+            self.index.append(np.array(item.index))
+
+    @staticmethod
+    def stitch(items, out=None):
+        """Join the sweeps of *items* into one signal, in a single pass.
+
+        The output is sized from the index table first and every sweep is then
+        scaled straight from the memory-mapped bundle into its slice, so the
+        cost is linear in the number of samples and the only allocation is the
+        output itself (pass *out* to reuse a buffer).
+
+        Returns (signal, time, holding, offsets): the joined samples, one
+        continuous TimeAxis, the joined holding voltage and the start time of
+        every sweep in the joined signal.
+        """
+        points = np.array([int(item.record['DataPoints']) for item in items], dtype=np.int64)
+        bounds = np.concatenate(([0], np.cumsum(points)))
+        if out is None:
+            out = np.empty(bounds[-1], dtype=np.float64)
+        elif len(out) != bounds[-1]:
+            raise ValueError('out holds %s samples, the sweeps hold %s' % (len(out), bounds[-1]))
+
+        segments = {}
+        holding = []
+        for item, start, stop in zip(items, bounds[:-1], bounds[1:]):
+            if item.bundle.use_memmap:
+                item.view.fill(out[start:stop])
+            else:
+                out[start:stop] = item.bundle.data[item.index]
+            # The stimulus segments are shared by all sweeps of a series
+            if item.series not in segments:
+                segments[item.series] = item.stim_segments()
+            counts, voltage, increment = segments[item.series]
+            holding.append((counts, voltage + item.sweep * increment))
+
+        v_data = np.empty(sum(int(counts.sum()) for counts, _ in holding), dtype=np.float64)
+        position = 0
+        for counts, voltage in holding:
+            n = int(counts.sum())
+            v_data[position:position + n] = np.repeat(voltage, counts)
+            position += n
+
+        sampling_period = items[0].sampling_period if len(items) else 0
+        return out, TimeAxis(0, sampling_period, len(out)), v_data, bounds[:-1] * sampling_period
+
+    @staticmethod
+    def read_window(items, t0=0, t1=None, n_pixels=2000):
+        """Min/max envelope of the joined sweeps of *items* between t0 and t1 (s).
+
+        The window is divided in at most *n_pixels* bins of whole samples and the
+        extremes of every bin are computed straight from the memory-mapped raw
+        samples, so the cost does not depend on the window length beyond a
+        single read. When the window holds no more than 2 * n_pixels samples
+        every bin is one sample and the data is returned at full resolution.
+
+        Returns (time, y_min, y_max), time is a TimeAxis with the start of every
+        bin on the same time base as stitch(); y_min is y_max at full resolution.
+        """
+        points = np.array([int(item.record['DataPoints']) for item in items], dtype=np.int64)
+        bounds = np.concatenate(([0], np.cumsum(points)))
+        if len(items) == 0 or bounds[-1] == 0:
+            empty = np.empty(0, dtype=np.float64)
+            return TimeAxis(0, items[0].sampling_period if len(items) else 1, 0), empty, empty
+        sampling_period = items[0].sampling_period
+        axis = TimeAxis(0, sampling_period, bounds[-1])
+        first = axis.searchsorted(t0, 'left') if t0 is not None else 0
+        last = axis.searchsorted(t1, 'right') if t1 is not None else len(axis)
+        n = max(0, last - first)
+
+        if n <= 2 * n_pixels:
+            y_data = np.empty(n, dtype=np.float64)
+            for item, start, stop in zip(items, bounds[:-1], bounds[1:]):
+                a, b = max(first, start), min(last, stop)
+                if a < b:
+                    item.view.fill(y_data[a - first:b - first], a - start, b - start)
+            return axis[first:last], y_data, y_data
+
+        width = -(-n // n_pixels)
+        n_bins = -(-n // width)
+        y_min = np.full(n_bins, np.inf)
+        y_max = np.full(n_bins, -np.inf)
+        for item, start, stop in zip(items, bounds[:-1], bounds[1:]):
+            a, b = max(first, start), min(last, stop)
+            if a >= b:
+                continue
+            # Bins are aligned to the window, a sweep may start or end inside one
+            first_bin = (a - first) // width
+            edges = np.arange(first + first_bin * width, b, width)
+            edges[0] = a
+            low, high = item.view.envelope(edges - a, a - start, b - start)
+            bins = slice(first_bin, first_bin + len(edges))
+            np.minimum(y_min[bins], low, out=y_min[bins])
+            np.maximum(y_max[bins], high, out=y_max[bins])
+        return TimeAxis(first * sampling_period, width * sampling_period, n_bins), y_min, y_max
 
     @staticmethod
     def fetch_and_concat(items):
-        x0 = 0
-        y_data = np.array([])
-        x_data = np.array([])
-        v_data = np.array([])
-        for c, item in enumerate(items):
-            y, x = item.data
-            v_hold, _ = item.stim
-            y_data = np.concatenate((y_data, y))
-            x_data = np.concatenate((x_data, x+x0))
-            v_data = np.concatenate((v_data, v_hold))
-            x0 += max(x)
+        y_data, x_data, v_data, _ = NanoporeHEKA.stitch(items)
         return y_data, x_data, v_data
 
 '''
 Description
 '''
 class NanoDataItem:
-    def __init__(self, file_path, bundle):
-        self.group, self.series, self.sweep, self.trace = None, None, None, None
+    __slots__ = ('group', 'series', 'sweep', 'trace', 'index', 'children', 'siblings', 'type', 'label',
+                 'file_path', 'bundle', 'record', 'endian', 'sampling_period', 'sampling_frequency',
+                 '_node', '_view')
+
+    def __init__(self, file_path, bundle, record, endian='<'):
+        self.index = [int(i) for i in (record['group'], record['series'], record['sweep'], record['trace']) if i >= 0]
+        self.group, self.series, self.sweep, self.trace = self.index + [None] * (4 - len(self.index))
+        self.children = list()
         self.siblings = 0
+        self.type = str(record['type'])
+        self.label = str(record['label'])
         self.file_path = file_path
         self.bundle = bundle
+        self.record = record
+        self.endian = endian
+        self.sampling_period = float(record['XInterval'])
+        self.sampling_frequency = 1 / self.sampling_period if self.sampling_period else None
+        self._node = None
+        self._view = None
 
-    def __getattr__(self, name):
-        index = [self.group, self.series, self.sweep, self.trace]
-        node = self.bundle.pul
-        for i in index:
-            node = node[i]
-
-        if name == "data":
-            y = np.array(self.bundle.data[index])
-            x = np.linspace(node.XStart, node.XStart + node.XInterval * (len(y) - 1), len(y))
-            return y, x
-        elif name == "stim":
-            stimulus = self.bundle.pgf
-            stimulus_record = stimulus.children[self.series]
-            channel_record = stimulus_record.children[0]
-            sampling_period = stimulus_record.SampleInterval
-            v_hold = []
-            for idx, seg in enumerate(channel_record.children):
-                segment_samples = int(seg.Duration / sampling_period) - 2
-                v_hold += segment_samples * [seg.Voltage + self.sweep*seg.DeltaVIncrement*seg.DeltaVFactor]
-            x = np.linspace(node.XStart, node.XStart + node.XInterval * (len(v_hold) - 1), len(v_hold))
-            return v_hold, x
-        elif name == "IV":
-            print(self.siblings)
-            stimulus = self.bundle.pgf
-            stimulus_record = stimulus.children[self.series]
-            channel_record = stimulus_record.children[0]
-            sampling_period = stimulus_record.SampleInterval
-            voltage = []
-            current = []
-            try:
-                for sweep in range(self.siblings):
-                    index = [self.group, self.series, sweep, self.trace]
-                    y = np.array(self.bundle.data[index])
-                    t0 = 0
-                    for idx, seg in enumerate(channel_record.children):
-                        segment_samples = int(seg.Duration / sampling_period) - 2
-                        if seg.DeltaVIncrement != 0:
-                            current.append(np.mean(y[t0:t0+segment_samples]))
-                            voltage.append(seg.Voltage + sweep * seg.DeltaVIncrement * seg.DeltaVFactor)
-                        t0 += segment_samples
-            except IndexError:
-                pass
-            return np.array(voltage), np.array(current)
-        elif name == "sampling_period":
-            return node.XInterval
-        elif name == "sampling_frequency":
-            return 1 / node.XInterval
-        else:
-            return 'NanoDataItem does not have `{}` attribute.'.format(str(name))
+    @property
+    def node(self):
+        """The TreeNode of this item, resolved from the pulse tree once.
+        """
+        if self._node is None:
+            node = self.bundle.pul
+            for i in self.index:
+                node = node[i]
+            self._node = node
+        return self._node
+
+    @property
+    def view(self):
+        """Zero-copy TraceView of the samples of this item.
+        """
+        if self._view is None:
+            record = self.record
+            self._view = self.bundle.data.record_view(int(record['Data']), int(record['DataPoints']),
+                                                      int(record['DataFormat']), float(record['DataScaler']),
+                                                      float(record['ZeroData']), endian=self.endian)
+        return self._view
+
+    @property
+    def time(self):
+        return TimeAxis(float(self.record['XStart']), self.sampling_period, int(self.record['DataPoints']))
+
+    @property
+    def data(self):
+        return np.asarray(self.view), self.time
+
+    def stim_segments(self):
+        """Samples, voltage and per-sweep voltage increment of each stimulus segment.
+        """
+        stimulus_record = self.bundle.pgf.children[self.series]
+        channel_record = stimulus_record.children[0]
+        sampling_period = stimulus_record.SampleInterval
+        segments = channel_record.children
+        counts = np.array([max(0, int(seg.Duration / sampling_period) - 2) for seg in segments], dtype=np.int64)
+        voltage = np.array([seg.Voltage for seg in segments], dtype=np.float64)
+        increment = np.array([seg.DeltaVIncrement * seg.DeltaVFactor for seg in segments], dtype=np.float64)
+        return counts, voltage, increment
+
+    @property
+    def stim(self):
+        counts, voltage, increment = self.stim_segments()
+        v_hold = np.repeat(voltage + self.sweep * increment, counts)
+        return v_hold, TimeAxis(float(self.record['XStart']), self.sampling_period, len(v_hold))
+
+    @property
+    def IV(self):
+        stimulus = self.bundle.pgf
+        stimulus_record = stimulus.children[self.series]
+        channel_record = stimulus_record.children[0]
+        sampling_period = stimulus_record.SampleInterval
+        voltage = []
+        current = []
+        try:
+            for sweep in range(self.siblings):
+                index = [self.group, self.series, sweep, self.trace]
+                y = np.array(self.bundle.data[index])
+                t0 = 0
+                for idx, seg in enumerate(channel_record.children):
+                    segment_samples = int(seg.Duration / sampling_period) - 2
+                    if seg.DeltaVIncrement != 0:
+                        current.append(np.mean(y[t0:t0+segment_samples]))
+                        voltage.append(seg.Voltage + sweep * seg.DeltaVIncrement * seg.DeltaVFactor)
+                    t0 += segment_samples
+        except IndexError:
+            pass
+        return np.array(voltage), np.array(current)
@@ -0,0 +1,394 @@
+"""
+Shared record decoder for the Heka Patchmaster readers (heka_reader and
+HekaReader.HEKA_Reader_MAIN).
+
+Every record layout (a Struct *field_info* list) is compiled once into a NumPy
+structured dtype. Trees (.pul, .pgf) are read in two passes: a scan that only
+follows the child counts to find the offset of every record, and a decode that
+gathers all records of a level from the memory-mapped file in a single call.
+Field values are converted to Python objects only when they are accessed.
+
+Example::
+
+    class MyStruct(Struct):
+        field_info = [
+            ('char_field', 'c'),                # single char
+            ('char_array', '8c'),               # list of 8 chars
+            ('str_field',  '8s', cstr),         # C string of len 8
+            ('sub_struct', MyOtherStruct),      # dict generated by s2.unpack
+            ('filler', '32s', None),            # ignored field
+        ]
+        size_check = 300
+
+    fh = open(fname, 'rb')
+    data = MyStruct(fh)
+"""
+import numpy as np
+import re, struct, collections
+
+
+# NumPy equivalents of the struct format characters (standard sizes)
+_numpy_codes = {
+    'b': 'i1', 'B': 'u1', '?': '?',
+    'h': 'i2', 'H': 'u2', 'i': 'i4', 'I': 'u4', 'l': 'i4', 'L': 'u4',
+    'q': 'i8', 'Q': 'u8', 'e': 'f2', 'f': 'f4', 'd': 'f8',
+}
+
+
+class Struct(object):
+    """High-level wrapper around a NumPy structured dtype that makes it a bit
+    easier to unpack large, nested structures.
+
+    * Unpacks to dictionary allowing fields to be retrieved by name
+    * Optionally massages field data on read
+    * Handles arrays and nested structures
+
+    *fields* must be a list of tuples like (name, format) or (name, format, function)
+    where *format* must be a simple struct format string like 'i', 'd',
+    '32s', or '4d'; or another Struct instance.
+
+    *function* may be either a function that filters the data for that field
+    or None to exclude the field altogether.
+
+    If *size* is given, then an exception will be raised if the final struct size
+    does not match the given size.
+    """
+    field_info = None
+    size_check = None
+    _fields_parsed = None
+
+    def __init__(self, data, endian='<'):
+        """Read the structure from *data* and return an ordered dictionary of
+        fields.
+
+        *data* may be a string or file.
+        *endian* may be '<' or '>'
+        """
+        if not isinstance(data, (str, bytes)):
+            data = data.read(self.size())
+        record = np.frombuffer(data, dtype=self.dtype(endian), count=1)[0]
+        self._record = record
+        self._endian = endian
+        fields = collections.OrderedDict()
+        for name, key, fmt, func in self._field_info():
+            if func is not None:
+                fields[name] = self._decode(record, key, fmt, func, endian)
+                setattr(self, name, fields[name])
+        self.fields = fields
+
+    @classmethod
+    def _field_info(cls):
+        """Compile *field_info* into a list of (name, dtype field, format, function).
+        """
+        if cls.__dict__.get('_fields_parsed') is not None:
+            return cls._fields_parsed
+
+        fields = []
+        formats = []
+        offsets = []
+        offset = 0
+        for c, items in enumerate(cls.field_info):
+            if len(items) == 3:
+                name, ifmt, func = items
+            else:
+                name, ifmt = items
+                func = True
+
+            if isinstance(ifmt, type) and issubclass(ifmt, Struct):
+                func = (ifmt, func)  # instructs to unpack with sub-struct before calling function
+                ifmt = '%ds' % ifmt.size()
+            elif re.fullmatch(r'\d*[xcbB?hHiIlLqQefds]', ifmt) is None:
+                raise TypeError('Unsupported format string "%s"' % ifmt)
+
+            count = int(ifmt[:-1]) if len(ifmt) > 1 else 1
+            code = ifmt[-1]
+            if code in 'xcs':
+                formats.append('V%d' % count)
+            elif count == 1:
+                formats.append(_numpy_codes[code])
+            else:
+                formats.append((_numpy_codes[code], (count,)))
+            offsets.append(offset)
+            offset += struct.calcsize('<' + ifmt)
+            # Field names may repeat (e.g. fillers), so the dtype uses positions
+            fields.append((name, 'f%d' % c, ifmt, func))
+
+        cls._layout = {'names': [key for _, key, _, _ in fields], 'formats': formats,
+                       'offsets': offsets, 'itemsize': offset}
+        cls._dtypes = {}
+        cls._field_map = {name: (key, fmt, func) for name, key, fmt, func in fields if func is not None}
+        cls._fields_parsed = fields
+        if cls.size_check is not None:
+            assert offset == cls.size_check
+        return fields
+
+    @classmethod
+    def dtype(cls, endian='<'):
+        """The NumPy structured dtype of this record in *endian* byte order.
+        """
+        cls._field_info()
+        if endian not in ('<', '>'):
+            raise ValueError('Invalid endian: %s' % endian)
+        if endian not in cls._dtypes:
+            cls._dtypes[endian] = np.dtype(cls._layout).newbyteorder(endian)
+        return cls._dtypes[endian]
+
+    @staticmethod
+    def _decode(record, key, fmt, func, endian):
+        """Convert one field of a structured *record* like struct.unpack would.
+        """
+        value = record[key]
+        code = fmt[-1]
+        if isinstance(func, tuple):
+            substr, func = func
+            value = substr(value.tobytes(), endian)
+        elif code == 's':
+            value = value.tobytes()
+        elif code in 'xc':
+            value = value.tobytes()
+            if len(fmt) > 1:
+                value = tuple(value[i:i + 1] for i in range(len(value)))
+        elif len(fmt) > 1:
+            value = tuple(value.tolist())
+        else:
+            value = value.item()
+        if func is not True:
+            value = func(value)
+        return value
+
+    @classmethod
+    def size(cls):
+        cls._field_info()
+        return cls._layout['itemsize']
+
+    @classmethod
+    def array(cls, x):
+        """Return a new StructArray class of length *x* and using this struct
+        as the array item type.
+        """
+        return type(cls.__name__+'[%d]'%x, (StructArray,),
+                    {'item_struct': cls, 'array_size': x})
+
+    def __repr__(self, indent=0):
+        indent_str = '    '*indent
+        r = indent_str + '%s(\n'%self.__class__.__name__
+        if not hasattr(self, 'fields'):
+            r = r[:-1] + '<initializing>)'
+            return r
+        for k,v in self.fields.items():
+            if isinstance(v, Struct):
+                r += indent_str + '    %s = %s\n' % (k, v.__repr__(indent=indent+1).lstrip())
+            else:
+                r += indent_str + '    %s = %r\n' % (k, v)
+        r += indent_str + ')'
+        return r
+
+    def get_fields(self):
+        """Recursively convert struct fields+values to nested dictionaries.
+        """
+        fields = self.fields.copy()
+        for k,v in fields.items():
+            if isinstance(v, StructArray):
+                fields[k] = [x.get_fields() for x in v.array]
+            elif isinstance(v, Struct):
+                fields[k] = v.get_fields()
+        return fields
+
+
+class StructArray(Struct):
+    item_struct = None
+    array_size = None
+
+    def __init__(self, data, endian='<'):
+        if not isinstance(data, (str, bytes)):
+            data = data.read(self.size())
+        isize = self.item_struct.size()
+        self.array = [self.item_struct(data[i * isize:(i + 1) * isize], endian) for i in range(self.array_size)]
+
+    def __getitem__(self, i):
+        return self.array[i]
+
+    @classmethod
+    def size(self):
+        return self.item_struct.size() * self.array_size
+
+    def __repr__(self, indent=0):
+        r = '    '*indent + '%s(\n' % self.__class__.__name__
+        for item in self.array:
+            r += item.__repr__(indent=indent+1) + ',\n'
+        r += '    '*indent + ')'
+        return r
+
+
+def cstr(byt):
+    """Convert C string bytes to python string.
+    """
+    try:
+        ind = byt.index(b'\0')
+    except ValueError:
+        return byt
+    return byt[:ind].decode('utf-8', errors='ignore')
+
+
+class BundleItem(Struct):
+    field_info = [
+        ('Start', 'i'),
+        ('Length', 'i'),
+        ('Extension', '8s', cstr),
+    ]
+    size_check = 16
+
+
+class BundleHeader(Struct):
+    field_info = [
+        ('Signature', '8s', cstr),
+        ('Version', '32s', cstr),
+        ('Time', 'd'),
+        ('Items', 'i'),
+        ('IsLittleEndian', '12s'),
+        ('BundleItems', BundleItem.array(12)),
+    ]
+    size_check = 256
+
+
+class TreeNode(Struct):
+    """Struct that also represents a node in a Pulse file tree.
+
+    Nodes are created by TreeFile from row *row* of the decoded level table
+    *records*; the fields of a node are only converted when first accessed.
+    """
+    def __init__(self, records, row=0, endian='<', level=0):
+        self._records = records
+        self._row = row
+        self._endian = endian
+        self.level = level
+        self.children = []
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not set yet, i.e. undecoded fields
+        if name.startswith('_') or name not in self._field_map:
+            raise AttributeError(name)
+        key, fmt, func = self._field_map[name]
+        value = self._decode(self._records[self._row], key, fmt, func, self._endian)
+        setattr(self, name, value)
+        return value
+
+    @property
+    def fields(self):
+        return collections.OrderedDict((name, getattr(self, name)) for name in self._field_map)
+
+    def __getitem__(self, i):
+        return self.children[i]
+
+    def __len__(self):
+        return len(self.children)
+
+    def __iter__(self):
+        return self.children.__iter__()
+
+    def __repr__(self, indent=0):
+        # Return a string describing this structure
+        ind = '    '*indent
+        srep = Struct.__repr__(self, indent)[:-1]  # exclude final parenthese
+        srep += ind + '    children = %d,\n' % len(self)
+        srep += ind + ')'
+        return srep
+
+
+class TreeFile(TreeNode):
+    """Root of a tree file (.pul, .pgf), decoded level by level.
+
+    The file starts with a magic word, the number of levels and the record size
+    of every level, followed by the records in depth-first order; every record
+    is followed by its number of children. The record structure in the file
+    may differ from our expected structure due to version differences, so each
+    record is padded with zeros or truncated to the size of its rectype. This
+    will probably result in corrupt data in some situations..
+    """
+    rectypes = [None]
+    magic = {b'eerT': '<', b'Tree': '>'}
+
+    def __init__(self, bundle, offset=0, size=None):
+        buf = np.memmap(bundle.file_name, dtype=np.uint8, mode='r')
+        if size:
+            buf = buf[offset:offset + size]
+        else:
+            buf = buf[offset:]
+
+        magic = buf[:4].tobytes()
+        if magic not in self.magic:
+            raise ValueError('Bad file magic: %s' % magic)
+        self.endian = self.magic[magic]
+
+        levels = struct.unpack_from(self.endian + 'i', buf, 4)[0]
+        self.level_sizes = list(struct.unpack_from(self.endian + '%di' % levels, buf, 8))
+
+        rectypes = [type(self)] + list(self.rectypes[1:])
+        offsets, parents = self._scan(buf, 8 + 4 * levels, len(rectypes))
+        records = [self._decode_level(buf, level, rectypes[level], offsets[level])
+                   for level in range(len(rectypes))]
+        del buf
+
+        TreeNode.__init__(self, records[0], 0, self.endian)
+        nodes = [self]
+        for level in range(1, len(rectypes)):
+            new = rectypes[level].__new__
+            level_nodes = []
+            for row, parent in enumerate(parents[level]):
+                # Same as TreeNode.__init__, but this loop runs once per record
+                node = new(rectypes[level])
+                node.__dict__ = {'_records': records[level], '_row': row, '_endian': self.endian,
+                                 'level': level, 'children': []}
+                nodes[parent].children.append(node)
+                level_nodes.append(node)
+            nodes = level_nodes
+
+    def _scan(self, buf, position, n_levels):
+        """Follow the child counts to find the byte offset and parent of every record.
+        """
+        count = struct.Struct(self.endian + 'i')
+        sizes = self.level_sizes
+        offsets = [[] for _ in range(n_levels)]
+        parents = [[] for _ in range(n_levels)]
+        leaf = n_levels - 1
+
+        def walk(position, level, parent):
+            index = len(offsets[level])
+            offsets[level].append(position)
+            parents[level].append(parent)
+            position += sizes[level]
+            n_child = count.unpack_from(buf, position)[0]
+            position += 4
+            if level == leaf:
+                return position
+            if level + 1 == leaf:
+                # Leaves have no children, so sibling leaves follow each other at a fixed stride
+                stride = sizes[leaf] + 4
+                offsets[leaf].extend(range(position, position + n_child * stride, stride))
+                parents[leaf].extend([index] * n_child)
+                return position + n_child * stride
+            for _ in range(n_child):
+                position = walk(position, level + 1, index)
+            return position
+
+        walk(position, 0, -1)
+        offsets = [np.array(o, dtype=np.int64) for o in offsets]
+
+        # The stride shortcut above relies on this, check it for all leaves at once
+        if len(offsets[leaf]):
+            ends = offsets[leaf] + sizes[leaf]
+            counts = buf[ends[:, None] + np.arange(4)].copy().view(np.dtype(np.int32).newbyteorder(self.endian))
+            if np.any(counts):
+                raise ValueError('Records below level %d are not supported' % leaf)
+        return offsets, parents
+
+    def _decode_level(self, buf, level, rectype, offsets):
+        """Decode all records of one level with a single gather from the file.
+        """
+        dtype = rectype.dtype(self.endian)
+        n_bytes = min(self.level_sizes[level], dtype.itemsize)
+        # View the file as one (overlapping) record starting at every byte
+        records = np.ndarray((len(buf) - n_bytes + 1,), dtype='V%d' % n_bytes, buffer=buf, strides=(1,))
+        raw = np.zeros((len(offsets), dtype.itemsize), dtype=np.uint8)
+        raw[:, :n_bytes] = records[offsets].view(np.uint8).reshape(len(offsets), n_bytes)
+        return raw.view(dtype)[:, 0]
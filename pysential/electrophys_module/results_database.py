@@ -15,7 +15,7 @@ import os
 '''
 import sys
 sys.path.insert(0, os.path.abspath('../HoleyPy'))
-from holeypy import Trace, filters
+from holeypy import Trace, TimeAxis, filters
 from holeypy.analysis import (Levels, Events, Features, gNDF)
 
 
@@ -49,11 +49,7 @@ class ShowResults(AbstractWindow):
     def _optimize_events(self, result=None):
         if result is not None:
             if result['Apply to'] == 'All traces':
-                trace = self.data.active_trace
-                for i in range(self.data.n_traces):
-                    self.data.set_active(i)
-                    Events(self.data).optimise_events(function=result['Event optimisation'])
-                self.data.set_active(trace)
+                Events(self.data, all_traces=True).optimise_events(function=result['Event optimisation'])
             else:
                 Events(self.data).optimise_events(function=result['Event optimisation'])
 
@@ -122,10 +118,20 @@ class ShowResults(AbstractWindow):
     def show_event(self, table_idx, row_idx):
         tables = self.database.get_tables()
         table_name = tables[table_idx]
-        trace_events = self.database.get_sample(table_name=table_name, field_name='*')
+        fields = self.database.get_field(table_name=table_name)
+        # Only the clicked sample, the whole columns are loaded where the histograms need them
+        page = self.database.get_page(table_name=table_name, offset=row_idx, limit=1)
+        if not page:
+            return
+        if page[0][fields.index('Method')] == "Threshold":
+            # The baseline after the event is in the next sample
+            page += self.database.get_page(table_name=table_name, offset=row_idx + 1, limit=1)
         data = {}
-        for c, field_name in enumerate(self.database.get_fields(table_names=[table_name])[0]):
-            data[field_name] = [i[c] for i in trace_events]
+        for c, field_name in enumerate(fields):
+            data[field_name] = [i[c] for i in page]
+        row_idx = 0
+        if data['Method'][0] == "Threshold":
+            data.update(self.database.get_columns(table_name=table_name, fields=['Ires', 'Dwell_time']))
         if data['Method'][row_idx] == "Threshold":
             x_data = [float(data['baseline_start'][row_idx]), float(data['baseline_end'][row_idx])]
             y_data = [float(data['baseline_current'][row_idx])*10**-12] * 2
@@ -139,7 +145,7 @@ class ShowResults(AbstractWindow):
 
             start, end = tuple(data['Event_index'][row_idx].split(';'))
             y = np.array(self.data[int(data['Trace'][row_idx])][int(start):int(end)])*10**-12
-            x = np.linspace(int(start) * self.data.sampling_period, int(end) * self.data.sampling_period, len(y))
+            x = np.asarray(TimeAxis(int(start) * self.data.sampling_period, self.data.sampling_period, len(y)))
             y_fit = self._get_event(x, row_idx, data)
 
             x_bins = np.linspace(0, 100, 201)
@@ -232,16 +238,19 @@ class ShowResults(AbstractWindow):
                 # print(np.sum(np.array(y_data)*Ires)/np.sum(np.array(y_data)))
 
 
+                columns = self.database.get_columns(table_name=table_name, fields=[
+                    'Dwell_time', 'Localisation', 'Fitting_parameters', 'Fs_event', 'Amplitude_block', 'Open_current'])
+
                 y_data_SD = []
-                for i in range(len(data['Trace'])):
-                    dwt = float(data['Dwell_time'][i]) * 5
-                    local = float(data['Localisation'][i])
+                for i in range(len(columns['Dwell_time'])):
+                    dwt = float(columns['Dwell_time'][i]) * 5
+                    local = float(columns['Localisation'][i])
                     start = int((local - dwt) * self.data.sampling_frequency)
                     end = int((local + dwt) * self.data.sampling_frequency)
                     y = np.array(self.data[int(data['Trace'][row_idx])][int(start):int(end)]) * 10 ** -12
                     x = np.linspace(int(start) * self.data.sampling_period, int(end) * self.data.sampling_period,
                                     len(y))
-                    popt = ast.literal_eval(data['Fitting_parameters'][i])
+                    popt = ast.literal_eval(columns['Fitting_parameters'][i])
                     fit = gNDF(popt=popt)
                     y_fit = fit.get_fit(x)*10**-12
                     y_res = np.sqrt((y - y_fit) ** 2)
@@ -252,10 +261,10 @@ class ShowResults(AbstractWindow):
                     except ZeroDivisionError:
                         y_data_SD.append(0)
 
-                idx = np.where(np.array(data['Fs_event']) < 10000)
+                idx = np.where(columns['Fs_event'] < 10000)
 
                 self.widgets.add_chart_data(self.chart_freq, x_data=100 - (
-                            100 * np.array(data['Amplitude_block'])[idx] / abs(np.array(data['Open_current'])[idx])),
+                            100 * columns['Amplitude_block'][idx] / abs(columns['Open_current'][idx])),
                                             y_data=np.array(y_data_SD)[idx], hex_color="#cf081f",
                                             x_range=(0, 100), symbol='x', y_range=(0, max(y_data_SD)),
                                             x_name="Residual current", x_unit="%", y_name="MSE", y_unit="A",
@@ -268,7 +277,7 @@ class ShowResults(AbstractWindow):
                 '''
 
                 y = np.array(self.data[int(data['Trace'][row_idx])][int(start):int(end)]) * 10 ** -12
-                x = np.linspace(int(start) * self.data.sampling_period, int(end) * self.data.sampling_period, len(y))
+                x = np.asarray(TimeAxis(int(start) * self.data.sampling_period, self.data.sampling_period, len(y)))
 
                 popt = ast.literal_eval(data['Fitting_parameters'][row_idx])
                 fit = gNDF(popt=popt)
@@ -278,21 +287,21 @@ class ShowResults(AbstractWindow):
                 min_y = min(y_fit) - abs(max(y_fit) - min(y_fit)) * 0.5
                 max_y = min(y_fit) + abs(max(y_fit) - min(y_fit)) * 1.5
 
-                idx = np.where(np.array(data['Fs_event']) < self.data.sampling_frequency)
+                idx = np.where(columns['Fs_event'] < self.data.sampling_frequency)
 
                 x_bins = np.linspace(0, 100, 201)
-                y_data, x_data = np.histogram(100-(100*np.array(data['Amplitude_block'])[idx]/abs(np.array(data['Open_current'])[idx])), bins=x_bins)
+                y_data, x_data = np.histogram(100-(100*columns['Amplitude_block'][idx]/abs(columns['Open_current'][idx])), bins=x_bins)
 
                 self.widgets.add_chart_data(self.chart_Ires_hist, x_data=x_data,
                                             y_data=y_data, hex_color="#cf081f",
                                             x_name="Residual current", x_unit="%", y_name="Counts", y_unit="Arb. Units",
                                             reset=True)
 
-                idx = np.where(np.array(data['Fs_event']) < 10000)
+                idx = np.where(columns['Fs_event'] < 10000)
 
                 x_bins = np.linspace(0, 100, 201)
                 y_data, x_data = np.histogram(
-                    100 - (100 * np.array(data['Amplitude_block'])[idx] / abs(np.array(data['Open_current'])[idx])),
+                    100 - (100 * columns['Amplitude_block'][idx] / abs(columns['Open_current'][idx])),
                     bins=x_bins)
 
                 self.widgets.add_chart_data(self.chart_Ires_hist, x_data=x_data,
@@ -301,15 +310,15 @@ class ShowResults(AbstractWindow):
                                             reset=False)
 
                 y_data, x_data = np.histogram(
-                    100 - (100 * np.array(data['Amplitude_block']) / abs(np.array(data['Open_current']))),
+                    100 - (100 * columns['Amplitude_block'] / abs(columns['Open_current'])),
                     bins=x_bins)
                 self.widgets.add_chart_data(self.chart_Ires_hist, x_data=x_data,
                                             y_data=y_data, hex_color="#3333cc",
                                             x_name="Residual current", x_unit="%", y_name="Counts", y_unit="Arb. Units",
                                             reset=False)
 
-                self.widgets.add_chart_data(self.chart_Ires_dwt, x_data=100-(100*np.array(data['Amplitude_block'])[idx]/abs(np.array(data['Open_current'])[idx])),
-                                            y_data=np.array(data['Dwell_time'])[idx], hex_color="#cf081f",
+                self.widgets.add_chart_data(self.chart_Ires_dwt, x_data=100-(100*columns['Amplitude_block'][idx]/abs(columns['Open_current'][idx])),
+                                            y_data=columns['Dwell_time'][idx], hex_color="#cf081f",
                                             x_range=(0, 100), symbol='x', y_range=(1e-4, 1),
                                             x_name="Residual current", x_unit="%", y_name="Time", y_unit="s",
                                             reset=True)
@@ -31,7 +31,7 @@ class AbstractWindow(Widgets):
     run
         This function is called upon start and should be redefined to add elements
     close
-        Invoke to close the window
+        Invoke to close the window and its database
     """
 
     def __init__(self, obj: object, title='') -> None:
@@ -73,8 +73,11 @@ class AbstractWindow(Widgets):
         self.widgets.set_content(self.win)
 
     def close(self):
-        """Method to close the window
+        """Method to close the window, and the connection to its database if it has one
         """
         #  TODO: Check this function
+        database = getattr(self, 'database', None)
+        if database is not None:
+            database.close()
         self.win.close()
 
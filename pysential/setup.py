@@ -22,5 +22,6 @@ setup(
         'pyautogui',
         'Pillow',
         'opencv-python',
+        'ResultSQL',
     ],
 )
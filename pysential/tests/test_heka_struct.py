@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+The NumPy record decoder (heka_struct) against the struct.unpack reader it replaced
+"""
+import collections
+import importlib.util
+import os
+import struct
+import types
+import numpy as np
+import pytest
+
+# Loaded from its file, the electrophys_module package also imports the Qt modules and HoleyPy
+_spec = importlib.util.spec_from_file_location(
+    'heka_struct', os.path.join(os.path.dirname(__file__), '..', 'electrophys_module', 'heka_struct.py'))
+heka_struct = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(heka_struct)
+Struct, StructArray, TreeFile, cstr = heka_struct.Struct, heka_struct.StructArray, heka_struct.TreeFile, heka_struct.cstr
+
+
+class LeafRecord(heka_struct.TreeNode):
+    field_info = [
+        ('Mark', 'i'),
+        ('Label', '32s', cstr),
+        ('Kind', 'h'),
+        ('Filler1', 'h', None),
+        ('Mode', 'c'),
+        ('Valid', '?'),
+        ('Signed', 'b'),
+        ('Flags', '32c'),
+        ('Scaler', 'd'),
+        ('Markers', '4d'),
+        ('Params', '32i'),
+        ('Raw', '5s'),
+    ]
+
+
+class MiddleRecord(heka_struct.TreeNode):
+    field_info = [
+        ('Mark', 'i'),
+        ('Label', '32s', cstr),
+        ('Time', 'd'),
+        ('UserParams', '10d'),
+        ('Count', 'i'),
+        ('Filler1', 'i', None),
+    ]
+
+
+class FixtureTree(TreeFile):
+    field_info = [
+        ('Version', 'i'),
+        ('Signature', '8s', cstr),
+        ('Header', heka_struct.BundleItem.array(2)),
+        ('Comment', '80s', cstr),
+    ]
+    rectypes = [None, MiddleRecord, LeafRecord]
+
+
+def _reference_unpack(cls, data, endian):
+    """Fields of *data* as the previous Struct decoded them, with struct.unpack"""
+    fmt = ''
+    field_info = []
+    for items in cls.field_info:
+        name, ifmt, func = items if len(items) == 3 else tuple(items) + (True,)
+        if isinstance(ifmt, type) and issubclass(ifmt, Struct):
+            func = (ifmt, func)
+            ifmt = '%ds' % ifmt.size()
+        field_info.append((name, ifmt, func))
+        fmt += ifmt
+    items = struct.unpack(endian + fmt, data)
+
+    fields = collections.OrderedDict()
+    i = 0
+    for name, fmt, func in field_info:
+        if len(fmt) == 1 or fmt[-1] == 's':
+            item = items[i]
+            i += 1
+        else:
+            n = int(fmt[:-1])
+            item = items[i:i + n]
+            i += n
+        if isinstance(func, tuple):
+            substr, func = func
+            if issubclass(substr, StructArray):
+                size = substr.item_struct.size()
+                item = [_reference_unpack(substr.item_struct, item[k * size:(k + 1) * size], endian)
+                        for k in range(substr.array_size)]
+            else:
+                item = _reference_unpack(substr, item, endian)
+        if func is None:
+            continue
+        if func is not True:
+            item = func(item)
+        fields[name] = item
+    return fields
+
+
+def _reference_tree(data, position, level, level_sizes, rectypes, endian):
+    """(fields, children) of the record at *position*, read like the previous TreeNode"""
+    size = rectypes[level].size()
+    record = data[position:position + level_sizes[level]]
+    record = record + b'\0' * (size - len(record)) if len(record) < size else record[:size]
+    position += level_sizes[level]
+    n_child = struct.unpack_from(endian + 'i', data, position)[0]
+    position += 4
+    children = []
+    if level + 1 < len(rectypes):
+        for _ in range(n_child):
+            child, position = _reference_tree(data, position, level + 1, level_sizes, rectypes, endian)
+            children.append(child)
+    return (_reference_unpack(rectypes[level], record, endian), children), position
+
+
+def _tree(node):
+    return node.get_fields(), [_tree(child) for child in node.children]
+
+
+def _typed(value):
+    """*value* with every leaf replaced by its type and repr, so that NaN equals NaN"""
+    if isinstance(value, dict):
+        return [(name, _typed(item)) for name, item in value.items()]
+    if isinstance(value, (list, tuple)):
+        return [type(value).__name__] + [_typed(item) for item in value]
+    return type(value).__name__, repr(value)
+
+
+def _fixture(rng, endian, level_sizes):
+    """Bytes of a random tree file, every record followed by its number of children"""
+    magic = b'eerT' if endian == '<' else b'Tree'
+    data = [magic, struct.pack(endian + 'i', len(level_sizes)), struct.pack(endian + '%di' % len(level_sizes), *level_sizes)]
+
+    def record(level):
+        leaf = level == len(level_sizes) - 1
+        n_child = 0 if leaf else int(rng.integers(0, 6))
+        data.append(rng.integers(0, 256, level_sizes[level], dtype=np.uint8).tobytes())
+        data.append(struct.pack(endian + 'i', n_child))
+        for _ in range(n_child):
+            record(level + 1)
+
+    record(0)
+    return b''.join(data)
+
+
+@pytest.mark.parametrize('endian', ['<', '>'])
+@pytest.mark.parametrize('padding', [0, -7, 13])
+def test_tree_matches_struct_reader(tmp_path, endian, padding):
+    """Every field of every node, with records shorter or longer in the file than the layout"""
+    rng = np.random.default_rng(9)
+    rectypes = [FixtureTree] + FixtureTree.rectypes[1:]
+    level_sizes = [rectype.size() + padding for rectype in rectypes]
+    data = _fixture(rng, endian, level_sizes)
+    file_name = tmp_path / 'fixture.pul'
+    file_name.write_bytes(data)
+
+    tree = FixtureTree(types.SimpleNamespace(file_name=str(file_name)))
+    reference, end = _reference_tree(data, 8 + 4 * len(level_sizes), 0, level_sizes, rectypes, endian)
+
+    assert end == len(data)
+    assert sum(len(child[1]) for child in reference[1])
+    assert _typed(_tree(tree)) == _typed(reference)
+
+
+def test_struct_matches_struct_reader():
+    rng = np.random.default_rng(3)
+    for endian in '<>':
+        data = rng.integers(0, 256, heka_struct.BundleHeader.size(), dtype=np.uint8).tobytes()
+        assert (_typed(heka_struct.BundleHeader(data, endian).get_fields())
+                == _typed(_reference_unpack(heka_struct.BundleHeader, data, endian)))